@@ -0,0 +1,62 @@
+import logging
+import argparse
+import json
+import platform
+import time
+
+from envs.profiling import benchmark_env
+from envs.telemetry_cache import set_telemetry_cache_budget, DEFAULT_TELEMETRY_CACHE_BYTES
+from envs.utils import get_git_commit
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+parser = argparse.ArgumentParser(description='Benchmark NNESchedulingEnv: steps/sec and per-phase step/reset times')
+parser.add_argument('--num_nodes', default='4,8,16,32,64,128,180', help='Comma-separated cluster sizes')
+parser.add_argument('--factors', default='1,4,8,12', help='Comma-separated request size factors')
+parser.add_argument('--arrival_rates', default='100', help='Comma-separated arrival rates (arrival_rate_r)')
+parser.add_argument('--steps', default=1000, help='Steps per configuration')
+parser.add_argument('--episode_length', default=100, help='Steps per episode')
+parser.add_argument('--path_csv_files', default='data/train/v1/nodes/', help='Telemetry traces of the nodes')
+parser.add_argument('--seed', default=1, help='Seed of the envs and of the random policy')
+parser.add_argument('--telemetry_cache_mb', default=DEFAULT_TELEMETRY_CACHE_BYTES // 2 ** 20,
+                    help='Memory budget (MB) of the node telemetry cache shared by the envs, 0 disables it')
+parser.add_argument('--prefetch_traces', default=False, action="store_true",
+                    help='Prepare the traces of the next episode in the background (see NNESchedulingEnv)')
+parser.add_argument('--stream_traces', default=False, action="store_true",
+                    help='Stream the traces chunk by chunk, e.g., for an --episode_length longer than the files')
+parser.add_argument('--output', default=None, help='If set, writes the results (JSON) to this path')
+
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    set_telemetry_cache_budget(int(args.telemetry_cache_mb) * 2 ** 20)
+    results = []
+    for num_nodes in [int(n) for n in args.num_nodes.split(',')]:
+        for factor in [float(f) for f in args.factors.split(',')]:
+            for arrival_rate in [float(a) for a in args.arrival_rates.split(',')]:
+                result = benchmark_env(num_nodes, factor, arrival_rate, n_steps=int(args.steps), seed=int(args.seed),
+                                       episode_length=int(args.episode_length), path_csv_files=args.path_csv_files,
+                                       file_results_name="benchmark_env_results",
+                                       prefetch_traces=args.prefetch_traces, stream_traces=args.stream_traces)
+                phases = result["phases"]
+                logging.info("[Benchmark] num_nodes: {} | factor: {} | arrival_rate: {} | steps/sec: {:.1f} | "
+                             "step p50: {:.1f} us | reset mean: {:.1f} ms | cache hit rate: {:.2f}".format(
+                                 num_nodes, factor, arrival_rate, result["steps_per_sec"],
+                                 phases["step"]["p50_us"], phases["reset"]["mean_us"] / 1e3,
+                                 result["telemetry_cache"]["hit_rate"]))
+                results.append(result)
+
+    report = {
+        "commit": get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "steps": int(args.steps),
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,48 @@
+import logging
+import argparse
+
+from envs.scalability import run_scalability_suite, save_results, plot_scalability, DEFAULT_NUM_NODES, \
+    DEFAULT_GRAPHS_PATH, GREEDY_POLICIES
+from envs.utils import get_git_commit
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+parser = argparse.ArgumentParser(description='Scalability benchmark: env throughput, decision latency, peak RSS '
+                                             'and episode quality per policy and cluster size')
+parser.add_argument('--policies', default=','.join(GREEDY_POLICIES),
+                    help='Comma-separated policies: greedy baselines and/or <alg>:<load_path>[:<name>], '
+                         'alg in ["mask_ppo", "ppo_deepsets", "dqn_deepsets"]')
+parser.add_argument('--num_nodes', default=','.join(str(n) for n in DEFAULT_NUM_NODES),
+                    help='Comma-separated cluster sizes')
+parser.add_argument('--episodes', default=10, help='Episodes per (policy, num_nodes) point')
+parser.add_argument('--episode_length', default=100, help='Steps per episode')
+parser.add_argument('--reward', default='multi', help='reward: ["naive", "multi"]')
+parser.add_argument('--path_csv_files', default='data/train/v1/nodes/', help='Telemetry traces of the nodes')
+parser.add_argument('--results', default='results/cnsm2024/scalability.json', help='Structured results file')
+parser.add_argument('--graphs', default=DEFAULT_GRAPHS_PATH, help='Output directory of the graphs')
+parser.add_argument('--plot_only', default=False, action="store_true",
+                    help='Only render the graphs from an existing results file')
+
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    if not args.plot_only:
+        config = {
+            "policies": args.policies.split(','),
+            "num_nodes": [int(n) for n in args.num_nodes.split(',')],
+            "episodes": int(args.episodes),
+            "episode_length": int(args.episode_length),
+            "reward_function": args.reward,
+            "path_csv_files": args.path_csv_files,
+        }
+        results = run_scalability_suite(config["policies"], config["num_nodes"], n_episodes=config["episodes"],
+                                        episode_length=config["episode_length"],
+                                        reward_function=config["reward_function"],
+                                        path_csv_files=config["path_csv_files"])
+        save_results(args.results, results, config, commit=get_git_commit())
+        logging.info("[Scalability] Results saved to {}".format(args.results))
+
+    for file in plot_scalability(args.results, args.graphs):
+        logging.info("[Scalability] Graph saved to {}".format(file))
@@ -0,0 +1,212 @@
+import multiprocessing
+import queue
+import random
+from copy import deepcopy
+from typing import Callable, List, Optional
+import gym
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch import nn
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+from envs.vec_env import get_action_mask_size
+from envs.deep_sets_agent_original import HUGE_NEG
+
+# Keys of the (num_steps + 1, ...) / (num_steps, ...) tensors in a PPO trajectory
+ROLLOUT_KEYS = ("obs", "masks", "dones", "actions", "logprobs", "values", "rewards")
+
+# Keys of the (num_steps, ...) tensors in a DQN trajectory
+TRANSITION_KEYS = ("obs", "next_obs", "actions", "rewards", "dones")
+
+
+class _EpisodeTracker:
+    """Keeps the running return of the actor's env, since actors do not go through VecMonitor."""
+
+    def __init__(self):
+        self.current = 0.0
+        self.finished = []
+
+    def add(self, reward: float, done: bool) -> None:
+        self.current += reward
+        if done:
+            self.finished.append(self.current)
+            self.current = 0.0
+
+    def pop(self) -> List[float]:
+        finished, self.finished = self.finished, []
+        return finished
+
+
+def collect_ppo_rollout(agent: nn.Module, env: gym.Env, state: dict, num_steps: int, epsilon: float) -> dict:
+    """Collects num_steps on-policy steps with the DeepSetAgent, in the storage layout of PPO_DeepSets."""
+    obs_shape = env.observation_space.shape
+    trajectory = {
+        "obs": torch.zeros((num_steps + 1,) + obs_shape),
+        "masks": torch.zeros((num_steps + 1, get_action_mask_size(env.action_space)), dtype=torch.bool),
+        "dones": torch.zeros(num_steps + 1),
+        "actions": torch.zeros((num_steps,) + env.action_space.shape),
+        "logprobs": torch.zeros(num_steps),
+        "values": torch.zeros(num_steps),
+        "rewards": torch.zeros(num_steps),
+    }
+    trajectory["obs"][0].copy_(torch.from_numpy(state["obs"]))
+    trajectory["masks"][0].copy_(torch.from_numpy(state["masks"]))
+    trajectory["dones"][0] = float(state["done"])
+
+    for step in range(num_steps):
+        with torch.no_grad():
+            # Padded sets: as in PPO_DeepSets.learn, padding elements must never be sampled
+            masks = trajectory["masks"][step].unsqueeze(0) if getattr(agent, "padded", False) else None
+            action, logprob, _, value = agent.get_action_and_value(trajectory["obs"][step].unsqueeze(0),
+                                                                   masks=masks)
+        action = action.squeeze(0)
+        trajectory["actions"][step] = action
+        trajectory["logprobs"][step] = logprob
+        trajectory["values"][step] = value.flatten()
+
+        # Discrete actions are scalars, the hierarchical (node, endpoint) actions are pairs
+        obs, reward, done, info = env.step(action.numpy() if action.dim() > 0 else int(action))
+        state["tracker"].add(reward, done)
+        if done:
+            obs = env.reset()
+        trajectory["rewards"][step] = reward
+        trajectory["obs"][step + 1].copy_(torch.from_numpy(obs))
+        trajectory["masks"][step + 1].copy_(torch.from_numpy(env.action_masks()))
+        trajectory["dones"][step + 1] = float(done)
+
+    state["obs"] = obs
+    state["masks"] = trajectory["masks"][-1].numpy()
+    state["done"] = bool(trajectory["dones"][-1])
+    return trajectory
+
+
+def collect_dqn_transitions(q_network: nn.Module, env: gym.Env, state: dict, num_steps: int, epsilon: float) -> dict:
+    """Collects num_steps masked epsilon-greedy transitions with the Q-network, for the replay buffer."""
+    obs_shape = env.observation_space.shape
+    trajectory = {
+        "obs": torch.zeros((num_steps,) + obs_shape),
+        "next_obs": torch.zeros((num_steps,) + obs_shape),
+        "actions": torch.zeros(num_steps, dtype=torch.long),
+        "rewards": torch.zeros(num_steps),
+        "dones": torch.zeros(num_steps),
+    }
+    obs, masks = state["obs"], state["masks"]
+    for step in range(num_steps):
+        trajectory["obs"][step].copy_(torch.from_numpy(obs))
+        if random.random() < epsilon:
+            action = np.random.choice(np.flatnonzero(masks))
+        else:
+            with torch.no_grad():
+                q_values = q_network(trajectory["obs"][step].unsqueeze(0)).squeeze(0)
+            q_values = torch.where(torch.from_numpy(masks), q_values, torch.tensor(HUGE_NEG))
+            action = int(torch.argmax(q_values))
+
+        next_obs, reward, done, info = env.step(action)
+        state["tracker"].add(reward, done)
+        trajectory["actions"][step] = action
+        trajectory["rewards"][step] = reward
+        trajectory["dones"][step] = float(done)
+        trajectory["next_obs"][step].copy_(torch.from_numpy(next_obs))
+
+        obs = env.reset() if done else next_obs
+        masks = env.action_masks()
+
+    state["obs"], state["masks"] = obs, masks
+    return trajectory
+
+
+def _actor(rank: int, env_fn_wrapper: CloudpickleWrapper, shared_agent: nn.Module, lock, version, epsilon,
+           trajectories: mp.Queue, stop_event, collect_fn: Callable, num_steps: int, seed: int) -> None:
+    """Actor process: steps its own env with a local copy of the agent, synced when the learner publishes."""
+    torch.set_num_threads(1)
+    random.seed(seed + rank)
+    np.random.seed(seed + rank)
+    torch.manual_seed(seed + rank)
+
+    env = env_fn_wrapper.var()
+    agent = deepcopy(shared_agent)
+    local_version = -1
+    state = {"obs": env.reset(), "done": False, "tracker": _EpisodeTracker()}
+    state["masks"] = env.action_masks()
+
+    while not stop_event.is_set():
+        if version.value != local_version:
+            with lock:
+                agent.load_state_dict(shared_agent.state_dict())
+                local_version = version.value
+
+        trajectory = collect_fn(agent, env, state, num_steps, epsilon.value)
+        trajectory["policy_version"] = local_version
+        trajectory["episode_returns"] = state["tracker"].pop()
+
+        # Blocks while the learner is behind, but keeps checking whether it should stop
+        while not stop_event.is_set():
+            try:
+                trajectories.put(trajectory, timeout=1.0)
+                break
+            except queue.Full:
+                continue
+    env.close()
+
+
+class AsyncActors:
+    """
+    Actor processes that step their own env (one per env_fn) with a periodically synced copy of the
+    learner's network and push trajectories into a shared-memory queue.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], agent: nn.Module, collect_fn: Callable,
+                 num_steps: int, queue_size: int = 16, seed: int = 1, start_method: Optional[str] = None):
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.ctx = mp.get_context(start_method)
+        self.env_fns = env_fns
+        self.collect_fn = collect_fn
+        self.num_steps = num_steps
+        self.seed = seed
+
+        # Weights published by the learner, shared with the actors
+        self.shared_agent = deepcopy(agent).cpu()
+        self.shared_agent.share_memory()
+        self.lock = self.ctx.Lock()
+        self.version = self.ctx.Value("i", 0)
+        self.epsilon = self.ctx.Value("d", 0.0)
+        self.trajectories = self.ctx.Queue(maxsize=queue_size)
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+
+    def start(self) -> None:
+        for rank, env_fn in enumerate(self.env_fns):
+            args = (rank, CloudpickleWrapper(env_fn), self.shared_agent, self.lock, self.version, self.epsilon,
+                    self.trajectories, self.stop_event, self.collect_fn, self.num_steps, self.seed)
+            process = self.ctx.Process(target=_actor, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def get(self, block: bool = True) -> Optional[dict]:
+        """Returns the next trajectory, or None if block is False and no trajectory is ready."""
+        try:
+            return self.trajectories.get(block=block)
+        except queue.Empty:
+            return None
+
+    def sync(self, agent: nn.Module) -> None:
+        """Publishes the learner's current weights to the actors."""
+        with self.lock:
+            for shared_param, param in zip(self.shared_agent.state_dict().values(), agent.state_dict().values()):
+                shared_param.copy_(param)
+            self.version.value += 1
+
+    def set_epsilon(self, epsilon: float) -> None:
+        self.epsilon.value = epsilon
+
+    def close(self) -> None:
+        self.stop_event.set()
+        # Drain the queue so that actors blocked on put can exit
+        while self.get(block=False) is not None:
+            pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
@@ -0,0 +1,110 @@
+import logging
+import time
+import numpy as np
+import numpy.typing as npt
+from gym import spaces
+from envs.nne_scheduling_env import NNESchedulingEnv, NUM_METRICS_NODES, NUM_METRICS_REQUEST, MIN_OBS, MAX_OBS, \
+    FULL_THRESHOLD
+
+
+class BatchAdmissionEnv(NNESchedulingEnv):
+    """
+    NNESchedulingEnv where each step carries a burst of requests_per_step (K) pending requests.
+    Observation: the endpoint metrics conditioned on the whole (K, NUM_METRICS_REQUEST) request block, flattened
+    on every row: (total_number + 1, NUM_METRICS_NODES + K * NUM_METRICS_REQUEST). K = 1 is the NNESchedulingEnv
+    layout. Action: MultiDiscrete([total_number + 1] * K), one endpoint (or reject) per request. The placements are
+    applied in request order, each one seeing the allocations of the previous ones; the reward is their sum.
+    action_masks() follows the sb3_contrib MultiDiscrete layout, K blocks of total_number + 1 flags, computed on the
+    allocations at the start of the step. An endpoint filled by an earlier request of the same burst is blocked
+    (and penalized) as an invalid action.
+    episode_length counts steps: the network values advance once per burst.
+    """
+
+    def __init__(self, requests_per_step: int = 4, **kwargs):
+        if requests_per_step < 1:
+            raise ValueError("requests_per_step must be >= 1, got {}".format(requests_per_step))
+        self.requests_per_step = requests_per_step
+        self.pending_requests = []
+        self.pending_dt = []
+        self.ep_offered_requests = 0
+        super().__init__(**kwargs)
+
+        self.observation_space = spaces.Box(low=MIN_OBS, high=MAX_OBS,
+                                            shape=(self.total_number + 1,
+                                                   NUM_METRICS_NODES + requests_per_step * NUM_METRICS_REQUEST),
+                                            dtype=np.float32)
+        self.action_space = spaces.MultiDiscrete([self.num_actions] * requests_per_step)
+        logging.info("[Init] Batch admission: {} requests per step | Action Space: {} | Observation Space: {}".format(
+            requests_per_step, self.action_space, self.observation_space))
+        self.next_batch()
+
+    def next_batch(self) -> None:
+        self.pending_requests, self.pending_dt = [], []
+        for _ in range(self.requests_per_step):
+            self.next_request()
+            self.pending_requests.append(self.deployment_request)
+            self.pending_dt.append(self.dt)
+
+    def request_block(self) -> npt.NDArray:
+        """(K, NUM_METRICS_REQUEST) features of the pending requests, in the NNESchedulingEnv column order."""
+        return np.array([[r.cpu_request, r.memory_request, r.latency_threshold, dt]
+                         for r, dt in zip(self.pending_requests, self.pending_dt)])
+
+    def get_state(self):
+        observation = super().get_state()[:, :NUM_METRICS_NODES]
+        requests = np.tile(self.request_block().reshape(1, -1), (self.total_number + 1, 1))
+        return np.concatenate([observation, requests], axis=1)
+
+    def reset(self):
+        self.ep_offered_requests = 0
+        return super().reset()
+
+    def step(self, action):
+        if self.current_step == 1:
+            self.time_start = time.time()
+
+        action = np.asarray(action, dtype=np.int64).reshape(self.requests_per_step)
+        self.current_step += 1
+        if self.current_step == self.episode_length:
+            self.episode_over = True
+
+        # Sequential placement: each request sees the allocations of the previous ones
+        reward = 0.0
+        accepted = self.ep_accepted_requests
+        for request, dt, a in zip(self.pending_requests, self.pending_dt, action):
+            self.deployment_request, self.dt = request, dt
+            self.offered_requests += 1
+            self.ep_offered_requests += 1
+            self.place_request(int(a))
+            reward += self.get_reward()
+        accepted = self.ep_accepted_requests - accepted
+        self.total_reward += reward
+
+        logging.info('[Step {}] | Actions: {} | Accepted: {} | Reward: {} | Total Reward: {}'.format(
+            self.current_step, action, accepted, reward, self.total_reward))
+
+        self.next_batch()
+        self.update_network_values()
+        ob = self.get_state()
+
+        self.block_prob = 1 - (self.accepted_requests / self.offered_requests)
+        self.ep_block_prob = 1 - (self.ep_accepted_requests / self.ep_offered_requests)
+
+        # "action": the number of requests placed during the step
+        self.info = self.get_info(reward, accepted)
+
+        if self.current_step == self.episode_length:
+            self.save_episode_results()
+
+        return np.array(ob), reward, self.episode_over, self.info
+
+    def action_masks(self) -> npt.NDArray:
+        # (K, total_number) fullness of every endpoint for every pending request, in one shot
+        cpu = np.array([r.cpu_request for r in self.pending_requests])
+        memory = np.array([r.memory_request for r in self.pending_requests])
+        full = (self.allocated_cpu[None, :] + cpu[:, None] > FULL_THRESHOLD * self.cpu_capacity[None, :]) | \
+               (self.allocated_memory[None, :] + memory[:, None] > FULL_THRESHOLD * self.memory_capacity[None, :])
+
+        valid_actions = np.ones((self.requests_per_step, self.num_actions), dtype=bool)
+        valid_actions[:, :self.total_number] = ~full & np.asarray(self.action_valid, dtype=bool)[None, :]
+        return valid_actions.reshape(-1)
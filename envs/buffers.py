@@ -0,0 +1,310 @@
+from typing import Any, Dict, List, NamedTuple, Union
+import numpy as np
+import numpy.typing as npt
+import torch
+from gym import spaces
+from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+from envs.nne_scheduling_env import NUM_METRICS_NODES
+
+# Columns of the NNE observation (see NNESchedulingEnv.get_state)
+# allocated cpu, allocated memory, rtt, ul, dl, jitter, processing latency: change at every step
+DYNAMIC_COLUMNS = np.array([0, 2, 6, 7, 8, 9, 10])
+# cpu capacity, memory capacity, provider id, interface id: only change at reset
+STATIC_COLUMNS = np.array([1, 3, 4, 5])
+# cpu request, memory request, latency threshold, dt: identical in every row
+REQUEST_COLUMNS = slice(NUM_METRICS_NODES, None)
+# The last row is the "reject" element, filled with -1 for the node metrics
+SENTINEL_VALUE = -1.0
+
+INITIAL_STATIC_CAPACITY = 64
+
+
+class NNEReplayBuffer:
+    """
+    Replay buffer aware of the NNE observation layout, with the same interface as SB3's ReplayBuffer.
+    Only the dynamic per-endpoint columns and the request vector are stored per transition. The episode-static
+    columns are stored once per episode in a reference-counted table, and full observations are rebuilt in
+    batch at sample time. With optimize_memory_usage, next observations are not stored: the next observation
+    of a transition is the observation of the following transition of the same env (as in SB3).
+    """
+
+    def __init__(self, buffer_size: int, observation_space: spaces.Box, action_space: spaces.Discrete,
+                 device: Union[torch.device, str] = "cpu", n_envs: int = 1, optimize_memory_usage: bool = False):
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        self.n_envs = n_envs
+        self.device = device
+        self.optimize_memory_usage = optimize_memory_usage
+        self.obs_shape = observation_space.shape
+        self.num_endpoints = self.obs_shape[0] - 1
+        self.pos = 0
+        self.full = False
+
+        dyn_shape = (self.buffer_size, n_envs, self.num_endpoints, len(DYNAMIC_COLUMNS))
+        req_shape = (self.buffer_size, n_envs, self.obs_shape[1] - NUM_METRICS_NODES)
+        self.dynamic = np.zeros(dyn_shape, dtype=np.float32)
+        self.requests = np.zeros(req_shape, dtype=np.float32)
+        self.static_idx = np.full((self.buffer_size, n_envs), -1, dtype=np.int64)
+        if not optimize_memory_usage:
+            self.next_dynamic = np.zeros(dyn_shape, dtype=np.float32)
+            self.next_requests = np.zeros(req_shape, dtype=np.float32)
+            self.next_static_idx = np.full((self.buffer_size, n_envs), -1, dtype=np.int64)
+
+        self.actions = np.zeros((self.buffer_size, n_envs, 1), dtype=np.int64)
+        self.rewards = np.zeros((self.buffer_size, n_envs), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, n_envs), dtype=np.float32)
+
+        # Episode-static columns, one entry per (env, episode) still referenced by the buffer
+        self.static = np.zeros((INITIAL_STATIC_CAPACITY, self.num_endpoints, len(STATIC_COLUMNS)), dtype=np.float32)
+        self.static_refcount = np.zeros(INITIAL_STATIC_CAPACITY, dtype=np.int64)
+        self.free_static = list(range(INITIAL_STATIC_CAPACITY - 1, -1, -1))
+        self.current_static = [-1] * n_envs
+
+    def size(self) -> int:
+        return self.buffer_size if self.full else self.pos
+
+    def nbytes(self) -> int:
+        arrays = [self.dynamic, self.requests, self.static_idx, self.actions, self.rewards, self.dones, self.static]
+        if not self.optimize_memory_usage:
+            arrays += [self.next_dynamic, self.next_requests, self.next_static_idx]
+        return sum(a.nbytes for a in arrays)
+
+    def _new_static(self, static: npt.NDArray) -> int:
+        if len(self.free_static) == 0:
+            capacity = len(self.static)
+            self.static = np.concatenate([self.static, np.zeros_like(self.static)])
+            self.static_refcount = np.concatenate([self.static_refcount, np.zeros_like(self.static_refcount)])
+            self.free_static = list(range(2 * capacity - 1, capacity - 1, -1))
+        k = self.free_static.pop()
+        self.static[k] = static
+        return k
+
+    def _incref(self, k: int) -> None:
+        self.static_refcount[k] += 1
+
+    def _decref(self, k: int) -> None:
+        if k < 0:
+            return
+        self.static_refcount[k] -= 1
+        if self.static_refcount[k] == 0:
+            self.free_static.append(k)
+
+    def _set_static(self, index: npt.NDArray, pos: int, env: int, k: int) -> None:
+        self._decref(int(index[pos, env]))
+        self._incref(k)
+        index[pos, env] = k
+
+    def _update_current_static(self, obs: npt.NDArray) -> None:
+        # A new episode started if the static columns differ from the ones of the env's current entry
+        for env in range(self.n_envs):
+            static = obs[env, :self.num_endpoints][:, STATIC_COLUMNS]
+            k = self.current_static[env]
+            if k < 0 or not np.array_equal(static, self.static[k]):
+                new_k = self._new_static(static)
+                self._incref(new_k)  # held while it is the env's current entry
+                self._decref(k)
+                self.current_static[env] = new_k
+
+    def add(self, obs: npt.NDArray, next_obs: npt.NDArray, action: npt.NDArray, reward: npt.NDArray,
+            done: npt.NDArray, infos: List[Dict[str, Any]]) -> None:
+        obs = np.asarray(obs, dtype=np.float32)
+        next_obs = np.asarray(next_obs, dtype=np.float32)
+        self._update_current_static(obs)
+
+        self.dynamic[self.pos] = obs[:, :self.num_endpoints, DYNAMIC_COLUMNS]
+        self.requests[self.pos] = obs[:, 0, REQUEST_COLUMNS]
+        for env in range(self.n_envs):
+            self._set_static(self.static_idx, self.pos, env, self.current_static[env])
+
+        # The next observation belongs to the same episode (if done, it is masked out in the TD target)
+        if self.optimize_memory_usage:
+            next_pos = (self.pos + 1) % self.buffer_size
+            self.dynamic[next_pos] = next_obs[:, :self.num_endpoints, DYNAMIC_COLUMNS]
+            self.requests[next_pos] = next_obs[:, 0, REQUEST_COLUMNS]
+            for env in range(self.n_envs):
+                self._set_static(self.static_idx, next_pos, env, self.current_static[env])
+        else:
+            self.next_dynamic[self.pos] = next_obs[:, :self.num_endpoints, DYNAMIC_COLUMNS]
+            self.next_requests[self.pos] = next_obs[:, 0, REQUEST_COLUMNS]
+            for env in range(self.n_envs):
+                self._set_static(self.next_static_idx, self.pos, env, self.current_static[env])
+
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, 1))
+        self.rewards[self.pos] = np.array(reward)
+        self.dones[self.pos] = np.array(done)
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def _rebuild(self, dynamic: npt.NDArray, requests: npt.NDArray, static_idx: npt.NDArray) -> npt.NDArray:
+        """Rebuilds a (batch_size, total_number + 1, 15) batch of observations."""
+        obs = np.empty((len(dynamic),) + self.obs_shape, dtype=np.float32)
+        obs[:, :self.num_endpoints, DYNAMIC_COLUMNS] = dynamic
+        obs[:, :self.num_endpoints, STATIC_COLUMNS] = self.static[static_idx]
+        obs[:, self.num_endpoints, :NUM_METRICS_NODES] = SENTINEL_VALUE
+        obs[:, :, REQUEST_COLUMNS] = requests[:, None, :]
+        return obs
+
+    def sample(self, batch_size: int) -> ReplayBufferSamples:
+        if self.optimize_memory_usage:
+            # Do not sample the element at pos: its next observation has not been stored yet
+            if self.full:
+                batch_inds = (np.random.randint(1, self.buffer_size, size=batch_size) + self.pos) % self.buffer_size
+            else:
+                batch_inds = np.random.randint(0, self.pos, size=batch_size)
+        else:
+            batch_inds = np.random.randint(0, self.size(), size=batch_size)
+        env_inds = np.random.randint(0, high=self.n_envs, size=(batch_size,))
+        return self._get_samples_at(batch_inds, env_inds)
+
+    def _get_samples_at(self, batch_inds: npt.NDArray, env_inds: npt.NDArray) -> ReplayBufferSamples:
+        obs = self._rebuild(self.dynamic[batch_inds, env_inds], self.requests[batch_inds, env_inds],
+                            self.static_idx[batch_inds, env_inds])
+        if self.optimize_memory_usage:
+            next_inds = (batch_inds + 1) % self.buffer_size
+            next_obs = self._rebuild(self.dynamic[next_inds, env_inds], self.requests[next_inds, env_inds],
+                                     self.static_idx[next_inds, env_inds])
+        else:
+            next_obs = self._rebuild(self.next_dynamic[batch_inds, env_inds], self.next_requests[batch_inds, env_inds],
+                                     self.next_static_idx[batch_inds, env_inds])
+
+        return ReplayBufferSamples(
+            torch.as_tensor(obs, device=self.device),
+            torch.as_tensor(self.actions[batch_inds, env_inds], device=self.device),
+            torch.as_tensor(next_obs, device=self.device),
+            torch.as_tensor(self.dones[batch_inds, env_inds].reshape(-1, 1), device=self.device),
+            torch.as_tensor(self.rewards[batch_inds, env_inds].reshape(-1, 1), device=self.device),
+        )
+
+
+class SumTree:
+    """
+    Array-based sum-tree: node i has children 2i and 2i + 1, the root is node 1 and the leaves are stored
+    in [capacity, 2 * capacity). Sampling and updates are O(log n) and vectorized over a batch of leaves.
+    """
+
+    def __init__(self, capacity: int):
+        # Round up to a power of two so that every leaf is at the same depth
+        self.capacity = 1 << max(int(np.ceil(np.log2(max(capacity, 1)))), 0)
+        self.depth = int(np.log2(self.capacity))
+        self.tree = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    def total(self) -> float:
+        return float(self.tree[1])
+
+    def get(self, leaves: npt.NDArray) -> npt.NDArray:
+        return self.tree[leaves + self.capacity]
+
+    def update(self, leaves: npt.NDArray, priorities: npt.NDArray) -> None:
+        nodes = np.asarray(leaves, dtype=np.int64) + self.capacity
+        # For duplicated leaves, the last priority wins (as with sequential updates)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: npt.NDArray) -> npt.NDArray:
+        """Returns, for each value in [0, total), the leaf whose prefix-sum interval contains it."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values = np.where(go_right, values - self.tree[left], values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.capacity
+
+
+class PrioritizedReplayBufferSamples(NamedTuple):
+    observations: torch.Tensor
+    actions: torch.Tensor
+    next_observations: torch.Tensor
+    dones: torch.Tensor
+    rewards: torch.Tensor
+    weights: torch.Tensor
+    indices: npt.NDArray
+
+
+class PrioritizedReplay:
+    """
+    Proportional prioritized experience replay (Schaul et al., 2016), mixed into a replay buffer that
+    implements _get_samples_at(batch_inds, env_inds). Transition (pos, env) is leaf pos * n_envs + env
+    of a sum-tree over priorities |td_error|^alpha; new transitions get the current max priority.
+    """
+
+    def _init_priorities(self, alpha: float, beta: float, epsilon: float) -> None:
+        self.alpha = alpha
+        self.beta = beta
+        self.priority_epsilon = epsilon
+        self.tree = SumTree(self.buffer_size * self.n_envs)
+        self.max_priority = 1.0
+
+    def add(self, obs: npt.NDArray, next_obs: npt.NDArray, action: npt.NDArray, reward: npt.NDArray,
+            done: npt.NDArray, infos: List[Dict[str, Any]]) -> None:
+        pos = self.pos
+        super().add(obs, next_obs, action, reward, done, infos)
+        leaves = pos * self.n_envs + np.arange(self.n_envs)
+        self.tree.update(leaves, np.full(self.n_envs, self.max_priority))
+        if self.optimize_memory_usage:
+            # The next observation of the transitions at the new pos was just overwritten
+            self.tree.update(self.pos * self.n_envs + np.arange(self.n_envs), np.zeros(self.n_envs))
+
+    def sample(self, batch_size: int) -> PrioritizedReplayBufferSamples:
+        # Stratified sampling: one value per equal-mass segment of the total priority
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * (total / batch_size)
+        leaves = self.tree.find(np.minimum(values, np.nextafter(total, 0)))
+        batch_inds, env_inds = np.divmod(leaves, self.n_envs)
+
+        # Importance-sampling weights, normalized by the largest weight of the batch
+        probs = self.tree.get(leaves) / total
+        weights = (self.size() * self.n_envs * probs) ** (-self.beta)
+        weights /= weights.max()
+
+        data = self._get_samples_at(batch_inds, env_inds)
+        return PrioritizedReplayBufferSamples(
+            *data, torch.as_tensor(weights, dtype=torch.float32, device=self.device), leaves
+        )
+
+    def update_priorities(self, indices: npt.NDArray, td_errors: npt.NDArray) -> None:
+        priorities = (np.abs(td_errors) + self.priority_epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+
+class PrioritizedReplayBuffer(PrioritizedReplay, ReplayBuffer):
+    """SB3's ReplayBuffer with proportional prioritization."""
+
+    def __init__(self, buffer_size: int, observation_space: spaces.Box, action_space: spaces.Discrete,
+                 device: Union[torch.device, str] = "cpu", n_envs: int = 1, optimize_memory_usage: bool = False,
+                 alpha: float = 0.6, beta: float = 0.4, epsilon: float = 1e-6):
+        super().__init__(buffer_size, observation_space, action_space, device, n_envs,
+                         optimize_memory_usage=optimize_memory_usage, handle_timeout_termination=False)
+        self._init_priorities(alpha, beta, epsilon)
+
+    def _get_samples_at(self, batch_inds: npt.NDArray, env_inds: npt.NDArray) -> ReplayBufferSamples:
+        if self.optimize_memory_usage:
+            next_obs = self.observations[(batch_inds + 1) % self.buffer_size, env_inds, :]
+        else:
+            next_obs = self.next_observations[batch_inds, env_inds, :]
+        data = (
+            self.observations[batch_inds, env_inds, :],
+            self.actions[batch_inds, env_inds, :],
+            next_obs,
+            self.dones[batch_inds, env_inds].reshape(-1, 1),
+            self.rewards[batch_inds, env_inds].reshape(-1, 1),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class PrioritizedNNEReplayBuffer(PrioritizedReplay, NNEReplayBuffer):
+    """NNEReplayBuffer with proportional prioritization."""
+
+    def __init__(self, buffer_size: int, observation_space: spaces.Box, action_space: spaces.Discrete,
+                 device: Union[torch.device, str] = "cpu", n_envs: int = 1, optimize_memory_usage: bool = False,
+                 alpha: float = 0.6, beta: float = 0.4, epsilon: float = 1e-6):
+        super().__init__(buffer_size, observation_space, action_space, device, n_envs,
+                         optimize_memory_usage=optimize_memory_usage)
+        self._init_priorities(alpha, beta, epsilon)
@@ -4,13 +4,15 @@ import numpy as np
 import torch
 from torch import nn
 from torch.distributions import Categorical
-from envs.deep_sets_agent_original import EquivariantDeepSet
+from envs.deep_sets_agent_original import EquivariantDeepSet, split_validity, HUGE_NEG
 
 
 class DQNDeepSetAgent(nn.Module):
-    def __init__(self, envs: gym.vector.VectorEnv) -> None:
+    def __init__(self, envs: gym.vector.VectorEnv, padded: bool = False) -> None:
         super().__init__()
-        in_channels = envs.observation_space.shape[1]
+        # With padded observations, the last column is the validity flag, not a feature
+        in_channels = envs.observation_space.shape[1] - 1 if padded else envs.observation_space.shape[1]
+        self.in_channels = in_channels
 
         '''
         # Actor outputs pi(a|s)
@@ -23,30 +25,28 @@ class DQNDeepSetAgent(nn.Module):
         self.q_network = EquivariantDeepSet(in_channels)
 
     def forward(self, x: torch.Tensor):
-        return self.q_network(x)
+        x, valid = split_validity(x, self.in_channels)
+        return self.q_network(x, valid)
 
     def get_value(self, x: torch.Tensor):
         return self.critic(x)
 
     def get_action(self, x: torch.Tensor, masks: Optional[torch.Tensor] = None, deterministic: bool = True):
-        logits = self.q_network(x)
+        logits = self(x)
         if masks is not None:
-            HUGE_NEG = torch.tensor(-1e8, dtype=logits.dtype)
-            logits = torch.where(masks, logits, HUGE_NEG)
-        # discrete probability distribution over a set of actions. The logits provide the unnormalized log probabilities for each action.
-        dist = Categorical(logits=logits)
-        # if deterministic is True, return the mode of the Categorical distribution (highest probability, selecting the action with the highest logit value)
+            logits = torch.where(masks, logits, torch.tensor(HUGE_NEG, dtype=logits.dtype))
+        # if deterministic is True, return the action with the highest Q-value (no need to build a distribution)
         if deterministic:
-            return dist.mode
+            return torch.argmax(logits, dim=1)
         # if deterministic is False, return a random sample from the Categorical distribution.
-        return dist.sample()
+        # The logits provide the unnormalized log probabilities for each action.
+        return Categorical(logits=logits).sample()
 
     def get_action_and_value(self, x: torch.Tensor, action: Optional[torch.Tensor],
                              masks: Optional[torch.Tensor] = None):
         logits = self.actor(x)
         if masks is not None:
-            HUGE_NEG = torch.tensor(-1e8, dtype=logits.dtype)
-            logits = torch.where(masks, logits, HUGE_NEG)
+            logits = torch.where(masks, logits, torch.tensor(HUGE_NEG, dtype=logits.dtype))
         dist = Categorical(logits=logits)
         if action is None:
             action = dist.sample()
@@ -0,0 +1,95 @@
+from typing import Optional
+import gym
+import torch
+from torch import nn
+from torch.distributions import Categorical
+from envs.deep_sets_agent_original import EquivariantDeepSet, InvariantDeepSet, HUGE_NEG
+from envs.nne_scheduling_env import NUM_METRICS_NODES
+from envs.wrappers import ENDPOINTS_PER_NODE
+
+
+def _masked(logits: torch.Tensor, masks: Optional[torch.Tensor]) -> torch.Tensor:
+    if masks is None:
+        return logits
+    return torch.where(masks, logits, torch.tensor(HUGE_NEG, dtype=logits.dtype))
+
+
+class HierarchicalDeepSetAgent(nn.Module):
+    """
+    DeepSet agent for the two-level action of HierarchicalNodeAction. The node actor scores the num_nodes + 1
+    node rows (the last one is reject); the endpoint actor then scores the ENDPOINTS_PER_NODE endpoints of the
+    chosen node, so both heads scale with num_nodes instead of num_nodes * ENDPOINTS_PER_NODE.
+    The log-probability (and entropy) of an action is the sum over both levels; reject has no second level.
+    """
+
+    def __init__(self, envs: gym.vector.VectorEnv) -> None:
+        super().__init__()
+        self.num_nodes = envs.observation_space.shape[0] - 1
+        in_channels = envs.observation_space.shape[1]
+        self.node_columns = ENDPOINTS_PER_NODE * NUM_METRICS_NODES
+
+        # Actors output pi(node|s) and pi(endpoint|s, node)
+        self.node_actor = EquivariantDeepSet(in_channels)
+        self.endpoint_actor = EquivariantDeepSet(in_channels - self.node_columns + NUM_METRICS_NODES)
+
+        # Critic outputs V(s)
+        self.critic = InvariantDeepSet(in_channels)
+
+    def split_masks(self, masks: Optional[torch.Tensor]) -> tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """(batch_size, num_nodes + 1 + num_nodes * ENDPOINTS_PER_NODE) -> node and per-node endpoint masks."""
+        if masks is None:
+            return None, None
+        node_masks = masks[:, :self.num_nodes + 1]
+        endpoint_masks = masks[:, self.num_nodes + 1:].reshape(-1, self.num_nodes, ENDPOINTS_PER_NODE)
+        return node_masks, endpoint_masks
+
+    def endpoint_features(self, x: torch.Tensor, node: torch.Tensor) -> torch.Tensor:
+        # x: (batch_size, num_nodes + 1, in_channels), node: (batch_size,) in [0, num_nodes)
+        # return: (batch_size, ENDPOINTS_PER_NODE, NUM_METRICS_NODES + request columns)
+        rows = x[torch.arange(x.shape[0], device=x.device), node]
+        endpoints = rows[:, :self.node_columns].reshape(-1, ENDPOINTS_PER_NODE, NUM_METRICS_NODES)
+        request = rows[:, self.node_columns:].unsqueeze(1).expand(-1, ENDPOINTS_PER_NODE, -1)
+        return torch.cat([endpoints, request], dim=-1)
+
+    def _endpoint_logits(self, x: torch.Tensor, node: torch.Tensor,
+                         endpoint_masks: Optional[torch.Tensor]) -> torch.Tensor:
+        # Reject has no endpoint: any node row will do, its level is ignored
+        node = torch.clamp(node, max=self.num_nodes - 1)
+        logits = self.endpoint_actor(self.endpoint_features(x, node))
+        if endpoint_masks is not None:
+            logits = _masked(logits, endpoint_masks[torch.arange(x.shape[0], device=x.device), node])
+        return logits
+
+    def get_value(self, x: torch.Tensor) -> torch.Tensor:
+        return self.critic(x)
+
+    def get_action(self, x: torch.Tensor, masks: Optional[torch.Tensor] = None, deterministic: bool = True) -> torch.Tensor:
+        node_masks, endpoint_masks = self.split_masks(masks)
+        node_logits = _masked(self.node_actor(x), node_masks)
+        node = torch.argmax(node_logits, dim=1) if deterministic else Categorical(logits=node_logits).sample()
+        endpoint_logits = self._endpoint_logits(x, node, endpoint_masks)
+        if deterministic:
+            endpoint = torch.argmax(endpoint_logits, dim=1)
+        else:
+            endpoint = Categorical(logits=endpoint_logits).sample()
+        endpoint = torch.where(node == self.num_nodes, torch.zeros_like(endpoint), endpoint)
+        return torch.stack([node, endpoint], dim=1)
+
+    def get_action_and_value(
+        self, x: torch.Tensor, action: Optional[torch.Tensor] = None, masks: Optional[torch.Tensor] = None
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        node_masks, endpoint_masks = self.split_masks(masks)
+        node_dist = Categorical(logits=_masked(self.node_actor(x), node_masks))
+        node = node_dist.sample() if action is None else action[:, 0].long()
+        endpoint_dist = Categorical(logits=self._endpoint_logits(x, node, endpoint_masks))
+        reject = node == self.num_nodes
+        if action is None:
+            endpoint = torch.where(reject, torch.zeros_like(node), endpoint_dist.sample())
+            action = torch.stack([node, endpoint], dim=1)
+        else:
+            endpoint = action[:, 1].long()
+
+        keep = (~reject).to(x.dtype)
+        logprob = node_dist.log_prob(node) + keep * endpoint_dist.log_prob(endpoint)
+        entropy = node_dist.entropy() + keep * endpoint_dist.entropy()
+        return action, logprob, entropy, self.critic(x)
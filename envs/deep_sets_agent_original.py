@@ -5,6 +5,9 @@ import torch
 from torch import nn
 from torch.distributions import Categorical
 
+# Score of the masked (invalid) actions
+HUGE_NEG = -1e8
+
 
 def layer_init(layer: nn.Linear, std=np.sqrt(2), bias_const=0.0):
     nn.init.orthogonal_(layer.weight, std)
@@ -53,19 +56,40 @@ class MLPAgent(nn.Module):
         return action, dist.log_prob(action), dist.entropy(), self.critic(x)
 
 
+def split_validity(x: torch.Tensor, in_channels: int) -> tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """
+    Padded observations (see PaddedSetObservation) carry a per-element validity flag in an extra last column.
+    Returns the features and the (batch_size, n_elements) validity mask, or None for dense observations.
+    """
+    if x.shape[-1] == in_channels + 1:
+        return x[..., :in_channels], x[..., in_channels] > 0
+    return x, None
+
+
 class EquivariantLayer(nn.Module):
     def __init__(self, in_channels: int, out_channels: int):
         super().__init__()
         self.Gamma = nn.Linear(in_channels, out_channels, bias=False)
         self.Lambda = nn.Linear(in_channels, out_channels, bias=False)
 
-    def forward(self, x: torch.Tensor):
-        # x: (batch_size, n_elements, in_channels)
+    def forward(self, x: torch.Tensor, mask: Optional[torch.Tensor] = None):
+        # x: (batch_size, n_elements, in_channels), mask: (batch_size, n_elements), True for valid elements
         # return: (batch_size, n_elements)
-        xm, _ = torch.max(x, dim=1, keepdim=True)
+        if mask is not None:
+            # Padding must not win the max pool
+            xm, _ = torch.max(x.masked_fill(~mask.unsqueeze(-1), float("-inf")), dim=1, keepdim=True)
+        else:
+            xm, _ = torch.max(x, dim=1, keepdim=True)
         return self.Lambda(x) - self.Gamma(xm)
 
 
+def _forward_set(net: nn.Sequential, x: torch.Tensor, mask: Optional[torch.Tensor]) -> torch.Tensor:
+    """Runs a Sequential, passing the validity mask to its EquivariantLayers."""
+    for m in net:
+        x = m(x, mask) if isinstance(m, EquivariantLayer) else m(x)
+    return x
+
+
 class EquivariantDeepSet(nn.Module):
     def __init__(self, in_channels: int, hidden_channels: int = 64) -> None:
         super().__init__()
@@ -77,10 +101,10 @@ class EquivariantDeepSet(nn.Module):
             EquivariantLayer(hidden_channels, 1),
         )
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
         # x: (batch_size, n_elements, in_channels)
         # return: (batch_size, n_elements)
-        return torch.squeeze(self.net(x), dim=-1)
+        return torch.squeeze(_forward_set(self.net, x, mask), dim=-1)
 
 
 class InvariantDeepSet(nn.Module):
@@ -99,17 +123,26 @@ class InvariantDeepSet(nn.Module):
             nn.Linear(hidden_channels, 1),
         )
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
         # x: (batch_size, n_elements, in_channels)
         # return: (batch_size, n_elements)
-        x = torch.mean(self.psi(x), dim=1)
+        x = _forward_set(self.psi, x, mask)
+        if mask is not None:
+            # Mean over the valid elements only
+            m = mask.unsqueeze(-1).to(x.dtype)
+            x = torch.sum(x * m, dim=1) / torch.clamp(torch.sum(m, dim=1), min=1.0)
+        else:
+            x = torch.mean(x, dim=1)
         return torch.squeeze(self.rho(x), dim=-1)
 
 
 class DeepSetAgent(nn.Module):
-    def __init__(self, envs: gym.vector.VectorEnv) -> None:
+    def __init__(self, envs: gym.vector.VectorEnv, padded: bool = False) -> None:
         super().__init__()
-        in_channels = envs.observation_space.shape[1]
+        # With padded observations, the last column is the validity flag, not a feature
+        in_channels = envs.observation_space.shape[1] - 1 if padded else envs.observation_space.shape[1]
+        self.in_channels = in_channels
+        self.padded = padded
 
         # Actor outputs pi(a|s)
         self.actor = EquivariantDeepSet(in_channels)
@@ -118,28 +151,29 @@ class DeepSetAgent(nn.Module):
         self.critic = InvariantDeepSet(in_channels)
 
     def get_value(self, x: torch.Tensor) -> torch.Tensor:
-        return self.critic(x)
+        x, valid = split_validity(x, self.in_channels)
+        return self.critic(x, valid)
 
     def get_action(self, x: torch.Tensor, masks: Optional[torch.Tensor] = None, deterministic: bool = True) -> torch.Tensor:
-        logits = self.actor(x)
+        x, valid = split_validity(x, self.in_channels)
+        logits = self.actor(x, valid)
         # masks = None
         if masks is not None:
-            HUGE_NEG = torch.tensor(-1e8, dtype=logits.dtype)
-            logits = torch.where(masks, logits, HUGE_NEG)
-        dist = Categorical(logits=logits)
+            logits = torch.where(masks, logits, torch.tensor(HUGE_NEG, dtype=logits.dtype))
         if deterministic:
-            return dist.mode
-        return dist.sample()
+            # The mode of the distribution, without building it
+            return torch.argmax(logits, dim=1)
+        return Categorical(logits=logits).sample()
 
     def get_action_and_value(
         self, x: torch.Tensor, action: Optional[torch.Tensor] = None, masks: Optional[torch.Tensor] = None
     ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
-        logits = self.actor(x)
+        x, valid = split_validity(x, self.in_channels)
+        logits = self.actor(x, valid)
         # masks = None
         if masks is not None:
-            HUGE_NEG = torch.tensor(-1e8, dtype=logits.dtype)
-            logits = torch.where(masks, logits, HUGE_NEG)
+            logits = torch.where(masks, logits, torch.tensor(HUGE_NEG, dtype=logits.dtype))
         dist = Categorical(logits=logits)
         if action is None:
             action = dist.sample()
-        return action, dist.log_prob(action), dist.entropy(), self.critic(x)
\ No newline at end of file
+        return action, dist.log_prob(action), dist.entropy(), self.critic(x, valid)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import os
+from typing import Callable
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+
+# Data-parallel CPU training: one process per rank on localhost, gradients all-reduced with gloo
+BACKEND = "gloo"
+MASTER_ADDR = "127.0.0.1"
+DEFAULT_MASTER_PORT = 29500
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """Checkpoints and tensorboard logs only come from rank 0."""
+    return get_rank() == 0
+
+
+def broadcast_parameters(model: nn.Module) -> None:
+    """Makes every rank start from the weights of rank 0."""
+    if not is_distributed():
+        return
+    for tensor in model.state_dict().values():
+        dist.broadcast(tensor, src=0)
+
+
+def all_reduce_gradients(model: nn.Module) -> None:
+    """Averages the gradients across ranks, flattened into a single buffer to issue one collective per step."""
+    if not is_distributed():
+        return
+    grads = [p.grad for p in model.parameters() if p.grad is not None]
+    if len(grads) == 0:
+        return
+    flat = torch.cat([g.reshape(-1) for g in grads])
+    dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+    flat /= get_world_size()
+    offset = 0
+    for g in grads:
+        numel = g.numel()
+        g.copy_(flat[offset:offset + numel].view_as(g))
+        offset += numel
+
+
+def all_reduce_mean(value: torch.Tensor) -> torch.Tensor:
+    """Averages a scalar across ranks, e.g., so that all ranks take the same early-stopping decision."""
+    if not is_distributed():
+        return value
+    value = value.detach().clone()
+    dist.all_reduce(value, op=dist.ReduceOp.SUM)
+    return value / get_world_size()
+
+
+class NullWriter:
+    """Stands in for the SummaryWriter on ranks other than 0."""
+
+    def add_scalar(self, *args, **kwargs) -> None:
+        pass
+
+    def add_text(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def _run(rank: int, fn: Callable, world_size: int, master_port: int, args: tuple) -> None:
+    os.environ["MASTER_ADDR"] = MASTER_ADDR
+    os.environ["MASTER_PORT"] = str(master_port)
+    dist.init_process_group(BACKEND, rank=rank, world_size=world_size)
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn: Callable, world_size: int, *args, master_port: int = DEFAULT_MASTER_PORT) -> None:
+    """
+    Runs fn(rank, world_size, *args) in world_size processes with an initialized gloo process group.
+    fn must be picklable (i.e., defined at module level).
+    """
+    mp.spawn(_run, args=(fn, world_size, master_port, args), nprocs=world_size, join=True)
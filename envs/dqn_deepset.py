@@ -7,17 +7,22 @@ import numpy.typing as npt
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from typing import Optional, Union
+from typing import Callable, List, Optional, Union
 from copy import deepcopy
 import torch.nn.functional as F
 from torch.distributions.categorical import Categorical
 from stable_baselines3.common.vec_env.dummy_vec_env import DummyVecEnv
 from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
 from stable_baselines3.common.buffers import ReplayBuffer
-from stable_baselines3.common.utils import safe_mean
 
 from envs.ppo_deepset import Algorithm
+from envs.deep_sets_agent_original import HUGE_NEG
 from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+from envs.vec_env import get_vec_action_masks
+from envs.async_rl import AsyncActors, collect_dqn_transitions
+from envs.buffers import NNEReplayBuffer, PrioritizedReplayBuffer, PrioritizedNNEReplayBuffer
+from envs.metrics import DEFAULT_LOG_INTERVAL
+from envs.distributed import is_main_process, broadcast_parameters, all_reduce_gradients
 
 
 def make_env(env_id, seed, rank):
@@ -64,8 +69,16 @@ class DQN_DeepSets(Algorithm):
             train_frequency=10,
             device: str = "cpu",
             tensorboard_log: str = "results/nne/",
+            compact_replay_buffer: bool = False,
+            optimize_memory_usage: bool = False,
+            prioritized_replay: bool = False,
+            prioritized_replay_alpha: float = 0.6,
+            prioritized_replay_beta0: float = 0.4,
+            prioritized_replay_eps: float = 1e-6,
+            log_interval: int = DEFAULT_LOG_INTERVAL,
+            padded_sets: bool = False,
     ):
-        super().__init__(env, num_envs, num_steps, n_minibatches, tensorboard_log)
+        super().__init__(env, num_envs, num_steps, n_minibatches, tensorboard_log, log_interval)
         self.num_envs = env.num_envs
         self.num_steps = num_steps
         self.seed = seed
@@ -84,16 +97,28 @@ class DQN_DeepSets(Algorithm):
         self.learning_starts = learning_starts
         self.train_frequency = train_frequency
         self.device = device
-
-        random.seed(self.seed)
-        np.random.seed(self.seed)
-        torch.manual_seed(self.seed)
+        self.compact_replay_buffer = compact_replay_buffer
+        self.optimize_memory_usage = optimize_memory_usage
+        self.prioritized_replay = prioritized_replay
+        self.prioritized_replay_alpha = prioritized_replay_alpha
+        self.prioritized_replay_beta0 = prioritized_replay_beta0
+        self.prioritized_replay_eps = prioritized_replay_eps
+        self.padded_sets = padded_sets
+        if self.compact_replay_buffer and self.padded_sets:
+            raise ValueError("The compact replay buffer expects the dense NNE observation layout")
+
+        # Each rank explores its own slice of envs
+        random.seed(self.seed + self.rank)
+        np.random.seed(self.seed + self.rank)
+        torch.manual_seed(self.seed + self.rank)
 
         # TODO: modify it to multibinary
         # assert isinstance(self.env.action_space, gym.spaces.Discrete), "only discrete action space is supported"
 
         # Initialize primary and target DQNDeepSetAgent
-        self.q_network = DQNDeepSetAgent(self.env).to(self.device)
+        # padded_sets: observations padded by PaddedSetObservation (envs with different num_nodes)
+        self.q_network = DQNDeepSetAgent(self.env, padded=self.padded_sets).to(self.device)
+        broadcast_parameters(self.q_network)
         self.target_network = deepcopy(self.q_network)  # Create a deep copy for the target network
         self.optimizer = optim.Adam(self.q_network.parameters(), lr=self.learning_rate)
 
@@ -104,56 +129,65 @@ class DQN_DeepSets(Algorithm):
         self.actions = torch.zeros((self.num_envs,) + self.env.action_space.shape).to(self.device)
 
         # Initialize replay buffer
-        self.rb = ReplayBuffer(
+        self.rb = self.make_replay_buffer(self.num_envs)
+
+    def make_replay_buffer(self, n_envs: int) -> Union[ReplayBuffer, NNEReplayBuffer]:
+        if self.prioritized_replay:
+            buffer_class = PrioritizedNNEReplayBuffer if self.compact_replay_buffer else PrioritizedReplayBuffer
+            return buffer_class(
+                self.buffer_size,
+                self.env.observation_space,
+                self.env.action_space,
+                self.device,
+                n_envs,
+                optimize_memory_usage=self.optimize_memory_usage,
+                alpha=self.prioritized_replay_alpha,
+                beta=self.prioritized_replay_beta0,
+                epsilon=self.prioritized_replay_eps,
+            )
+        if self.compact_replay_buffer:
+            # Stores the episode-static node features once per episode instead of twice per transition
+            return NNEReplayBuffer(
+                self.buffer_size,
+                self.env.observation_space,
+                self.env.action_space,
+                self.device,
+                n_envs,
+                optimize_memory_usage=self.optimize_memory_usage,
+            )
+        return ReplayBuffer(
             self.buffer_size,
             self.env.observation_space,
             self.env.action_space,
             self.device,
-            self.num_envs,
+            n_envs,
+            optimize_memory_usage=self.optimize_memory_usage,
             handle_timeout_termination=False,
         )
 
     def learn(self, total_timesteps: int = 500000):
         start_time = time.time()
         obs = self.env.reset()
-        next_masks = torch.tensor(np.array(self.env.env_method("action_masks")), dtype=torch.bool).to(self.device)
+        next_masks = torch.as_tensor(get_vec_action_masks(self.env), dtype=torch.bool).to(self.device)
         episode_rewards = []
 
         for global_step in range(total_timesteps):
             epsilon = linear_schedule(self.start_e, self.end_e, self.exploration_fraction * total_timesteps,
                                       global_step)
             self.masks = next_masks
+            self.anneal_beta(global_step, total_timesteps)
 
-            if random.random() < epsilon:
-                actions = []
-                for env_mask in self.masks:
-                    valid_actions = np.where(env_mask)[0]
-                    action = np.random.choice(valid_actions)
-                    actions.append(action)
-                self.actions = torch.tensor(actions).to(self.device)
-            else:
-                q_values = self.q_network(torch.Tensor(obs).to(self.device))
-
-                # Masking Q-values of invalid actions
-                HUGE_NEGATIVE = -1e8
-                action_masks_tensor = torch.tensor(self.masks, dtype=torch.bool).to(self.device)
-                q_values = torch.where(action_masks_tensor, q_values, HUGE_NEGATIVE)
-
-                self.actions = torch.argmax(q_values, dim=1)
+            self.actions = self.explore(torch.as_tensor(obs, dtype=torch.float32).to(self.device), self.masks, epsilon)
             # Execute the game and log data
             next_obs, rewards, terminated, infos = self.env.step(self.actions.cpu().numpy())
-            next_masks = torch.tensor(np.array(self.env.env_method("action_masks")), dtype=torch.bool).to(self.device)
+            next_masks = torch.as_tensor(get_vec_action_masks(self.env), dtype=torch.bool).to(self.device)
 
             # Record rewards for plotting purposes
             for item in infos:
                 if "episode" in item.keys():
                     episode_rewards.append(item['episode']['r'])
-                    self.writer.add_scalar("charts/episodic_return", item["episode"]["r"], global_step)
-                    self.writer.add_scalar("charts/episodic_length", item["episode"]["l"], global_step)
-                    self.writer.add_scalar("rollout/ep_rew_mean", safe_mean(episode_rewards), global_step)
-                    print(f"global_step: {global_step}, episodic_return={item['episode']['r']},  "
-                          f"episode_rew_mean={safe_mean(episode_rewards)}")
-                    break
+                    self.metrics.record("charts/episodic_return", item["episode"]["r"])
+                    self.metrics.record("charts/episodic_length", item["episode"]["l"])
 
             # Save data to replay buffer; handle `final_observation`
             real_next_obs = next_obs.copy()
@@ -179,43 +213,132 @@ class DQN_DeepSets(Algorithm):
             # ALGO LOGIC: training
             if global_step > self.learning_starts:
                 if global_step % self.train_frequency == 0:
-                    data = self.rb.sample(self.batch_size)
-                    with torch.no_grad():
-                        target_max, _ = self.target_network(data.next_observations).max(dim=1)
-                        td_target = data.rewards.flatten() + self.gamma * target_max * (1 - data.dones.flatten())
-                    old_val = self.q_network(data.observations).gather(1, data.actions).squeeze()
-                    loss = F.mse_loss(td_target, old_val)
-
-                    '''
-                    if global_step % 100 == 0:
-                        writer.add_scalar("losses/td_loss", loss, global_step)
-                        writer.add_scalar("losses/q_values", old_val.mean().item(), global_step)
-                        print("SPS:", int(global_step / (time.time() - start_time)))
-                        writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
-                    '''
-
-                    # optimize the model
-                    self.optimizer.zero_grad()
-                    loss.backward()
-                    self.optimizer.step()
-
-                    # Update target network
-                    if global_step % self.target_network_frequency == 0:
-                        for target_param, q_param in zip(self.target_network.parameters(), self.q_network.parameters()):
-                            target_param.data.copy_(self.tau * q_param.data + (1.0 - self.tau) * target_param.data)
-
-            # print("FPS:", int(global_step / (time.time() - start_time)))
-            self.writer.add_scalar("charts/learning_rate", self.optimizer.param_groups[0]["lr"],
-                                               global_step)
-            # self.writer.add_scalar("losses/value_loss", v_loss.item(), global_step)
-            # self.writer.add_scalar("losses/policy_loss", pg_loss.item(), global_step)
-            # self.writer.add_scalar("losses/entropy", entropy_loss.item(), global_step)
-            # self.writer.add_scalar("losses/old_approx_kl", old_approx_kl.item(), global_step)
-            # self.writer.add_scalar("losses/approx_kl", approx_kl.item(), global_step)
-            # self.writer.add_scalar("losses/clipfrac", np.mean(clipfracs), global_step)
-            # self.writer.add_scalar("losses/explained_variance", explained_var, global_step)
-            # print("FPS:", int(global_step / (time.time() - start_time)))
-            self.writer.add_scalar("charts/FPS", int(global_step / (time.time() - start_time)), global_step)
+                    self.metrics.record("losses/td_loss", self.train_step(global_step).item())
+
+            self.dump_metrics(global_step, start_time, episode_rewards)
+        self.dump_metrics(global_step, start_time, episode_rewards, force=True)
+
+    def explore(self, obs: torch.Tensor, masks: torch.Tensor, epsilon: float) -> torch.Tensor:
+        """
+        Masked epsilon-greedy for all envs at once: each env explores with its own Bernoulli(epsilon) draw,
+        and random valid actions are drawn with the Gumbel-max trick over the mask.
+        """
+        explore = torch.rand(masks.shape[0], device=masks.device) < epsilon
+        gumbel = -torch.log(-torch.log(torch.rand(masks.shape, device=masks.device)))
+        random_actions = torch.argmax(torch.where(masks, gumbel, torch.tensor(HUGE_NEG, device=masks.device)), dim=1)
+        if bool(explore.all()):
+            return random_actions
+
+        with torch.no_grad():
+            q_values = self.q_network(obs)
+        # Masking Q-values of invalid actions
+        greedy_actions = torch.argmax(torch.where(masks, q_values, torch.tensor(HUGE_NEG, device=masks.device)), dim=1)
+        return torch.where(explore, random_actions, greedy_actions)
+
+    def train_step(self, step: int) -> torch.Tensor:
+        """
+        One gradient step on a batch sampled from the replay buffer, plus the periodic target network update.
+        """
+        data = self.rb.sample(self.batch_size)
+        with torch.no_grad():
+            target_q = self.target_network(data.next_observations)
+            if self.padded_sets:
+                # Padded rows are not elements: the validity flag (last column) keeps them out of the max
+                valid = data.next_observations[:, :, -1] > 0
+                target_q = torch.where(valid, target_q, torch.tensor(float("-inf"), device=target_q.device))
+            target_max, _ = target_q.max(dim=1)
+            td_target = data.rewards.flatten() + self.gamma * target_max * (1 - data.dones.flatten())
+        old_val = self.q_network(data.observations).gather(1, data.actions).squeeze()
+        if self.prioritized_replay:
+            # Importance-weighted TD loss, and the TD errors become the new priorities
+            td_errors = td_target - old_val
+            loss = (data.weights * td_errors.pow(2)).mean()
+            self.rb.update_priorities(data.indices, td_errors.detach().cpu().numpy())
+        else:
+            loss = F.mse_loss(td_target, old_val)
+
+        '''
+        if global_step % 100 == 0:
+            writer.add_scalar("losses/td_loss", loss, global_step)
+            writer.add_scalar("losses/q_values", old_val.mean().item(), global_step)
+            print("SPS:", int(global_step / (time.time() - start_time)))
+            writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
+        '''
+
+        # optimize the model
+        self.optimizer.zero_grad()
+        loss.backward()
+        all_reduce_gradients(self.q_network)
+        self.optimizer.step()
+
+        # Update target network
+        if step % self.target_network_frequency == 0:
+            for target_param, q_param in zip(self.target_network.parameters(), self.q_network.parameters()):
+                target_param.data.copy_(self.tau * q_param.data + (1.0 - self.tau) * target_param.data)
+        return loss
+
+    def anneal_beta(self, global_step: int, total_timesteps: int) -> None:
+        """Anneals the importance-sampling exponent of the prioritized replay from beta0 to 1."""
+        if self.prioritized_replay:
+            fraction = min(global_step / total_timesteps, 1.0)
+            self.rb.beta = self.prioritized_replay_beta0 + fraction * (1.0 - self.prioritized_replay_beta0)
+
+    def learn_async(self, total_timesteps: int, env_fns: List[Callable[[], gym.Env]], queue_size: int = 16,
+                    sync_interval: int = 100) -> None:
+        """
+        Asynchronous actor/learner training: one actor process per env_fn runs masked epsilon-greedy
+        exploration with a copy of the Q-network (synced every sync_interval gradient steps), while this
+        process keeps adding the incoming transitions to the replay buffer and training on it.
+        As in learn(), there is one gradient step per train_frequency env steps received from the actors, so that
+        the replay ratio does not depend on the relative speed of the actors and the learner.
+        """
+        if self.world_size > 1:
+            raise ValueError("Asynchronous actors and data-parallel training cannot be combined")
+        start_time = time.time()
+        episode_rewards = []
+        global_step = 0
+        gradient_step = 0
+
+        # Actors deliver the transitions of a single env at a time
+        self.rb = self.make_replay_buffer(1)
+
+        actors = AsyncActors(env_fns, self.q_network, collect_dqn_transitions, self.num_steps,
+                             queue_size=queue_size, seed=self.seed)
+        actors.set_epsilon(self.start_e)
+        actors.start()
+        try:
+            while global_step < total_timesteps:
+                # Only wait for actors once the gradient steps allowed by the data received so far are done
+                trajectory = actors.get(block=gradient_step >= self.gradient_step_budget(global_step))
+                if trajectory is not None:
+                    for k in range(self.num_steps):
+                        self.rb.add(trajectory["obs"][k:k + 1].numpy(), trajectory["next_obs"][k:k + 1].numpy(),
+                                    trajectory["actions"][k:k + 1].numpy().reshape(-1, 1),
+                                    trajectory["rewards"][k:k + 1].numpy(), trajectory["dones"][k:k + 1].numpy(),
+                                    [{}])
+                    global_step += self.num_steps
+                    self.anneal_beta(global_step, total_timesteps)
+                    actors.set_epsilon(linear_schedule(self.start_e, self.end_e,
+                                                       self.exploration_fraction * total_timesteps, global_step))
+
+                    for r in trajectory["episode_returns"]:
+                        episode_rewards.append(r)
+                        self.metrics.record("charts/episodic_return", r)
+
+                # ALGO LOGIC: training
+                if gradient_step < self.gradient_step_budget(global_step):
+                    gradient_step += 1
+                    self.metrics.record("losses/td_loss", self.train_step(gradient_step).item())
+                    if gradient_step % sync_interval == 0:
+                        actors.sync(self.q_network)
+                self.dump_metrics(global_step, start_time, episode_rewards)
+        finally:
+            actors.close()
+        self.dump_metrics(global_step, start_time, episode_rewards, force=True)
+
+    def gradient_step_budget(self, global_step: int) -> int:
+        """Gradient steps allowed after global_step env steps: one per train_frequency after learning_starts."""
+        return max(global_step - self.learning_starts, 0) // self.train_frequency
 
     def predict(self, obs: npt.NDArray, masks: Optional[npt.NDArray] = None) -> npt.NDArray:
         with torch.no_grad():
@@ -225,7 +348,8 @@ class DQN_DeepSets(Algorithm):
         return action
 
     def save(self, path: str) -> None:
-        torch.save(self.q_network.state_dict(), path)
+        if is_main_process():
+            torch.save(self.q_network.state_dict(), path)
 
     def load(self, path: str) -> None:
         self.q_network.load_state_dict(torch.load(path))
@@ -0,0 +1,95 @@
+import logging
+import time
+from functools import partial
+from typing import Sequence
+import numpy as np
+import numpy.typing as npt
+from envs.nne_scheduling_env import SEED, PATH_CSV_FILES, DEFAULT_NUM_EPISODE_STEPS
+from envs.ppo_deepset import Algorithm
+from envs.vec_env import MaskedSubprocVecEnv, record_vec_decision_latency
+from envs.wrappers import make_env
+
+# Factors used for the scalability experiments
+DEFAULT_FACTORS = [1, 2, 4, 6, 8, 10, 12]
+
+
+def get_factor_file_name(i: int, num_nodes: int, factor: int, seed: int = None) -> str:
+    """Returns the results file name expected by plot_per_factor.py for a given factor (and seed)."""
+    name = str(i) + '_nne_gym_num_nodes_' + str(num_nodes) + '_factor_' + str(factor)
+    if seed is not None:
+        name += '_seed_' + str(seed)
+    return name
+
+
+def predict_actions(model, obs: npt.NDArray, masks: npt.NDArray) -> npt.NDArray:
+    """Batched prediction for both the DeepSets algorithms and the SB3 maskable policies."""
+    if isinstance(model, Algorithm):
+        return model.predict(obs, masks)
+    action, _ = model.predict(obs, action_masks=masks)
+    return action
+
+
+def evaluate_factors(model, num_nodes: int,
+                     factors: Sequence[int] = DEFAULT_FACTORS,
+                     seeds: Sequence[int] = (SEED,),
+                     n_episodes: int = 100,
+                     episode_length: int = DEFAULT_NUM_EPISODE_STEPS,
+                     reward_function: str = 'multi',
+                     path_csv_files: str = PATH_CSV_FILES,
+                     top_k: int = 0,
+                     hierarchical: bool = False,
+                     requests_per_step: int = 1) -> dict:
+    """
+    Evaluates an already loaded model on every (factor, seed) pair concurrently.
+    One env per pair runs in its own worker process, which returns its action masks with the observation,
+    and all observations are batched into a single forward pass per step, so the model is loaded only once.
+    Each env writes its own per-factor CSV, as consumed by plot_per_factor.py.
+    With top_k > 0, the envs observe only their top-k candidate endpoints (see TopKCandidateObservation).
+    With hierarchical, they take (node, endpoint) actions (see HierarchicalNodeAction).
+    With requests_per_step > 1, each step places a burst of requests (see BatchAdmissionEnv).
+    Returns the episode rewards per results file name.
+    """
+    env_fns = []
+    file_names = []
+    for i, f in enumerate(factors):
+        for s in seeds:
+            name = get_factor_file_name(i, num_nodes, f, s if len(seeds) > 1 else None)
+            env_fns.append(partial(make_env, top_k=top_k, hierarchical=hierarchical,
+                                   requests_per_step=requests_per_step, num_nodes=num_nodes,
+                                   arrival_rate_r=100, call_duration_r=1,
+                                   episode_length=episode_length,
+                                   reward_function=reward_function,
+                                   factor=f,
+                                   seed=s,
+                                   path_csv_files=path_csv_files,
+                                   file_results_name=name))
+            file_names.append(name)
+
+    logging.info("[Evaluation] Running {} envs concurrently: {}".format(len(env_fns), file_names))
+    envs = MaskedSubprocVecEnv(env_fns)
+
+    episode_rewards = {name: [] for name in file_names}
+    reward_sum = np.zeros(len(env_fns))
+    obs = envs.reset()
+
+    print("------------Testing -----------------")
+    for e in range(n_episodes):
+        # All envs share the same episode length, so they finish (and auto-reset) together
+        for step in range(episode_length):
+            masks = envs.action_masks()
+            start = time.perf_counter()
+            actions = predict_actions(model, obs, masks)
+            # One batched decision for all the envs: each env records it
+            record_vec_decision_latency(envs, time.perf_counter() - start)
+            obs, rewards, dones, infos = envs.step(actions)
+            reward_sum += rewards
+
+            for k in np.flatnonzero(dones):
+                episode_rewards[file_names[k]].append(float(reward_sum[k]))
+                reward_sum[k] = 0
+
+        print(f"Episode {e} | Mean total reward across envs: "
+              f"{np.mean([r[-1] for r in episode_rewards.values() if len(r) > 0])}")
+
+    envs.close()
+    return episode_rewards
@@ -0,0 +1,172 @@
+import json
+import logging
+from typing import Tuple
+import numpy as np
+import torch
+from torch import nn
+from envs.deep_sets_agent_original import EquivariantLayer, EquivariantDeepSet
+from envs.inference import get_deep_set
+from envs.numpy_policy import NumpyPolicy, HUGE_NEG
+
+ONNX_OPSET = 13
+PARITY_ATOL = 1e-4
+
+# Layers with a NumPy equivalent in NumpyPolicy
+ACTIVATIONS = {nn.ReLU: "relu", nn.ELU: "elu", nn.Tanh: "tanh"}
+
+
+class MaskablePolicyScores(nn.Module):
+    """Action logits of a MaskablePPO policy (flatten extractor, MLP policy net and action net)."""
+
+    def __init__(self, policy: nn.Module):
+        super().__init__()
+        self.flatten = nn.Flatten()
+        self.shared_net = getattr(policy.mlp_extractor, "shared_net", nn.Sequential())
+        self.policy_net = policy.mlp_extractor.policy_net
+        self.action_net = policy.action_net
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.action_net(self.policy_net(self.shared_net(self.flatten(x.float()))))
+
+
+class MaskedPolicy(nn.Module):
+    """Exported graph: (obs, masks) -> (actions, scores), invalid actions being scored HUGE_NEG."""
+
+    def __init__(self, score_net: nn.Module):
+        super().__init__()
+        self.score_net = score_net
+
+    def forward(self, obs: torch.Tensor, masks: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        scores = self.score_net(obs)
+        scores = torch.where(masks, scores, torch.full_like(scores, HUGE_NEG))
+        return torch.argmax(scores, dim=1), scores
+
+
+def get_score_network(model) -> nn.Module:
+    """Network mapping observations to per-action scores, for MaskablePPO and the DeepSets models."""
+    policy = getattr(model, "policy", None)
+    if policy is not None and hasattr(policy, "action_net"):
+        return MaskablePolicyScores(policy)
+    return get_deep_set(model)
+
+
+def get_contract(observation_shape: tuple, num_actions: int) -> dict:
+    """The contract shared by every exported format."""
+    return {
+        "observation_shape": list(observation_shape),
+        "num_actions": int(num_actions),
+        "reject_action": int(num_actions) - 1,
+        "masks": "bool (batch_size, num_actions), True for valid actions (NNESchedulingEnv.action_masks)",
+        "masked_score": HUGE_NEG,
+        "inputs": {"obs": "float32 (batch_size, *observation_shape)", "masks": "bool (batch_size, num_actions)"},
+        "outputs": {"actions": "int64 (batch_size,)", "scores": "float32 (batch_size, num_actions)"},
+    }
+
+
+def _linear_layer(layers: list, arrays: dict, m: nn.Linear) -> None:
+    i = len(layers)
+    layer = {"type": "linear", "weight": "{}_weight".format(i)}
+    arrays[layer["weight"]] = m.weight.detach().cpu().numpy().T
+    if m.bias is not None:
+        layer["bias"] = "{}_bias".format(i)
+        arrays[layer["bias"]] = m.bias.detach().cpu().numpy()
+    layers.append(layer)
+
+
+def _sequential_layers(layers: list, arrays: dict, modules) -> None:
+    for m in modules:
+        i = len(layers)
+        if isinstance(m, EquivariantLayer):
+            layers.append({"type": "equivariant", "lambda": "{}_lambda".format(i), "gamma": "{}_gamma".format(i)})
+            arrays["{}_lambda".format(i)] = m.Lambda.weight.detach().cpu().numpy().T
+            arrays["{}_gamma".format(i)] = m.Gamma.weight.detach().cpu().numpy().T
+        elif isinstance(m, nn.Linear):
+            _linear_layer(layers, arrays, m)
+        elif type(m) in ACTIVATIONS:
+            if isinstance(m, nn.ELU) and m.alpha != 1.0:
+                raise ValueError("Only ELU with alpha=1 can be exported")
+            layers.append({"type": ACTIVATIONS[type(m)]})
+        elif isinstance(m, nn.Sequential):
+            _sequential_layers(layers, arrays, m)
+        else:
+            raise ValueError("Layer cannot be exported to NumPy: {}".format(type(m).__name__))
+
+
+def to_numpy_policy(score_net: nn.Module, observation_shape: tuple, num_actions: int) -> NumpyPolicy:
+    layers, arrays = [], {}
+    if isinstance(score_net, EquivariantDeepSet):
+        _sequential_layers(layers, arrays, score_net.net)
+        layers.append({"type": "squeeze"})
+    elif isinstance(score_net, MaskablePolicyScores):
+        layers.append({"type": "flatten"})
+        _sequential_layers(layers, arrays, [score_net.shared_net, score_net.policy_net, score_net.action_net])
+    else:
+        raise ValueError("Unsupported score network: {}".format(type(score_net).__name__))
+    return NumpyPolicy(layers, arrays, get_contract(observation_shape, num_actions))
+
+
+def export_policy(model, observation_shape: tuple, num_actions: int, path_prefix: str,
+                  onnx: bool = True) -> NumpyPolicy:
+    """
+    Writes <path_prefix>.npz (NumpyPolicy), <path_prefix>.json (mask contract) and, if onnx,
+    <path_prefix>.onnx with inputs (obs, masks) and outputs (actions, scores), batch size being dynamic.
+    """
+    score_net = get_score_network(model).cpu().eval()
+    numpy_policy = to_numpy_policy(score_net, observation_shape, num_actions)
+    numpy_policy.save(path_prefix + ".npz")
+    with open(path_prefix + ".json", "w") as f:
+        json.dump(numpy_policy.contract, f, indent=2)
+
+    if onnx:
+        obs = torch.zeros((1,) + tuple(observation_shape), dtype=torch.float32)
+        masks = torch.ones((1, num_actions), dtype=torch.bool)
+        torch.onnx.export(MaskedPolicy(score_net), (obs, masks), path_prefix + ".onnx",
+                          input_names=["obs", "masks"], output_names=["actions", "scores"],
+                          dynamic_axes={"obs": {0: "batch_size"}, "masks": {0: "batch_size"},
+                                        "actions": {0: "batch_size"}, "scores": {0: "batch_size"}},
+                          opset_version=ONNX_OPSET)
+    logging.info("[Export] Policy exported to {}.*".format(path_prefix))
+    return numpy_policy
+
+
+def random_inputs(observation_shape: tuple, num_actions: int, n_samples: int, seed: int = 0):
+    """Observations in [0, 1) and random masks where the reject action is always valid."""
+    rng = np.random.default_rng(seed)
+    obs = rng.random((n_samples,) + tuple(observation_shape), dtype=np.float32)
+    masks = rng.random((n_samples, num_actions)) < 0.5
+    masks[:, -1] = True
+    return obs, masks
+
+
+def check_parity(model, path_prefix: str, observation_shape: tuple, num_actions: int, n_samples: int = 256,
+                 obs: np.ndarray = None, masks: np.ndarray = None, atol: float = PARITY_ATOL) -> dict:
+    """
+    Compares the exported NumPy (and ONNX, if onnxruntime is installed) policies with the torch model on the
+    given (or random) inputs. Returns the max absolute score difference and the action agreement per format.
+    """
+    if obs is None:
+        obs, masks = random_inputs(observation_shape, num_actions, n_samples)
+    with torch.no_grad():
+        actions, scores = MaskedPolicy(get_score_network(model).cpu().eval())(
+            torch.as_tensor(obs), torch.as_tensor(masks))
+    actions, scores = actions.numpy(), scores.numpy()
+
+    outputs = {}
+    numpy_policy = NumpyPolicy.load(path_prefix + ".npz")
+    outputs["numpy"] = (numpy_policy.predict(obs, masks),
+                        np.where(masks, numpy_policy.scores(obs), HUGE_NEG))
+    try:
+        import onnxruntime
+        session = onnxruntime.InferenceSession(path_prefix + ".onnx", providers=["CPUExecutionProvider"])
+        outputs["onnx"] = tuple(session.run(["actions", "scores"], {"obs": obs, "masks": masks}))
+    except ImportError:
+        logging.info("[Export] onnxruntime is not installed, skipping the ONNX parity check")
+
+    report = {}
+    for name, (a, s) in outputs.items():
+        report[name] = {
+            "max_abs_diff": float(np.max(np.abs(s - scores))),
+            "action_agreement": float(np.mean(a == actions)),
+        }
+        report[name]["ok"] = report[name]["max_abs_diff"] <= atol and report[name]["action_agreement"] == 1.0
+    return report
@@ -0,0 +1,86 @@
+from functools import partial
+from typing import Optional
+import gym
+import gymnasium
+import numpy as np
+import numpy.typing as npt
+from gymnasium import spaces
+from gymnasium.envs.registration import register
+from envs.wrappers import make_env
+
+ENV_ID = "NNEScheduling-v0"
+
+
+def to_gymnasium_space(space: gym.Space) -> gymnasium.Space:
+    """Converts the legacy gym spaces used by the envs of this package."""
+    if isinstance(space, gym.spaces.Box):
+        return spaces.Box(low=space.low, high=space.high, shape=space.shape, dtype=space.dtype)
+    if isinstance(space, gym.spaces.MultiDiscrete):
+        return spaces.MultiDiscrete(space.nvec)
+    if isinstance(space, gym.spaces.Discrete):
+        return spaces.Discrete(space.n)
+    raise ValueError("Unsupported space: {}".format(space))
+
+
+class GymnasiumNNESchedulingEnv(gymnasium.Env):
+    """
+    Gymnasium API on top of an NNESchedulingEnv built by make_env(**kwargs) (so top_k, hierarchical and
+    requests_per_step are supported): reset(seed=...) returns (obs, info) and step returns
+    (obs, reward, terminated, truncated, info). The episode ends on the episode_length horizon, so episodes
+    are truncated, never terminated. reset() hands the Gymnasium np_random to the wrapped env,
+    which draws all its randomness from it (node types, trace files and windows, requests).
+    Observations are float32, as declared by the observation space (required by shared-memory vector envs).
+    """
+
+    metadata = {"render_modes": []}
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        self.env = make_env(**kwargs)
+        self.base = self.env.unwrapped
+        self.observation_space = to_gymnasium_space(self.env.observation_space)
+        self.action_space = to_gymnasium_space(self.env.action_space)
+        self._dtype = self.observation_space.dtype
+
+    def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None) -> tuple[npt.NDArray, dict]:
+        super().reset(seed=seed)
+        # Always shared: without a seed, Gymnasium seeds np_random itself (differently in each sub-env).
+        # Only handed over when it changed, since it also reseeds the traces (and restarts their prefetching)
+        if self.base.np_random is not self.np_random:
+            self.base.set_np_random(self.np_random)
+        obs = self.env.reset()
+        return np.asarray(obs, dtype=self._dtype), {}
+
+    def step(self, action) -> tuple[npt.NDArray, float, bool, bool, dict]:
+        obs, reward, done, info = self.env.step(action)
+        return np.asarray(obs, dtype=self._dtype), float(reward), False, bool(done), info
+
+    def action_masks(self) -> npt.NDArray:
+        return self.env.action_masks()
+
+    def close(self) -> None:
+        self.env.close()
+
+
+def register_envs() -> None:
+    """Registers ENV_ID (kwargs of gymnasium.make are passed to make_env); safe to call more than once."""
+    if ENV_ID not in gymnasium.registry:
+        register(id=ENV_ID, entry_point="envs.gymnasium_env:GymnasiumNNESchedulingEnv")
+
+
+def make_vector_env(num_envs: int, asynchronous: bool = True, shared_memory: bool = True,
+                    **kwargs) -> gymnasium.vector.VectorEnv:
+    """
+    Gymnasium vector env of num_envs registered envs. The async version steps each env in its own process and,
+    with shared_memory, writes the observations into shared memory instead of pickling them.
+    """
+    register_envs()
+    env_fns = [partial(gymnasium.make, ENV_ID, **kwargs) for _ in range(num_envs)]
+    if asynchronous:
+        return gymnasium.vector.AsyncVectorEnv(env_fns, shared_memory=shared_memory)
+    return gymnasium.vector.SyncVectorEnv(env_fns)
+
+
+def get_gymnasium_action_masks(envs: gymnasium.vector.VectorEnv) -> npt.NDArray:
+    """(num_envs, mask_size) action masks of a Gymnasium vector env."""
+    return np.stack(envs.call("action_masks"))
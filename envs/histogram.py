@@ -0,0 +1,63 @@
+from itertools import accumulate
+
+# HDR-style layout: values in ns, linear up to 2 ** SUB_BUCKET_BITS, then each power of two is split into
+# 2 ** (SUB_BUCKET_BITS - 1) linear sub-buckets, hence a relative error below 2 ** -(SUB_BUCKET_BITS - 1) (~1.6%)
+SUB_BUCKET_BITS = 7
+HALF_SUB_BUCKETS = 2 ** (SUB_BUCKET_BITS - 1)
+# Largest value with its own bucket: 2 ** 40 ns (~18 minutes), larger values are clamped
+MAX_VALUE_BITS = 40
+NUM_BUCKETS = (MAX_VALUE_BITS - SUB_BUCKET_BITS + 2) * HALF_SUB_BUCKETS
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * HALF_SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - SUB_BUCKET_BITS
+    return min(exponent * HALF_SUB_BUCKETS + (value >> exponent), NUM_BUCKETS - 1)
+
+
+def _bucket_upper_value(index: int) -> int:
+    if index < 2 * HALF_SUB_BUCKETS:
+        return index
+    exponent = index // HALF_SUB_BUCKETS - 1
+    sub_bucket = index - exponent * HALF_SUB_BUCKETS
+    return ((sub_bucket + 1) << exponent) - 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-size HDR-style latency histogram: record() is O(1) and allocation-free, percentiles are accurate to
+    ~1.6% (relative) from 1 ns to ~18 minutes.
+    """
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[_bucket_index(max(int(seconds * 1e9), 0))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def clear(self) -> None:
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def percentile(self, q: float) -> float:
+        """q-th percentile in seconds (upper bound of its bucket), 0 if empty."""
+        if self.count == 0:
+            return 0.0
+        rank = max(q / 100 * self.count, 1)
+        for index, cumulative in enumerate(accumulate(self.counts)):
+            if cumulative >= rank:
+                return min(_bucket_upper_value(index) / 1e9, self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
@@ -0,0 +1,91 @@
+from typing import Optional, Union
+import torch
+from torch import nn
+from envs.deep_sets_agent_original import EquivariantLayer, EquivariantDeepSet, DeepSetAgent, HUGE_NEG
+from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+
+
+class FusedEquivariantLayer(nn.Module):
+    """
+    Inference version of EquivariantLayer: Lambda(x) - Gamma(max(x)) computed by one matmul for the pooled
+    projection Gamma(max(x)) (one row per set) and one baddbmm that adds Lambda(x) to its negation, without
+    materializing the broadcast. Weights are stored pre-transposed.
+    """
+
+    def __init__(self, layer: EquivariantLayer):
+        super().__init__()
+        self.register_buffer("lambda_t", layer.Lambda.weight.detach().t().contiguous())
+        self.register_buffer("gamma_t", layer.Gamma.weight.detach().t().contiguous())
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        # x: (batch_size, n_elements, in_channels)
+        # return: (batch_size, n_elements, out_channels)
+        xm, _ = torch.max(x, dim=1, keepdim=True)
+        return torch.baddbmm(torch.matmul(xm, self.gamma_t), x, self.lambda_t.expand(x.shape[0], -1, -1),
+                             beta=-1.0)
+
+
+class FusedEquivariantDeepSet(nn.Module):
+    """EquivariantDeepSet with every EquivariantLayer replaced by its fused version."""
+
+    def __init__(self, deep_set: EquivariantDeepSet):
+        super().__init__()
+        self.net = nn.Sequential(*[
+            FusedEquivariantLayer(m) if isinstance(m, EquivariantLayer) else m for m in deep_set.net
+        ])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        # x: (batch_size, n_elements, in_channels)
+        # return: (batch_size, n_elements)
+        return torch.squeeze(self.net(x), dim=-1)
+
+
+class DeepSetPolicy(nn.Module):
+    """
+    Deterministic placement policy for serving: masked argmax over the per-element scores of a trained
+    actor (PPO) or Q-network (DQN). No distribution is built and no critic is evaluated.
+    Scriptable with torch.jit.script.
+    """
+
+    def __init__(self, deep_set: EquivariantDeepSet):
+        super().__init__()
+        self.net = FusedEquivariantDeepSet(deep_set)
+
+    def forward(self, x: torch.Tensor, masks: Optional[torch.Tensor] = None) -> torch.Tensor:
+        # x: (batch_size, n_elements, in_channels), masks: (batch_size, n_elements) bool
+        # return: (batch_size,) actions
+        scores = self.net(x)
+        if masks is not None:
+            scores = scores.masked_fill(~masks, HUGE_NEG)
+        return torch.argmax(scores, dim=1)
+
+
+def get_deep_set(model) -> EquivariantDeepSet:
+    """Returns the network that scores actions, from an agent or from PPO_DeepSets / DQN_DeepSets."""
+    if hasattr(model, "agent"):
+        model = model.agent
+    elif hasattr(model, "q_network") and isinstance(model.q_network, DQNDeepSetAgent):
+        model = model.q_network
+
+    if isinstance(model, DeepSetAgent):
+        return model.actor
+    if isinstance(model, DQNDeepSetAgent):
+        return model.q_network
+    if isinstance(model, EquivariantDeepSet):
+        return model
+    raise ValueError("Unsupported model for the DeepSet inference policy: {}".format(type(model).__name__))
+
+
+def make_inference_policy(model: Union[nn.Module, object]) -> DeepSetPolicy:
+    """Builds the fused deterministic policy of a trained DeepSets model (weights are copied)."""
+    policy = DeepSetPolicy(get_deep_set(model)).cpu()
+    policy.eval()
+    return policy
+
+
+def export_torchscript(model: Union[nn.Module, object], path: str) -> torch.jit.ScriptModule:
+    """Scripts the fused policy and saves it, so that it can be served with torch.jit.load alone."""
+    scripted = torch.jit.script(make_inference_policy(model))
+    scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, path)
+    return scripted
@@ -0,0 +1,66 @@
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+import numpy as np
+
+DEFAULT_LOG_INTERVAL = 1000
+
+
+class MetricsSink:
+    """
+    Buffers the scalars of the training loops and writes them every log_interval steps, aggregated over the
+    window: the mean under the original tag, plus <tag>/min and <tag>/max when several values were recorded.
+    Tensorboard writes and console output happen in a background thread, so the loops only append to lists.
+    """
+
+    def __init__(self, writer, log_interval: int = DEFAULT_LOG_INTERVAL, verbose: bool = True,
+                 max_pending: int = 64):
+        self.writer = writer
+        self.log_interval = log_interval
+        self.verbose = verbose
+        self.window = defaultdict(list)
+        self.last_dump = 0
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, key: str, value: float) -> None:
+        self.window[key].append(float(value))
+
+    def ready(self, step: int) -> bool:
+        """Whether the current window spans log_interval steps."""
+        return step - self.last_dump >= self.log_interval
+
+    def dump(self, step: int) -> None:
+        """Aggregates the current window and hands it over to the background thread."""
+        summary = {}
+        for key, values in self.window.items():
+            values = np.asarray(values)
+            summary[key] = (float(values.mean()), float(values.min()), float(values.max()), len(values))
+        self.window = defaultdict(list)
+        self.last_dump = step
+        if len(summary) > 0:
+            self.pending.put((step, summary))
+
+    def flush(self) -> None:
+        """Blocks until every dumped window has been written."""
+        self.pending.join()
+        self.writer.flush()
+
+    def _write(self, step: int, summary: Dict[str, Tuple[float, float, float, int]]) -> None:
+        for key, (value_mean, value_min, value_max, count) in summary.items():
+            self.writer.add_scalar(key, value_mean, step)
+            if count > 1:
+                self.writer.add_scalar(key + "/min", value_min, step)
+                self.writer.add_scalar(key + "/max", value_max, step)
+        if self.verbose:
+            print(f"global_step: {step}, " + ",  ".join(f"{key}={value[0]:.4g}" for key, value in summary.items()))
+
+    def _flush_loop(self) -> None:
+        while True:
+            step, summary = self.pending.get()
+            try:
+                self._write(step, summary)
+            finally:
+                self.pending.task_done()
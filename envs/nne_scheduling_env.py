@@ -6,15 +6,17 @@ import os
 from datetime import datetime, timedelta
 import heapq
 import time
-import random
 from statistics import mean
 import gym
 import numpy as np
-import pandas as pd
 from gym import spaces
 from gym.utils import seeding
 from envs.utils import DeploymentRequest, get_c2e_deployment_list, save_to_csv, sort_dict_by_value, \
-    calculate_gini_coefficient, normalize
+    calculate_gini_coefficient, normalize, TraceWindow, save_decision_latency_to_csv
+from envs.histogram import LatencyHistogram
+from envs.telemetry_cache import get_telemetry_cache
+from envs.prefetch import BackgroundPrefetcher
+from envs.trace_cursor import TraceCursor, DEFAULT_TRACE_CHUNK_SIZE, scan_trace, read_trace_value
 import logging
 
 # Actions - for printing purposes
@@ -109,6 +111,9 @@ MAX_PKT_LOSS_RATE = 1.0
 MIN_OBS = 0.0
 MAX_OBS = 1000.0
 
+# Fraction of the capacity above which a node is considered full (see check_if_node_is_full_after_full_deployment)
+FULL_THRESHOLD = 0.95
+
 PROCESSING_DELAY = 2.0  # 2.0 ms
 MIN_PROC = 0.0
 MAX_PROC = 200.0  # 2.0 * 100 steps = 200.0 ms
@@ -137,10 +142,30 @@ FACTOR = 1.0
 SEED = 42
 PATH_CSV_FILES = "data/train/v1/nodes/"
 
+# Consecutive samples required after the start index of an episode
+MIN_TRACE_SAMPLES = 300
+
+# Seed stream of the traces (files and start index of the episodes), kept apart from np_random (see seed())
+TRACE_SEED_STREAM = 1
+
+# (provider, interface) ids in the CSV files of the endpoints of a node, in endpoint order
+ENDPOINT_CSV_IDS = [(id_provider, four if i == fourG_CSV else five)
+                    for id_provider in [TELIA_CSV, TELENOR_CSV, ICE_CSV] for i in range(NUM_INTERFACES)]
+
+# Network values streamed by the trace cursors, in this order
+NETWORK_COLUMNS = (DF_COLUMN_RTT_Q90, DF_COLUMN_UL, DF_COLUMN_DL, DF_COLUMN_JITTER)
+
+# Keys of the info dict returned by step() - known statically, e.g., for VecMonitor
+INFO_KEYWORDS = ("reward_step", "action", "reward", "ep_block_prob", "ep_accepted_requests",
+                 "avg_deployment_cost", "avg_total_latency", "avg_access_latency", "avg_processing_latency",
+                 "avg_rtt", "avg_dl", "avg_ul", "avg_jitter", "gini",
+                 "telia_requests", "telenor_requests", "ice_requests", "executionTime")
+
 
 class NNESchedulingEnv(gym.Env):
     """ NNE Scheduling env in Kubernetes - an OpenAI gym environment"""
     metadata = {'render.modes': ['human', 'ansi', 'array']}
+    info_keywords = INFO_KEYWORDS
 
     def __init__(self, num_nodes=DEFAULT_NUM_NODES,
                  arrival_rate_r=DEFAULT_ARRIVAL_RATE,
@@ -154,7 +179,14 @@ class NNESchedulingEnv(gym.Env):
                  seed=SEED,
                  factor=FACTOR,
                  path_csv_files=PATH_CSV_FILES,
-                 file_results_name=DEFAULT_FILE_NAME_RESULTS):
+                 file_results_name=DEFAULT_FILE_NAME_RESULTS,
+                 prefetch_traces=False,
+                 stream_traces=False,
+                 trace_chunk_size=DEFAULT_TRACE_CHUNK_SIZE):
+
+        if prefetch_traces and stream_traces:
+            raise ValueError("prefetch_traces and stream_traces cannot be combined: streamed traces are read "
+                             "chunk by chunk during the episode")
 
         # Define action and observation space
         super(NNESchedulingEnv, self).__init__()
@@ -206,8 +238,15 @@ class NNESchedulingEnv(gym.Env):
         # self.latency = np.zeros(self.total_number)
         self.jitter = np.zeros(self.total_number)
 
-        self.seed = seed
-        self.np_random, seed = seeding.np_random(self.seed)
+        # seed() stays a method (the vec envs call it): the initial seed is kept under another name
+        self.initial_seed = seed
+        self.trace_prefetcher = None
+        self.seed(seed)
+
+        # Streaming mode: the network values are read chunk by chunk, so episodes can be longer than the files
+        self.stream_traces = stream_traces
+        self.trace_chunk_size = trace_chunk_size
+        self.trace_cursors = None
         self.factor = factor
 
         logging.info(
@@ -279,70 +318,12 @@ class NNESchedulingEnv(gym.Env):
         self.free_cpu = np.zeros(self.total_number)
         self.free_memory = np.zeros(self.total_number)
 
-        # CSV files for each node
+        # CSV files for each node, and a random timestamp to start the episode
         self.path_csv_files = path_csv_files
-        self.node_csv_data = []
-        self.df_node = []
-        self.action_valid = []
-
-        self.df_node_selected_rows = []
-        self.selected_ts = None
-
-        j = 0
-        file = ""
-        for n in range(num_nodes):
-            # Choose a random CSV file for each node
-            if os.path.exists(self.path_csv_files):
-                file = random.choice(os.listdir(self.path_csv_files))
-                logging.info("[Init] FileName: {}".format(file))
-
-            for p in range(NUM_PROVIDERS):
-                for i in range(NUM_INTERFACES):
-                    self.free_cpu[j] = self.cpu_capacity[j] - self.allocated_cpu[j]
-                    self.free_memory[j] = self.memory_capacity[j] - self.allocated_memory[j]
-
-                    # Update files for each node
-                    self.node_csv_data.append(self.path_csv_files + file)
-                    self.df_node.append(pd.read_csv(self.node_csv_data[j]))
-
-                    # Check if provider and interface exist in dataframe
-                    if p == TELIA:
-                        id_provider = TELIA_CSV
-                    elif p == TELENOR:
-                        id_provider = TELENOR_CSV
-                    else:
-                        id_provider = ICE_CSV
-
-                    if i == fourG_CSV:
-                        id_interface = four
-                    else:
-                        id_interface = five
-
-                    # Select rows based on provider and interface
-                    selected_rows = self.df_node[j][(self.df_node[j][PROVIDERS_CSV] == id_provider) &
-                                                    (self.df_node[j][INTERFACES_CSV] == id_interface)]
-
-                    # Reset index of the DataFrame
-                    # selected_rows.reset_index(drop=True, inplace=True)
-
-                    # print(selected_rows)
-                    self.df_node_selected_rows.append(selected_rows)
-
-                    # logging.info("[Init] Node: {} | Provider: {} | Interface: {} | size of rows: {}".format(n + 1,
-                    #   PROVIDERS[p],INTERFACES[i], len(selected_rows)))
-
-                    # If len(rows) = 0 then provider or interface do not exist
-                    if len(selected_rows) == 0:
-                        # logging.info("[Init] Node: {} | Provider: {} | Interface: {}
-                        # do not exist in CSV file".format(n + 1, PROVIDERS[p], INTERFACES[i]))
-                        self.action_valid.append(False)
-                    else:
-                        logging.info(
-                            "[Init] Node: {} | Provider: {} | Interface: {} "
-                            "exists in CSV file".format(n + 1, PROVIDERS[p], INTERFACES[i]))
-                        self.action_valid.append(True)
-
-                    j += 1
+        if prefetch_traces:
+            # The traces of the next episode are prepared in the background while the current one runs
+            self.trace_prefetcher = BackgroundPrefetcher(self.prepare_trace_window)
+        self.load_episode_traces()
 
         # logging.info("[Init] Resources:")
         # logging.info("[Init] CPU Capacity: {}".format(self.cpu_capacity))
@@ -352,9 +333,6 @@ class NNESchedulingEnv(gym.Env):
         # logging.info("[Init] CPU free: {}".format(self.free_cpu))
         # logging.info("[Init] MEM free: {}".format(self.free_memory))
 
-        # Choose a random timestamp to start Episode
-        self.get_start_index()
-
         # Update network
         self.update_network_values()
 
@@ -377,6 +355,10 @@ class NNESchedulingEnv(gym.Env):
         self.episode_count = 0
         self.file_results_name = file_results_name
         self.file_results = file_results_name + ".csv"
+        self.file_decision_latency = file_results_name + "_decision_latency.csv"
+
+        # Decision latency of the agent, measured by the caller around the policy (see record_decision_latency)
+        self.decision_latency = LatencyHistogram()
         self.obs_csv = self.name + "_obs.csv"
 
     # Reset Function
@@ -391,6 +373,7 @@ class NNESchedulingEnv(gym.Env):
         self.episode_over = False
         self.total_reward = 0
         self.ep_accepted_requests = 0
+        self.decision_latency.clear()
         self.penalty = False
 
         self.block_prob = 0
@@ -466,6 +449,99 @@ class NNESchedulingEnv(gym.Env):
 
         # Do not consider CSV part in reset to speedup training
 
+        # Telemetry traces for each node, from a random index to start Episode
+        self.load_episode_traces()
+
+        # Update network
+        self.update_network_values()
+
+        # return obs
+        return np.array(self.get_state())
+
+    # Telemetry traces of the episode: taken from the prefetcher if enabled, loaded right away otherwise
+    def load_episode_traces(self):
+        if self.stream_traces:
+            self.open_trace_cursors()
+        elif self.trace_prefetcher is None:
+            self.load_node_traces()
+            self.get_start_index()
+        else:
+            self.apply_trace_window(self.trace_prefetcher.take())
+
+    # Streaming mode: one cursor per node from a random timestamp on, continuing with random files when it ends
+    def open_trace_cursors(self):
+        self.close_trace_cursors()
+        files = [self.path_csv_files + self.choose_csv_file() for _ in range(self.num_nodes)]
+
+        # Endpoints (provider and interface) of each node, and size of the files, without loading them
+        self.node_csv_data = []
+        self.action_valid = []
+        sizes = []
+        for file in files:
+            rows, endpoints = scan_trace(file, [PROVIDERS_CSV, INTERFACES_CSV], self.trace_chunk_size)
+            sizes.append(rows)
+            self.node_csv_data.extend([file] * len(ENDPOINT_CSV_IDS))
+            self.action_valid.extend(ids in endpoints for ids in ENDPOINT_CSV_IDS)
+        self.free_cpu[:] = self.cpu_capacity - self.allocated_cpu
+        self.free_memory[:] = self.memory_capacity - self.allocated_memory
+
+        # The files are then read from the start timestamp on
+        shortest, start_index = self.choose_start_index(sizes)
+        self.selected_ts = read_trace_value(files[shortest], 'ts', start_index)
+        logging.info("[Traces] Streaming files: {} | Selected TS: {}".format(files, self.selected_ts))
+
+        self.trace_cursors = [TraceCursor(file, NETWORK_COLUMNS, self.choose_next_csv_file, self.selected_ts,
+                                          self.trace_chunk_size) for file in files]
+
+    def choose_next_csv_file(self) -> str:
+        file = self.path_csv_files + self.choose_csv_file()
+        logging.info("[Traces] Continuing with file: {}".format(file))
+        return file
+
+    def close_trace_cursors(self):
+        if self.trace_cursors is not None:
+            for cursor in self.trace_cursors:
+                cursor.close()
+            self.trace_cursors = None
+
+    # Choose the files and the start timestamp of an episode, without touching the env (runs in the prefetcher)
+    def prepare_trace_window(self) -> TraceWindow:
+        cache = get_telemetry_cache()
+        window = TraceWindow(node_csv_data=[], df_node=[], df_node_selected_rows=[], action_valid=[],
+                             selected_ts=None)
+
+        node_dfs = []
+        for n in range(self.num_nodes):
+            file = self.path_csv_files + self.choose_csv_file()
+            node_dfs.append((file, cache.get(file)))
+
+        shortest, start_index = self.choose_start_index([len(df) for _, df in node_dfs])
+        window.selected_ts = node_dfs[shortest][1].loc[start_index, 'ts']
+
+        for file, df in node_dfs:
+            # The endpoints of a node share its rows from the start timestamp on
+            selected_rows = df[df['ts'] >= window.selected_ts].reset_index(drop=True)
+            for id_provider, id_interface in ENDPOINT_CSV_IDS:
+                window.node_csv_data.append(file)
+                window.df_node.append(df)
+                window.df_node_selected_rows.append(selected_rows)
+                window.action_valid.append(bool(((df[PROVIDERS_CSV] == id_provider) &
+                                                 (df[INTERFACES_CSV] == id_interface)).any()))
+        return window
+
+    def apply_trace_window(self, window: TraceWindow):
+        self.node_csv_data = window.node_csv_data
+        self.df_node = window.df_node
+        self.df_node_selected_rows = window.df_node_selected_rows
+        self.action_valid = window.action_valid
+        self.selected_ts = window.selected_ts
+        self.free_cpu[:] = self.cpu_capacity - self.allocated_cpu
+        self.free_memory[:] = self.memory_capacity - self.allocated_memory
+        logging.info("[Traces] Files: {} | Selected TS: {}".format(
+            window.node_csv_data[::NUM_PROVIDERS * NUM_INTERFACES], self.selected_ts))
+
+    # Load the telemetry traces of each endpoint (and the free resources, given the allocations)
+    def load_node_traces(self):
         # files for each node
         self.node_csv_data = []
         self.df_node = []
@@ -480,8 +556,11 @@ class NNESchedulingEnv(gym.Env):
         for n in range(self.num_nodes):
             # Choose a random CSV file for each node
             if os.path.exists(self.path_csv_files):
-                file = random.choice(os.listdir(self.path_csv_files))
-                logging.info("[Reset] FileName: {}".format(file))
+                file = self.choose_csv_file()
+                logging.info("[Traces] FileName: {}".format(file))
+
+            # Shared by the endpoints of the node (and across resets and envs via the telemetry cache)
+            df = get_telemetry_cache().get(self.path_csv_files + file)
 
             for p in range(NUM_PROVIDERS):
                 for i in range(NUM_INTERFACES):
@@ -490,7 +569,7 @@ class NNESchedulingEnv(gym.Env):
 
                     # Update files for each node
                     self.node_csv_data.append(self.path_csv_files + file)
-                    self.df_node.append(pd.read_csv(self.node_csv_data[j]))
+                    self.df_node.append(df)
 
                     # Check if provider and interface exist in dataframe
                     if p == TELIA:
@@ -529,22 +608,13 @@ class NNESchedulingEnv(gym.Env):
                         self.action_valid.append(False)
                     else:
                         logging.info(
-                            "[Init] Node: {} | Provider: {} | Interface: {} "
+                            "[Traces] Node: {} | Provider: {} | Interface: {} "
                             "exists in CSV file".format(n + 1, PROVIDERS[p], INTERFACES[i]))
 
                         self.action_valid.append(True)
 
                     j += 1
 
-        # Choose a random index to start Episode
-        self.get_start_index()
-
-        # Update network
-        self.update_network_values()
-
-        # return obs
-        return np.array(self.get_state())
-
     # Step function
     def step(self, action):
         if self.current_step == 1:
@@ -588,6 +658,16 @@ class NNESchedulingEnv(gym.Env):
         self.block_prob = 1 - (self.accepted_requests / self.offered_requests)
         self.ep_block_prob = 1 - (self.ep_accepted_requests / self.current_step)
 
+        self.info = self.get_info(reward, action)
+
+        if self.current_step == self.episode_length:
+            self.save_episode_results()
+
+        # return ob, reward, self.episode_over, self.info
+        return np.array(ob), reward, self.episode_over, self.info
+
+    # Info dict of the current step
+    def get_info(self, reward, action):
         if len(self.avg_access_latency) == 0 and len(self.avg_deployment_cost) == 0 \
                 and len(self.avg_rtt) == 0 and len(self.avg_dl) == 0 and len(self.avg_ul) == 0 \
                 and len(self.avg_jitter) == 0 and len(self.total_latency) == 0 and len(
@@ -610,7 +690,7 @@ class NNESchedulingEnv(gym.Env):
             total_latency = mean(self.avg_total_latency)
             avg_proc = mean(self.avg_processing_latency)
 
-        self.info = {
+        return {
             "reward_step": float("{:.2f}".format(reward)),
             "action": float("{:.2f}".format(action)),
             "reward": float("{:.2f}".format(self.total_reward)),
@@ -631,33 +711,37 @@ class NNESchedulingEnv(gym.Env):
             'executionTime': float("{:.2f}".format(self.execution_time))
         }
 
-        if self.current_step == self.episode_length:
-            self.episode_count += 1
-            self.episode_over = True
-            self.execution_time = time.time() - self.time_start
-
-            gini = calculate_gini_coefficient(self.avg_load_served_per_provider)
-
-            logging.info("[Step] Episode finished, saving results to csv...")
-            save_to_csv(self.file_results, self.episode_count,
-                        self.total_reward, self.ep_block_prob,
-                        self.ep_accepted_requests,
-                        mean(self.avg_deployment_cost),
-                        mean(self.avg_total_latency),
-                        mean(self.avg_access_latency),
-                        mean(self.avg_processing_latency),
-                        mean(self.avg_rtt),
-                        mean(self.avg_dl),
-                        mean(self.avg_ul),
-                        mean(self.avg_jitter),
-                        gini,
-                        self.avg_load_served_per_provider[TELIA],
-                        self.avg_load_served_per_provider[TELENOR],
-                        self.avg_load_served_per_provider[ICE],
-                        self.execution_time)
-
-        # return ob, reward, self.episode_over, self.info
-        return np.array(ob), reward, self.episode_over, self.info
+    # End of the episode: save its results to the csv file
+    def save_episode_results(self):
+        self.episode_count += 1
+        self.episode_over = True
+        self.execution_time = time.time() - self.time_start
+
+        gini = calculate_gini_coefficient(self.avg_load_served_per_provider)
+
+        logging.info("[Step] Episode finished, saving results to csv...")
+        save_to_csv(self.file_results, self.episode_count,
+                    self.total_reward, self.ep_block_prob,
+                    self.ep_accepted_requests,
+                    mean(self.avg_deployment_cost),
+                    mean(self.avg_total_latency),
+                    mean(self.avg_access_latency),
+                    mean(self.avg_processing_latency),
+                    mean(self.avg_rtt),
+                    mean(self.avg_dl),
+                    mean(self.avg_ul),
+                    mean(self.avg_jitter),
+                    gini,
+                    self.avg_load_served_per_provider[TELIA],
+                    self.avg_load_served_per_provider[TELENOR],
+                    self.avg_load_served_per_provider[ICE],
+                    self.execution_time)
+        if self.decision_latency.count > 0:
+            save_decision_latency_to_csv(self.file_decision_latency, self.episode_count, self.decision_latency)
+
+    # Record the time the agent took to choose the next action, reported per episode in the decision latency csv
+    def record_decision_latency(self, seconds):
+        self.decision_latency.record(seconds)
 
     # Reward Function
     def get_reward(self):
@@ -727,9 +811,29 @@ class NNESchedulingEnv(gym.Env):
             logging.info('[Get Reward] Unrecognized reward: {}'.format(self.reward_function))
 
     def seed(self, seed=None):
-        self.np_random, seed = seeding.np_random(seed)
+        np_random, seed = seeding.np_random(seed)
+        self.set_np_random(np_random, np.random.default_rng([seed, TRACE_SEED_STREAM]))
         return [seed]
 
+    # The traces (files and start index) are drawn from their own generator in every mode: the prefetcher draws
+    # them ahead of the episodes, in a background thread that cannot share np_random. trace_rng is derived from
+    # np_random if not given
+    def set_np_random(self, np_random, trace_rng=None):
+        if self.trace_prefetcher is not None:
+            # Wait for the traces being prepared with the previous generator
+            self.trace_prefetcher.cancel()
+        self.np_random = np_random
+        self.trace_rng = trace_rng if trace_rng is not None else np.random.default_rng(
+            int(np_random.integers(0, 2 ** 32)))
+        if self.trace_prefetcher is not None:
+            self.trace_prefetcher.restart()
+
+    def close(self):
+        self.close_trace_cursors()
+        if self.trace_prefetcher is not None:
+            self.trace_prefetcher.close()
+            self.trace_prefetcher = None
+
     def render(self, mode='human', close=False):
         # Render the environment to the screen
         return
@@ -743,6 +847,10 @@ class NNESchedulingEnv(gym.Env):
             # logging.info('[Take Action] MAX STEPS achieved, ending ...')
             self.episode_over = True
 
+        self.place_request(action)
+
+    # Place (or reject) the current deployment request
+    def place_request(self, action):
         # Possible Actions: Place all replicas together or split them.
         # Known as NP-hard problem (Bin pack with fragmentation)
         # Any ideas for heuristic? We can later compare with an ILP/MILP model...
@@ -792,18 +900,17 @@ class NNESchedulingEnv(gym.Env):
 
                 self.penalty = False
 
-                # Update allocated amounts
-                for n in range(len(self.node_id)):
-                    if self.node_id[n] == self.node_id[action]:
-                        self.allocated_cpu[n] += self.deployment_request.cpu_request
-                        self.allocated_memory[n] += self.deployment_request.memory_request
+                # Update allocated amounts of every endpoint of the node
+                node = self.node_id == self.node_id[action]
+                self.allocated_cpu[node] += self.deployment_request.cpu_request
+                self.allocated_memory[node] += self.deployment_request.memory_request
 
-                        # Update free resources
-                        self.free_cpu[n] = self.cpu_capacity[n] - self.allocated_cpu[n]
-                        self.free_memory[n] = self.memory_capacity[n] - self.allocated_memory[n]
+                # Update free resources
+                self.free_cpu[node] = self.cpu_capacity[node] - self.allocated_cpu[node]
+                self.free_memory[node] = self.memory_capacity[node] - self.allocated_memory[node]
 
-                        # Update processing latency
-                        self.processing_latency[n] += PROCESSING_DELAY
+                # Update processing latency
+                self.processing_latency[node] += PROCESSING_DELAY
 
                 # Update the request
                 self.enqueue_request(self.deployment_request)
@@ -944,8 +1051,8 @@ class NNESchedulingEnv(gym.Env):
         total_cpu = self.deployment_request.cpu_request
         total_memory = self.deployment_request.memory_request
 
-        if (self.allocated_cpu[action] + total_cpu > 0.95 * self.cpu_capacity[action]
-                or self.allocated_memory[action] + total_memory > 0.95 * self.memory_capacity[action]):
+        if (self.allocated_cpu[action] + total_cpu > FULL_THRESHOLD * self.cpu_capacity[action]
+                or self.allocated_memory[action] + total_memory > FULL_THRESHOLD * self.memory_capacity[action]):
             logging.info('[Check]: Node is full... Action id: {}'.format(action + 1))
             return True
 
@@ -1026,21 +1133,26 @@ class NNESchedulingEnv(gym.Env):
                                                                            self.deployment_request.cpu_request,
                                                                            self.deployment_request.memory_request))
 
+    # Choose a random CSV file (sorted, so that the choice only depends on trace_rng)
+    def choose_csv_file(self) -> str:
+        files = sorted(os.listdir(self.path_csv_files))
+        return files[int(self.trace_rng.integers(0, len(files)))]
+
+    # Choose a random index of the shortest node file (sizes: rows per node), with at least 300 samples after it.
+    # Shared by all the trace modes, so that a seed gives the same episodes in each of them
+    def choose_start_index(self, sizes):
+        shortest = int(np.argmin(sizes))
+        return shortest, int(self.trace_rng.integers(0, max(sizes[shortest] - MIN_TRACE_SAMPLES, 1)))
+
     # Choose random index (ts) from dataframe to start simulation with at least 300 samples left for each node
     def get_start_index(self):
-        # check min size and id of the node
-        min_size = 1000000
-        id = 0
-        for n in range(self.num_nodes):
-            if len(self.df_node[n]) < min_size:
-                min_size = len(self.df_node[n])
-                id = n
-
-        # Choose a random index, but making sure 300 consecutive samples exist
-        start_index = np.random.randint(0, min_size - 300)
+        # The endpoints of a node share its file
+        endpoints_per_node = NUM_PROVIDERS * NUM_INTERFACES
+        shortest, start_index = self.choose_start_index(
+            [len(self.df_node[n * endpoints_per_node]) for n in range(self.num_nodes)])
 
         # Get the timestamp at the random index
-        self.selected_ts = self.df_node[id].loc[start_index, 'ts']
+        self.selected_ts = self.df_node[shortest * endpoints_per_node].loc[start_index, 'ts']
         logging.info("Selected TS: {}".format(self.selected_ts))
 
         j = 0
@@ -1065,6 +1177,10 @@ class NNESchedulingEnv(gym.Env):
         else:
             step = self.current_step + 1
 
+        if self.trace_cursors is not None:
+            self.update_streamed_network_values(step)
+            return
+
         j = 0
         for n in range(self.num_nodes):
             for p in range(NUM_PROVIDERS):
@@ -1097,3 +1213,18 @@ class NNESchedulingEnv(gym.Env):
 
                     j += 1
         return
+
+    # Streaming mode: the endpoints of a node share the row of its cursor (as they share its selected rows)
+    def update_streamed_network_values(self, step):
+        values = np.empty((self.num_nodes, len(NETWORK_COLUMNS)))
+        for n, cursor in enumerate(self.trace_cursors):
+            cursor.advance_to(step)
+            values[n] = cursor.value
+        values = np.repeat(values, NUM_PROVIDERS * NUM_INTERFACES, axis=0)
+        valid = np.array(self.action_valid)
+
+        # Invalid endpoints are filled with -1
+        for k, metric in enumerate([self.rtt, self.ul, self.dl, self.jitter]):
+            metric[:] = np.where(valid, values[:, k], -1)
+        logging.info("[update_network_values] Streaming | Row: {} | RTT Q90: {} | UL: {} | DL: {} | Jitter: {}".format(
+            step, self.rtt, self.ul, self.dl, self.jitter))
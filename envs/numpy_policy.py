@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import numpy.typing as npt
+
+# Only numpy is imported here, so that exported policies can be served without torch / SB3 (see envs/export.py)
+HUGE_NEG = -1e8
+META_KEY = "__meta__"
+
+
+def _elu(x: npt.NDArray) -> npt.NDArray:
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+class NumpyPolicy:
+    """
+    Dependency-free forward pass of an exported placement policy.
+    layers: list of {"type": flatten | linear | equivariant | relu | elu | tanh | squeeze, ...parameter names}.
+    contract: observation shape, number of actions and the semantics of the action masks.
+    """
+
+    def __init__(self, layers: list, arrays: dict, contract: dict):
+        self.layers = layers
+        self.arrays = {k: np.ascontiguousarray(v, dtype=np.float32) for k, v in arrays.items()}
+        self.contract = contract
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyPolicy":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data[META_KEY]))
+            arrays = {k: data[k] for k in data.files if k != META_KEY}
+        return cls(meta["layers"], arrays, meta["contract"])
+
+    def save(self, path: str) -> None:
+        meta = json.dumps({"layers": self.layers, "contract": self.contract})
+        np.savez(path, **{META_KEY: np.array(meta)}, **self.arrays)
+
+    def scores(self, obs: npt.NDArray) -> npt.NDArray:
+        """Per-action scores (logits or Q-values), (batch_size, num_actions)."""
+        x = np.asarray(obs, dtype=np.float32)
+        for layer in self.layers:
+            kind = layer["type"]
+            if kind == "flatten":
+                x = x.reshape(x.shape[0], -1)
+            elif kind == "linear":
+                x = x @ self.arrays[layer["weight"]]
+                if "bias" in layer:
+                    x = x + self.arrays[layer["bias"]]
+            elif kind == "equivariant":
+                # Lambda(x) - Gamma(max(x)), as in EquivariantLayer
+                x = x @ self.arrays[layer["lambda"]] - x.max(axis=1, keepdims=True) @ self.arrays[layer["gamma"]]
+            elif kind == "relu":
+                x = np.maximum(x, 0)
+            elif kind == "elu":
+                x = _elu(x)
+            elif kind == "tanh":
+                x = np.tanh(x)
+            elif kind == "squeeze":
+                x = x[..., 0]
+            else:
+                raise ValueError("Unknown layer type: {}".format(kind))
+        return x
+
+    def predict(self, obs: npt.NDArray, masks: npt.NDArray = None) -> npt.NDArray:
+        """Deterministic actions: argmax of the scores, invalid actions (mask False) being excluded."""
+        scores = self.scores(obs)
+        if masks is not None:
+            scores = np.where(np.asarray(masks, dtype=bool), scores, HUGE_NEG)
+        return np.argmax(scores, axis=1)
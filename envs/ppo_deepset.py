@@ -1,8 +1,9 @@
 import random
 import time
 from statistics import mean
-from typing import Optional, Union
+from typing import Callable, List, Optional, Union
 from abc import ABC, abstractmethod
+import gym
 import numpy as np
 import numpy.typing as npt
 import pandas as pd
@@ -13,6 +14,12 @@ import torch.optim as optim
 from stable_baselines3.common.vec_env.dummy_vec_env import DummyVecEnv
 from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
 from envs.deep_sets_agent_original import DeepSetAgent
+from envs.deep_sets_agent_hierarchical import HierarchicalDeepSetAgent
+from envs.vec_env import get_vec_action_masks, get_action_mask_size
+from envs.async_rl import AsyncActors, collect_ppo_rollout, ROLLOUT_KEYS
+from envs.metrics import MetricsSink, DEFAULT_LOG_INTERVAL
+from envs.distributed import get_rank, get_world_size, is_main_process, broadcast_parameters, \
+    all_reduce_gradients, all_reduce_mean, NullWriter
 from torch.utils.tensorboard import SummaryWriter
 from stable_baselines3.common.utils import safe_mean
 
@@ -26,13 +33,34 @@ class Algorithm(ABC):
             n_minibatches: int,
             # learning_rate: float,
             tensorboard_log: str,
+            log_interval: int = DEFAULT_LOG_INTERVAL,
     ):
         self.env = env
         self.num_envs = num_envs
         self.num_steps = num_steps
         self.n_minibatches = n_minibatches
         # self.learning_rate = learning_rate
-        self.writer = SummaryWriter(log_dir=tensorboard_log)
+        # In data-parallel mode, only rank 0 writes tensorboard logs
+        self.rank = get_rank()
+        self.world_size = get_world_size()
+        self.writer = SummaryWriter(log_dir=tensorboard_log) if is_main_process() else NullWriter()
+        # Scalars are aggregated over log_interval steps and written in the background
+        self.metrics = MetricsSink(self.writer, log_interval=log_interval, verbose=is_main_process())
+
+    def dump_metrics(self, global_step: int, start_time: float, episode_rewards: List[float],
+                     force: bool = False) -> None:
+        """
+        Closes the metrics window once it spans log_interval steps (or if forced), adding the run-level gauges.
+        """
+        if not force and not self.metrics.ready(global_step):
+            return
+        if len(episode_rewards) > 0:
+            self.metrics.record("rollout/ep_rew_mean", safe_mean(episode_rewards))
+        self.metrics.record("charts/learning_rate", self.optimizer.param_groups[0]["lr"])
+        self.metrics.record("charts/FPS", int(global_step / (time.time() - start_time)))
+        self.metrics.dump(global_step)
+        if force:
+            self.metrics.flush()
 
     @abstractmethod
     def learn(self, num_timesteps: int) -> None:
@@ -46,6 +74,53 @@ class Algorithm(ABC):
         Predict the policy action from an observation
         """
 
+
+def discounted_cumsum(deltas: torch.Tensor, coefs: torch.Tensor) -> torch.Tensor:
+    """
+    Vectorized solution of the backward recursion A_t = deltas_t + coefs_t * A_{t+1} (with A_T = 0).
+    deltas, coefs: (num_steps, num_envs).
+    """
+    num_steps = deltas.shape[0]
+    # discounts[t, k] = prod_{j=t}^{k-1} coefs[j] for k >= t and 0 otherwise (no division, so dones are exact)
+    upper = torch.triu(torch.ones((num_steps, num_steps), dtype=torch.bool, device=deltas.device)).unsqueeze(-1)
+    prods = torch.cumprod(torch.where(upper, coefs.unsqueeze(0), torch.ones_like(coefs).unsqueeze(0)), dim=1)
+    discounts = torch.cat([torch.ones_like(prods[:, :1]), prods[:, :-1]], dim=1) * upper
+    return (discounts * deltas.unsqueeze(0)).sum(dim=1)
+
+
+def compute_gae(rewards: torch.Tensor, values: torch.Tensor, dones: torch.Tensor, next_value: torch.Tensor,
+                gamma: float, gae_lambda: float) -> torch.Tensor:
+    """
+    Vectorized GAE: solves A_t = delta_t + gamma * lambda * (1 - dones[t + 1]) * A_{t+1} in closed form.
+    rewards, values: (num_steps, num_envs); dones: (num_steps + 1, num_envs); next_value: (1, num_envs).
+    """
+    next_nonterminal = 1.0 - dones[1:]
+    next_values = torch.cat([values[1:], next_value], dim=0)
+    deltas = rewards + gamma * next_values * next_nonterminal - values
+    return discounted_cumsum(deltas, gamma * gae_lambda * next_nonterminal)
+
+
+def compute_vtrace(rewards: torch.Tensor, values: torch.Tensor, dones: torch.Tensor, next_value: torch.Tensor,
+                   behaviour_logprobs: torch.Tensor, target_logprobs: torch.Tensor, gamma: float,
+                   rho_bar: float = 1.0, c_bar: float = 1.0) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    V-trace off-policy correction (Espeholt et al., 2018) for trajectories collected by stale actors.
+    Same shapes as compute_gae. Returns the policy-gradient advantages and the value targets vs.
+    """
+    ratios = torch.exp(target_logprobs - behaviour_logprobs)
+    rhos = torch.clamp(ratios, max=rho_bar)
+    cs = torch.clamp(ratios, max=c_bar)
+
+    next_nonterminal = 1.0 - dones[1:]
+    next_values = torch.cat([values[1:], next_value], dim=0)
+    deltas = rhos * (rewards + gamma * next_values * next_nonterminal - values)
+    vs = values + discounted_cumsum(deltas, gamma * cs * next_nonterminal)
+
+    next_vs = torch.cat([vs[1:], next_value], dim=0)
+    advantages = rhos * (rewards + gamma * next_vs * next_nonterminal - values)
+    return advantages, vs
+
+
 # borrowed from CleanRL single-file PPO implementation
 class PPO_DeepSets(Algorithm):
     def __init__(
@@ -70,8 +145,13 @@ class PPO_DeepSets(Algorithm):
             seed: int = 1,
             device: str = "cpu",
             tensorboard_log: str = "results/nne/",
+            log_interval: int = DEFAULT_LOG_INTERVAL,
+            padded_sets: bool = False,
+            hierarchical: bool = False,
     ):
-        super().__init__(env, num_envs, num_steps, n_minibatches, tensorboard_log)
+        super().__init__(env, num_envs, num_steps, n_minibatches, tensorboard_log, log_interval)
+        if padded_sets and hierarchical:
+            raise ValueError("padded_sets is not supported with the hierarchical action")
         self.num_envs = num_envs
         self.learning_rate = learning_rate
         self.anneal_lr = anneal_lr
@@ -90,6 +170,8 @@ class PPO_DeepSets(Algorithm):
         self.target_kl = target_kl
         self.seed = seed
         self.device = device
+        self.padded_sets = padded_sets
+        self.hierarchical = hierarchical
 
         self.hyperparams = {
             "num_envs": self.num_envs,
@@ -118,33 +200,45 @@ class PPO_DeepSets(Algorithm):
             "|param|value|\n|-|-|\n%s" % ("\n".join([f"|{key}|{value}|" for key, value in self.hyperparams.items()])),
         )
 
-        random.seed(self.seed)
-        np.random.seed(self.seed)
-        torch.manual_seed(self.seed)
+        # Each rank explores its own slice of envs and minibatches
+        random.seed(self.seed + self.rank)
+        np.random.seed(self.seed + self.rank)
+        torch.manual_seed(self.seed + self.rank)
 
         # TODO: modify it to multibinary
         # assert isinstance(self.env.action_space, gym.spaces.Discrete), "only discrete action space is supported"
 
         # TODO: issues here! not sure how this runs...
-        self.agent = DeepSetAgent(self.env).to(self.device)
+        # padded_sets: observations padded by PaddedSetObservation (envs with different num_nodes)
+        # hierarchical: node-then-endpoint actions of HierarchicalNodeAction
+        if self.hierarchical:
+            self.agent = HierarchicalDeepSetAgent(self.env).to(self.device)
+        else:
+            self.agent = DeepSetAgent(self.env, padded=self.padded_sets).to(self.device)
+        self.mask_size = get_action_mask_size(self.env.action_space)
+        broadcast_parameters(self.agent)
         self.optimizer = optim.Adam(self.agent.parameters(), lr=self.learning_rate, eps=1e-5)
 
         # ALGO Logic: Storage setup
-        self.obs = torch.zeros((self.num_steps, self.num_envs) + self.env.observation_space.shape).to(self.device)
+        # obs, dones and masks keep one extra row: the next observation used to bootstrap the rollout,
+        # which becomes the first row of the following rollout
+        self.obs = torch.zeros((self.num_steps + 1, self.num_envs) + self.env.observation_space.shape).to(
+            self.device)
         self.actions = torch.zeros((self.num_steps, self.num_envs) + self.env.action_space.shape).to(self.device)
-        self.masks = torch.zeros((self.num_steps, self.num_envs, self.env.action_space.n), dtype=torch.bool).to(
+        self.masks = torch.zeros((self.num_steps + 1, self.num_envs, self.mask_size), dtype=torch.bool).to(
             self.device)
         self.logprobs = torch.zeros((self.num_steps, self.num_envs)).to(self.device)
         self.rewards = torch.zeros((self.num_steps, self.num_envs)).to(self.device)
-        self.dones = torch.zeros((self.num_steps, self.num_envs)).to(self.device)
+        self.dones = torch.zeros((self.num_steps + 1, self.num_envs)).to(self.device)
         self.values = torch.zeros((self.num_steps, self.num_envs)).to(self.device)
 
     def learn(self, total_timesteps: int = 500000):
         global_step = 0
         start_time = time.time()
-        next_obs = torch.Tensor(self.env.reset()).to(self.device)
-        next_done = torch.zeros(self.num_envs).to(self.device)
-        next_masks = torch.tensor(np.array(self.env.env_method("action_masks")), dtype=torch.bool).to(self.device)
+        # env outputs are written in place into the preallocated storage (no intermediate tensors)
+        self.obs[0].copy_(torch.from_numpy(self.env.reset()))
+        self.dones[0].zero_()
+        self.masks[0].copy_(torch.from_numpy(get_vec_action_masks(self.env)))
 
         num_updates = total_timesteps // self.batch_size
         episode_rewards = []
@@ -156,133 +250,203 @@ class PPO_DeepSets(Algorithm):
                 lrnow = frac * self.learning_rate
                 self.optimizer.param_groups[0]["lr"] = lrnow
 
+            # The bootstrap row of the previous rollout is the first row of this one
+            if update > 1:
+                self.obs[0].copy_(self.obs[-1])
+                self.dones[0].copy_(self.dones[-1])
+                self.masks[0].copy_(self.masks[-1])
+
             for step in range(0, self.num_steps):
                 global_step += 1 * self.num_envs
-                self.obs[step] = next_obs
-                self.dones[step] = next_done
-                self.masks[step] = next_masks
 
                 # ALGO LOGIC: action logic
                 with torch.no_grad():
-                    action, logprob, _, value = self.agent.get_action_and_value(next_obs) # masks=next_masks)
+                    # Padded sets: padding elements must never be sampled
+                    action, logprob, _, value = self.agent.get_action_and_value(
+                        self.obs[step], masks=self.masks[step] if self.padded_sets else None)
                     self.values[step] = value.flatten()
                 self.actions[step] = action
                 self.logprobs[step] = logprob
 
                 # TRY NOT TO MODIFY: execute the enviroment and log data.
                 next_obs, reward, done, info = self.env.step(action.cpu().numpy())
-                self.rewards[step] = torch.tensor(reward).to(self.device).view(-1)
-                next_masks = torch.tensor(np.array(self.env.env_method("action_masks")), dtype=torch.bool).to(
-                           self.device)
-                next_obs, next_done = torch.Tensor(next_obs).to(self.device), torch.Tensor(done).to(self.device)
+                self.obs[step + 1].copy_(torch.from_numpy(next_obs))
+                self.rewards[step].copy_(torch.from_numpy(reward))
+                self.dones[step + 1].copy_(torch.from_numpy(done))
+                self.masks[step + 1].copy_(torch.from_numpy(get_vec_action_masks(self.env)))
 
                 for item in info:
                     if "episode" in item.keys():
                         episode_rewards.append(item['episode']['r'])
-                        self.writer.add_scalar("charts/episodic_return", item["episode"]["r"], global_step)
-                        self.writer.add_scalar("charts/episodic_length", item["episode"]["l"], global_step)
-                        self.writer.add_scalar("rollout/ep_rew_mean", safe_mean(episode_rewards), global_step)
-                        print(f"global_step: {global_step}, episodic_return={item['episode']['r']},  "
-                              f"episode_rew_mean={safe_mean(episode_rewards)}")
-                        break
+                        self.metrics.record("charts/episodic_return", item["episode"]["r"])
+                        self.metrics.record("charts/episodic_length", item["episode"]["l"])
 
             # bootstrap value if not done
             with torch.no_grad():
-                next_value = self.agent.get_value(next_obs).reshape(1, -1)
-                advantages = torch.zeros_like(self.rewards).to(self.device)
-                lastgaelam = 0
-                for t in reversed(range(self.num_steps)):
-                    if t == self.num_steps - 1:
-                        nextnonterminal = 1.0 - next_done
-                        nextvalues = next_value
-                    else:
-                        nextnonterminal = 1.0 - self.dones[t + 1]
-                        nextvalues = self.values[t + 1]
-                    delta = self.rewards[t] + self.gamma * nextvalues * nextnonterminal - self.values[t]
-                    advantages[t] = lastgaelam = delta + self.gamma * self.gae_lambda * nextnonterminal * lastgaelam
+                next_value = self.agent.get_value(self.obs[-1]).reshape(1, -1)
+                advantages = compute_gae(self.rewards, self.values, self.dones, next_value,
+                                         self.gamma, self.gae_lambda)
                 returns = advantages + self.values
 
             # flatten the batch
-            b_obs = self.obs.reshape((-1,) + self.env.observation_space.shape)
+            b_obs = self.obs[:-1].reshape((-1,) + self.env.observation_space.shape)
             b_logprobs = self.logprobs.reshape(-1)
             b_actions = self.actions.reshape((-1,) + self.env.action_space.shape)
-            b_masks = self.masks.reshape((-1, +self.env.action_space.n))
+            b_masks = self.masks[:-1].reshape((-1, self.mask_size))
             b_advantages = advantages.reshape(-1)
             b_returns = returns.reshape(-1)
             b_values = self.values.reshape(-1)
 
-            # Optimizing the policy and value network
-            b_inds = np.arange(self.batch_size)
-            clipfracs = []
-            for epoch in range(self.update_epochs):
-                np.random.shuffle(b_inds)
-                for start in range(0, self.batch_size, self.minibatch_size):
-                    end = start + self.minibatch_size
-                    mb_inds = b_inds[start:end]
-
-                    _, newlogprob, entropy, newvalue = self.agent.get_action_and_value(
-                        b_obs[mb_inds], b_actions.long()[mb_inds], b_masks[mb_inds]
+            self.optimize(b_obs, b_logprobs, b_actions, b_masks, b_advantages, b_returns, b_values, global_step)
+            self.dump_metrics(global_step, start_time, episode_rewards)
+        self.dump_metrics(global_step, start_time, episode_rewards, force=True)
+
+    def optimize(self, b_obs: torch.Tensor, b_logprobs: torch.Tensor, b_actions: torch.Tensor, b_masks: torch.Tensor,
+                 b_advantages: torch.Tensor, b_returns: torch.Tensor, b_values: torch.Tensor,
+                 global_step: int) -> None:
+        """
+        Optimizing the policy and value network on a flattened batch
+        """
+        b_inds = np.arange(self.batch_size)
+        clipfracs = []
+        for epoch in range(self.update_epochs):
+            np.random.shuffle(b_inds)
+            for start in range(0, self.batch_size, self.minibatch_size):
+                end = start + self.minibatch_size
+                mb_inds = b_inds[start:end]
+
+                _, newlogprob, entropy, newvalue = self.agent.get_action_and_value(
+                    b_obs[mb_inds], b_actions.long()[mb_inds], b_masks[mb_inds]
+                )
+                logratio = newlogprob - b_logprobs[mb_inds]
+                ratio = logratio.exp()
+
+                with torch.no_grad():
+                    # calculate approx_kl http://joschu.net/blog/kl-approx.html
+                    old_approx_kl = (-logratio).mean()
+                    approx_kl = ((ratio - 1) - logratio).mean()
+                    clipfracs += [((ratio - 1.0).abs() > self.clip_coef).float().mean().item()]
+
+                mb_advantages = b_advantages[mb_inds]
+                if self.norm_adv:
+                    mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
+
+                # Policy loss
+                pg_loss1 = -mb_advantages * ratio
+                pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - self.clip_coef, 1 + self.clip_coef)
+                pg_loss = torch.max(pg_loss1, pg_loss2).mean()
+
+                # Value loss
+                newvalue = newvalue.view(-1)
+                if self.clip_vloss:
+                    v_loss_unclipped = (newvalue - b_returns[mb_inds]) ** 2
+                    v_clipped = b_values[mb_inds] + torch.clamp(
+                        newvalue - b_values[mb_inds],
+                        -self.clip_coef,
+                        self.clip_coef,
                     )
-                    logratio = newlogprob - b_logprobs[mb_inds]
-                    ratio = logratio.exp()
-
-                    with torch.no_grad():
-                        # calculate approx_kl http://joschu.net/blog/kl-approx.html
-                        old_approx_kl = (-logratio).mean()
-                        approx_kl = ((ratio - 1) - logratio).mean()
-                        clipfracs += [((ratio - 1.0).abs() > self.clip_coef).float().mean().item()]
-
-                    mb_advantages = b_advantages[mb_inds]
-                    if self.norm_adv:
-                        mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
-
-                    # Policy loss
-                    pg_loss1 = -mb_advantages * ratio
-                    pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - self.clip_coef, 1 + self.clip_coef)
-                    pg_loss = torch.max(pg_loss1, pg_loss2).mean()
-
-                    # Value loss
-                    newvalue = newvalue.view(-1)
-                    if self.clip_vloss:
-                        v_loss_unclipped = (newvalue - b_returns[mb_inds]) ** 2
-                        v_clipped = b_values[mb_inds] + torch.clamp(
-                            newvalue - b_values[mb_inds],
-                            -self.clip_coef,
-                            self.clip_coef,
-                        )
-                        v_loss_clipped = (v_clipped - b_returns[mb_inds]) ** 2
-                        v_loss_max = torch.max(v_loss_unclipped, v_loss_clipped)
-                        v_loss = 0.5 * v_loss_max.mean()
+                    v_loss_clipped = (v_clipped - b_returns[mb_inds]) ** 2
+                    v_loss_max = torch.max(v_loss_unclipped, v_loss_clipped)
+                    v_loss = 0.5 * v_loss_max.mean()
+                else:
+                    v_loss = 0.5 * ((newvalue - b_returns[mb_inds]) ** 2).mean()
+
+                entropy_loss = entropy.mean()
+                loss = pg_loss - self.ent_coef * entropy_loss + v_loss * self.vf_coef
+
+                self.optimizer.zero_grad()
+                loss.backward()
+                all_reduce_gradients(self.agent)
+                nn.utils.clip_grad_norm_(self.agent.parameters(), self.max_grad_norm)
+                self.optimizer.step()
+
+            if self.target_kl is not None:
+                # All ranks must take the same early-stopping decision
+                if all_reduce_mean(approx_kl) > self.target_kl:
+                    break
+
+        y_pred, y_true = b_values.cpu().numpy(), b_returns.cpu().numpy()
+        var_y = np.var(y_true)
+        explained_var = np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
+
+        # TRY NOT TO MODIFY: record rewards for plotting purposes
+        self.metrics.record("losses/value_loss", v_loss.item())
+        self.metrics.record("losses/policy_loss", pg_loss.item())
+        self.metrics.record("losses/entropy", entropy_loss.item())
+        self.metrics.record("losses/old_approx_kl", old_approx_kl.item())
+        self.metrics.record("losses/approx_kl", approx_kl.item())
+        self.metrics.record("losses/clipfrac", np.mean(clipfracs))
+        self.metrics.record("losses/explained_variance", explained_var)
+
+    def learn_async(self, total_timesteps: int, env_fns: List[Callable[[], gym.Env]], vtrace: bool = False,
+                    queue_size: int = 16, rho_bar: float = 1.0, c_bar: float = 1.0) -> None:
+        """
+        Asynchronous actor/learner training: one actor process per env_fn steps its own env with a
+        periodically synced copy of the agent, while this process keeps optimizing on the incoming
+        trajectories (num_envs trajectories of num_steps per update). With vtrace=True, the advantages
+        and value targets are corrected for the policy lag of the actors.
+        """
+        if self.world_size > 1:
+            raise ValueError("Asynchronous actors and data-parallel training cannot be combined")
+        global_step = 0
+        start_time = time.time()
+        num_updates = total_timesteps // self.batch_size
+        episode_rewards = []
+
+        actors = AsyncActors(env_fns, self.agent, collect_ppo_rollout, self.num_steps, queue_size=queue_size,
+                             seed=self.seed)
+        actors.start()
+        try:
+            for update in range(1, num_updates + 1):
+                # Annealing the rate if instructed to do so.
+                if self.anneal_lr:
+                    frac = 1.0 - (update - 1.0) / num_updates
+                    lrnow = frac * self.learning_rate
+                    self.optimizer.param_groups[0]["lr"] = lrnow
+
+                # Stack num_envs trajectories (from any actors) into a (num_steps, num_envs) batch
+                trajectories = [actors.get() for _ in range(self.num_envs)]
+                batch = {key: torch.stack([t[key] for t in trajectories], dim=1).to(self.device)
+                         for key in ROLLOUT_KEYS}
+                global_step += self.batch_size
+
+                for t in trajectories:
+                    for r in t["episode_returns"]:
+                        episode_rewards.append(r)
+                        self.metrics.record("charts/episodic_return", r)
+                self.metrics.record("charts/policy_lag", actors.version.value -
+                                    np.mean([t["policy_version"] for t in trajectories]))
+
+                with torch.no_grad():
+                    next_value = self.agent.get_value(batch["obs"][-1]).reshape(1, -1)
+                    if vtrace:
+                        obs = batch["obs"][:-1].reshape((-1,) + self.env.observation_space.shape)
+                        _, target_logprobs, _, values = self.agent.get_action_and_value(
+                            obs, batch["actions"].long().reshape((-1,) + self.env.action_space.shape))
+                        values = values.reshape(self.num_steps, self.num_envs)
+                        advantages, returns = compute_vtrace(batch["rewards"], values, batch["dones"], next_value,
+                                                             batch["logprobs"],
+                                                             target_logprobs.reshape(self.num_steps, self.num_envs),
+                                                             self.gamma, rho_bar=rho_bar, c_bar=c_bar)
                     else:
-                        v_loss = 0.5 * ((newvalue - b_returns[mb_inds]) ** 2).mean()
-
-                    entropy_loss = entropy.mean()
-                    loss = pg_loss - self.ent_coef * entropy_loss + v_loss * self.vf_coef
-
-                    self.optimizer.zero_grad()
-                    loss.backward()
-                    nn.utils.clip_grad_norm_(self.agent.parameters(), self.max_grad_norm)
-                    self.optimizer.step()
-
-                if self.target_kl is not None:
-                    if approx_kl > self.target_kl:
-                        break
-
-            y_pred, y_true = b_values.cpu().numpy(), b_returns.cpu().numpy()
-            var_y = np.var(y_true)
-            explained_var = np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
-
-            # TRY NOT TO MODIFY: record rewards for plotting purposes
-            self.writer.add_scalar("charts/learning_rate", self.optimizer.param_groups[0]["lr"], global_step)
-            self.writer.add_scalar("losses/value_loss", v_loss.item(), global_step)
-            self.writer.add_scalar("losses/policy_loss", pg_loss.item(), global_step)
-            self.writer.add_scalar("losses/entropy", entropy_loss.item(), global_step)
-            self.writer.add_scalar("losses/old_approx_kl", old_approx_kl.item(), global_step)
-            self.writer.add_scalar("losses/approx_kl", approx_kl.item(), global_step)
-            self.writer.add_scalar("losses/clipfrac", np.mean(clipfracs), global_step)
-            self.writer.add_scalar("losses/explained_variance", explained_var, global_step)
-            print("FPS:", int(global_step / (time.time() - start_time)))
-            self.writer.add_scalar("charts/FPS", int(global_step / (time.time() - start_time)), global_step)
+                        values = batch["values"]
+                        advantages = compute_gae(batch["rewards"], values, batch["dones"], next_value,
+                                                 self.gamma, self.gae_lambda)
+                        returns = advantages + values
+
+                # flatten the batch
+                self.optimize(batch["obs"][:-1].reshape((-1,) + self.env.observation_space.shape),
+                              batch["logprobs"].reshape(-1),
+                              batch["actions"].reshape((-1,) + self.env.action_space.shape),
+                              batch["masks"][:-1].reshape((-1, self.mask_size)),
+                              advantages.reshape(-1), returns.reshape(-1), values.reshape(-1), global_step)
+
+                # Publish the new weights to the actors
+                actors.sync(self.agent)
+                self.dump_metrics(global_step, start_time, episode_rewards)
+        finally:
+            actors.close()
+        self.dump_metrics(global_step, start_time, episode_rewards, force=True)
 
     def predict(self, obs: npt.NDArray, masks: Optional[npt.NDArray] = None) -> npt.NDArray:
         with torch.no_grad():
@@ -292,7 +456,8 @@ class PPO_DeepSets(Algorithm):
         return action
 
     def save(self, path: str) -> None:
-        torch.save(self.agent.state_dict(), path)
+        if is_main_process():
+            torch.save(self.agent.state_dict(), path)
 
     def load(self, path: str) -> None:
         self.agent.load_state_dict(torch.load(path))
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class BackgroundPrefetcher(Generic[T]):
+    """
+    Prepares the next item with fn() in a background thread while the current one is in use: take() returns
+    the prepared item (waiting only if it is not ready yet) and starts preparing the following one.
+    fn() runs in a single thread, so its calls never overlap.
+    """
+
+    def __init__(self, fn: Callable[[], T]):
+        self.fn = fn
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.future = self.executor.submit(fn)
+        # Number of take() calls served without waiting / that had to wait for fn()
+        self.ready = 0
+        self.waited = 0
+
+    def take(self) -> T:
+        if self.future.done():
+            self.ready += 1
+        else:
+            self.waited += 1
+        # Errors of fn() are raised here
+        item = self.future.result()
+        self.future = self.executor.submit(self.fn)
+        return item
+
+    def restart(self) -> None:
+        """Discards the item being prepared (e.g. when the inputs of fn() changed) and prepares a new one."""
+        self.cancel()
+        self.future = self.executor.submit(self.fn)
+
+    def cancel(self) -> None:
+        # A running fn() cannot be interrupted: wait for it, so that it does not overlap with the next one
+        if not self.future.cancel():
+            try:
+                self.future.result()
+            except (CancelledError, Exception):
+                pass
+
+    def close(self) -> None:
+        self.cancel()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,131 @@
+import logging
+import time
+from typing import Callable, Optional, Sequence
+import numpy as np
+import gym
+from envs.nne_scheduling_env import NNESchedulingEnv
+from envs.histogram import LatencyHistogram
+from envs.telemetry_cache import get_telemetry_cache
+
+# Methods of NNESchedulingEnv timed by profile_env, keyed by "<step|reset>/<method>" when called inside step/reset
+PHASES = ("take_action", "get_reward", "next_request", "update_network_values", "get_state", "get_info",
+          "save_episode_results", "load_episode_traces", "load_node_traces", "get_start_index",
+          "apply_trace_window", "open_trace_cursors", "action_masks")
+TOP_LEVEL_PHASES = ("step", "reset")
+
+
+def summarize(histogram: LatencyHistogram) -> dict:
+    return {
+        "count": histogram.count,
+        "total_s": histogram.total,
+        "mean_us": histogram.mean() * 1e6,
+        "p50_us": histogram.percentile(50) * 1e6,
+        "p99_us": histogram.percentile(99) * 1e6,
+        "max_us": histogram.max * 1e6,
+    }
+
+
+class PhaseProfiler:
+    """Per-phase latency histograms, filled by the functions wrapped with timed()."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.context = ""
+
+    def record(self, phase: str, seconds: float) -> None:
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def timed(self, fn: Callable, name: str, top_level: bool = False) -> Callable:
+        """
+        Wraps fn to record its duration. Top-level functions (step, reset) set the context, so that the phases
+        they call are recorded as "<context>/<name>".
+        """
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            if top_level:
+                previous, self.context = self.context, name
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.context = previous
+                    self.record(name, perf_counter() - start)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(self.context + "/" + name if self.context else name, perf_counter() - start)
+
+        return wrapper
+
+    def clear(self) -> None:
+        self.histograms = {}
+
+    def summary(self) -> dict:
+        """Per-phase stats; phases also report their share of the time of their context (step or reset)."""
+        summary = {phase: summarize(h) for phase, h in sorted(self.histograms.items())}
+        for phase, stats in summary.items():
+            context = phase.split("/")[0]
+            if "/" in phase and context in summary and summary[context]["total_s"] > 0:
+                stats["share"] = stats["total_s"] / summary[context]["total_s"]
+        return summary
+
+
+def profile_env(env: gym.Env, profiler: Optional[PhaseProfiler] = None,
+                phases: Sequence[str] = PHASES) -> PhaseProfiler:
+    """
+    Times the phases of the NNESchedulingEnv under env (wrappers included) by wrapping its bound methods on
+    the instance: envs that are not profiled pay nothing.
+    """
+    profiler = profiler if profiler is not None else PhaseProfiler()
+    base = env.unwrapped
+    for name in phases:
+        if hasattr(base, name):
+            setattr(base, name, profiler.timed(getattr(base, name), name))
+    for name in TOP_LEVEL_PHASES:
+        setattr(base, name, profiler.timed(getattr(base, name), name, top_level=True))
+    return profiler
+
+
+def benchmark_env(num_nodes: int, factor: float, arrival_rate: float, n_steps: int = 1000, seed: int = 1,
+                  **env_kwargs) -> dict:
+    """
+    Steps an NNESchedulingEnv with a random valid policy and reports steps/sec (wall time, resets included) and
+    the per-phase breakdown. The env's INFO logging is disabled meanwhile, since it would dominate the timings.
+    """
+    env = NNESchedulingEnv(num_nodes=num_nodes, factor=factor, arrival_rate_r=arrival_rate, seed=seed,
+                           **env_kwargs)
+    profiler = profile_env(env)
+    rng = np.random.default_rng(seed)
+
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        env.reset()
+        resets = 1
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            action = rng.choice(np.flatnonzero(env.action_masks()))
+            _, _, done, _ = env.step(action)
+            if done:
+                env.reset()
+                resets += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        logging.getLogger().setLevel(level)
+        env.close()
+
+    return {
+        "num_nodes": num_nodes,
+        "factor": factor,
+        "arrival_rate": arrival_rate,
+        "steps": n_steps,
+        "resets": resets,
+        "elapsed_s": elapsed,
+        "steps_per_sec": n_steps / elapsed,
+        "phases": profiler.summary(),
+        "telemetry_cache": get_telemetry_cache().stats(),
+    }
@@ -0,0 +1,136 @@
+import io
+import logging
+import time
+from copy import deepcopy
+from typing import Optional
+import numpy as np
+import torch
+from torch import nn
+from envs.nne_scheduling_env import NNESchedulingEnv, SEED, NUM_PROVIDERS, NUM_INTERFACES, NUM_METRICS_NODES, \
+    NUM_METRICS_REQUEST
+from envs.deep_sets_agent_original import MLPAgent, DeepSetAgent, EquivariantDeepSet, InvariantDeepSet, \
+    split_validity, HUGE_NEG
+from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+
+
+def quantize_dynamic(model: nn.Module, engine: Optional[str] = None) -> nn.Module:
+    """
+    Post-training dynamic int8 quantization of every nn.Linear (including the Lambda / Gamma projections of
+    the EquivariantLayers): weights are stored in int8, activations are quantized on the fly.
+    engine: "fbgemm" (x86) or "qnnpack" (ARM); the torch default if None. The model itself is not modified.
+    """
+    if engine is not None:
+        torch.backends.quantized.engine = engine
+    model = deepcopy(model).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def model_size(model: nn.Module) -> int:
+    """Size in bytes of the serialized state_dict."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def action_scores(model: nn.Module, obs: torch.Tensor) -> torch.Tensor:
+    """Per-action scores (logits or Q-values) of the supported policies."""
+    if isinstance(model, DeepSetAgent):
+        return model.actor(*split_validity(obs, model.in_channels))
+    if isinstance(model, DQNDeepSetAgent):
+        return model(obs)
+    if isinstance(model, MLPAgent):
+        return model.actor(torch.flatten(obs, start_dim=1))
+    if isinstance(model, EquivariantDeepSet):
+        return model(obs)
+    raise ValueError("Unsupported policy: {}".format(type(model).__name__))
+
+
+def act(model: nn.Module, obs: np.ndarray, masks: np.ndarray) -> int:
+    with torch.inference_mode():
+        scores = action_scores(model, torch.as_tensor(obs, dtype=torch.float32).unsqueeze(0))
+        scores = torch.where(torch.as_tensor(masks).unsqueeze(0), scores, torch.tensor(HUGE_NEG))
+        return int(torch.argmax(scores, dim=1))
+
+
+def measure_latency(model: nn.Module, obs: torch.Tensor, n_runs: int = 1000) -> float:
+    """Mean forward latency in microseconds for a batch of observations (the value head for InvariantDeepSet)."""
+    forward = model if isinstance(model, InvariantDeepSet) else (lambda x: action_scores(model, x))
+    with torch.inference_mode():
+        for _ in range(10):
+            forward(obs)
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            forward(obs)
+    return (time.perf_counter() - start) / n_runs * 1e6
+
+
+def run_episodes(model: nn.Module, env_kwargs: dict, n_episodes: int, reference: nn.Module = None,
+                 seed: int = SEED) -> dict:
+    """
+    Runs the test episodes with the greedy masked policy. If reference is given, also reports how often the
+    reference policy takes the same action on the visited observations.
+    Episode e is reseeded with seed + e, so that every policy faces the same node types, traces and requests,
+    whatever the draws made during the previous episodes.
+    """
+    env = NNESchedulingEnv(**env_kwargs)
+    rewards, block_probs, latencies, agreement = [], [], [], []
+    for e in range(n_episodes):
+        env.seed(seed + e)
+        obs = env.reset()
+        reward_sum, done = 0.0, False
+        while not done:
+            masks = env.action_masks()
+            start = time.perf_counter()
+            action = act(model, obs, masks)
+            latencies.append(time.perf_counter() - start)
+            if reference is not None:
+                agreement.append(action == act(reference, obs, masks))
+            obs, reward, done, info = env.step(action)
+            reward_sum += float(reward)
+        rewards.append(reward_sum)
+        block_probs.append(info["ep_block_prob"])
+    env.close()
+
+    results = {
+        "mean_reward": float(np.mean(rewards)),
+        "std_reward": float(np.std(rewards)),
+        "mean_block_prob": float(np.mean(block_probs)),
+        "mean_decision_latency_us": float(np.mean(latencies) * 1e6),
+        "p99_decision_latency_us": float(np.percentile(latencies, 99) * 1e6),
+    }
+    if reference is not None:
+        results["action_agreement"] = float(np.mean(agreement))
+    return results
+
+
+def evaluate_quantization(model: nn.Module, num_nodes: int, n_episodes: int = 10, engine: Optional[str] = None,
+                          seed: int = SEED, **env_kwargs) -> dict:
+    """
+    Compares a float policy with its dynamically quantized version on the same NNESchedulingEnv test episodes
+    (reseeded identically, hence the same requests): reward and block-probability drift, latency and memory gains.
+    """
+    quantized = quantize_dynamic(model, engine)
+    model = model.cpu().eval()
+    env_kwargs = dict(env_kwargs, num_nodes=num_nodes)
+
+    report = {
+        "float": run_episodes(model, dict(env_kwargs, file_results_name="quantization_float"), n_episodes,
+                              seed=seed),
+        "int8": run_episodes(quantized, dict(env_kwargs, file_results_name="quantization_int8"), n_episodes,
+                             reference=model, seed=seed),
+    }
+    obs = torch.zeros((1, num_nodes * NUM_PROVIDERS * NUM_INTERFACES + 1, NUM_METRICS_NODES + NUM_METRICS_REQUEST))
+    for name, m in (("float", model), ("int8", quantized)):
+        report[name]["size_bytes"] = model_size(m)
+        report[name]["forward_latency_us"] = measure_latency(m, obs)
+
+    f, q = report["float"], report["int8"]
+    report["drift"] = {
+        "reward": q["mean_reward"] - f["mean_reward"],
+        "reward_rel": (q["mean_reward"] - f["mean_reward"]) / (abs(f["mean_reward"]) + 1e-8),
+        "block_prob": q["mean_block_prob"] - f["mean_block_prob"],
+        "latency_speedup": f["forward_latency_us"] / q["forward_latency_us"],
+        "size_ratio": q["size_bytes"] / f["size_bytes"],
+    }
+    logging.info("[Quantization] {}".format(report["drift"]))
+    return report
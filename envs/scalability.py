@@ -0,0 +1,200 @@
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Callable, Optional, Sequence
+import numpy as np
+import numpy.typing as npt
+from envs.nne_scheduling_env import NNESchedulingEnv, PATH_CSV_FILES, DEFAULT_NUM_EPISODE_STEPS
+from envs.baselines import latency_greedy_policy, cost_greedy_policy, bandwidth_greedy_policy
+
+GREEDY_POLICIES = {
+    "latency_greedy": latency_greedy_policy,
+    "cost_greedy": cost_greedy_policy,
+    "bandwidth_greedy": bandwidth_greedy_policy,
+}
+RL_ALGORITHMS = ("mask_ppo", "ppo_deepsets", "dqn_deepsets")
+DEFAULT_NUM_NODES = (4, 8, 12, 16, 24, 32, 48, 64, 80, 128, 150, 180)
+DEFAULT_GRAPHS_PATH = "results/cnsm2024/graphs/scalability/"
+
+# Episode metrics of the env info (at the end of each episode) reported as episode quality
+QUALITY_KEYS = ("reward", "ep_block_prob", "avg_deployment_cost", "avg_total_latency", "avg_dl", "avg_ul", "gini")
+
+# Metrics rendered by plot_scalability: (result key, y label)
+PLOTTED_METRICS = (
+    ("steps_per_sec", "Env throughput (steps/s)"),
+    ("decision_p50_ms", "Decision latency p50 (ms)"),
+    ("decision_p99_ms", "Decision latency p99 (ms)"),
+    ("peak_rss_mb", "Peak RSS (MB)"),
+    ("reward", "Episode reward"),
+    ("ep_block_prob", "Block probability"),
+    ("avg_deployment_cost", "Deployment cost"),
+    ("avg_total_latency", "Total latency (ms)"),
+)
+
+# policy(env, obs, action_mask) -> action
+Policy = Callable[[NNESchedulingEnv, npt.NDArray, npt.NDArray], int]
+
+
+def parse_policy(spec: str) -> tuple[str, str, Optional[str]]:
+    """
+    "latency_greedy" or "<alg>:<load_path>[:<name>]" (alg in RL_ALGORITHMS) -> (name, alg, load_path).
+    """
+    if spec in GREEDY_POLICIES:
+        return spec, spec, None
+    parts = spec.split(":")
+    if len(parts) not in (2, 3) or parts[0] not in RL_ALGORITHMS:
+        raise ValueError("Invalid policy: {} (expected one of {} or <alg>:<load_path>[:<name>])".format(
+            spec, list(GREEDY_POLICIES)))
+    return (parts[2] if len(parts) == 3 else parts[0]), parts[0], parts[1]
+
+
+def load_policy(alg: str, load_path: Optional[str], env: NNESchedulingEnv) -> Policy:
+    if alg in GREEDY_POLICIES:
+        # The baselines only look at the env and the mask
+        greedy = GREEDY_POLICIES[alg]
+        return lambda e, obs, mask: int(greedy(e, mask))
+    if alg == "mask_ppo":
+        from sb3_contrib import MaskablePPO
+        model = MaskablePPO.load(load_path, device="cpu")
+        if model.observation_space.shape != env.observation_space.shape:
+            raise ValueError("MaskablePPO was trained on observations of shape {}, not {}".format(
+                model.observation_space.shape, env.observation_space.shape))
+        return lambda e, obs, mask: int(model.predict(obs, action_masks=mask, deterministic=True)[0])
+
+    # DeepSets policies do not depend on the number of endpoints
+    import torch
+    from envs.deep_sets_agent_original import DeepSetAgent
+    from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+    from envs.inference import make_inference_policy
+    agent = DeepSetAgent(env) if alg == "ppo_deepsets" else DQNDeepSetAgent(env)
+    agent.load_state_dict(torch.load(load_path, map_location="cpu"))
+    policy = make_inference_policy(agent)
+
+    def predict(e: NNESchedulingEnv, obs: npt.NDArray, mask: npt.NDArray) -> int:
+        with torch.inference_mode():
+            return int(policy(torch.as_tensor(obs, dtype=torch.float32).unsqueeze(0),
+                              torch.as_tensor(mask).unsqueeze(0))[0])
+
+    return predict
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process (ru_maxrss is in KB on Linux, in bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def run_scalability_point(spec: str, num_nodes: int, n_episodes: int,
+                          episode_length: int = DEFAULT_NUM_EPISODE_STEPS, path_csv_files: str = PATH_CSV_FILES,
+                          seed: int = 1, **env_kwargs) -> dict:
+    """
+    Runs n_episodes of one policy on one cluster size and measures the env throughput (env.step only), the
+    decision latency (policy call, masks included) and the episode quality. Meant to run in its own process,
+    so that the peak RSS is the one of this (policy, size) point only.
+    """
+    name, alg, load_path = parse_policy(spec)
+    result = {"policy": name, "alg": alg, "load_path": load_path, "num_nodes": num_nodes}
+    logging.getLogger().setLevel(logging.WARNING)
+
+    env = NNESchedulingEnv(num_nodes=num_nodes, episode_length=episode_length, path_csv_files=path_csv_files,
+                           seed=seed, file_results_name="scalability_{}_num_nodes_{}".format(name, num_nodes),
+                           **env_kwargs)
+    try:
+        policy = load_policy(alg, load_path, env)
+    except ValueError as e:
+        env.close()
+        return dict(result, skipped=str(e))
+
+    step_time, decisions, quality = 0.0, [], {key: [] for key in QUALITY_KEYS}
+    perf_counter = time.perf_counter
+    for _ in range(n_episodes):
+        obs, done, info = env.reset(), False, {}
+        while not done:
+            start = perf_counter()
+            action = policy(env, obs, env.action_masks())
+            decisions.append(perf_counter() - start)
+            start = perf_counter()
+            obs, reward, done, info = env.step(action)
+            step_time += perf_counter() - start
+        for key in QUALITY_KEYS:
+            quality[key].append(info[key])
+    env.close()
+
+    decisions = np.array(decisions) * 1e3
+    result.update({
+        "episodes": n_episodes,
+        "steps": len(decisions),
+        "steps_per_sec": len(decisions) / step_time,
+        "decision_p50_ms": float(np.percentile(decisions, 50)),
+        "decision_p99_ms": float(np.percentile(decisions, 99)),
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    for key, values in quality.items():
+        result[key] = float(np.mean(values))
+        result[key + "_ci"] = float(1.96 * np.std(values) / np.sqrt(len(values)))
+    return result
+
+
+def _run_point(kwargs: dict) -> dict:
+    return run_scalability_point(**kwargs)
+
+
+def run_scalability_suite(policies: Sequence[str], num_nodes: Sequence[int] = DEFAULT_NUM_NODES,
+                          n_episodes: int = 10, **kwargs) -> list:
+    """Runs every (policy, num_nodes) point, each in a fresh process (for a per-point peak RSS)."""
+    points = [dict(kwargs, spec=spec, num_nodes=n, n_episodes=n_episodes) for spec in policies for n in num_nodes]
+    results = []
+    # maxtasksperchild=1: one fresh process per point
+    with multiprocessing.get_context("spawn").Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(_run_point, points):
+            if "skipped" in result:
+                logging.info("[Scalability] {} | num_nodes: {} | skipped: {}".format(
+                    result["policy"], result["num_nodes"], result["skipped"]))
+            else:
+                logging.info("[Scalability] {} | num_nodes: {} | steps/sec: {:.1f} | decision p99: {:.3f} ms | "
+                             "peak RSS: {:.0f} MB | reward: {:.2f}".format(
+                                 result["policy"], result["num_nodes"], result["steps_per_sec"],
+                                 result["decision_p99_ms"], result["peak_rss_mb"], result["reward"]))
+            results.append(result)
+    return results
+
+
+def save_results(path: str, results: list, config: dict, commit: Optional[str] = None) -> None:
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config,
+                   "results": results}, f, indent=2)
+
+
+def plot_scalability(path: str, output_dir: str = DEFAULT_GRAPHS_PATH) -> list:
+    """Renders one graph per metric (metric vs. num_nodes, one line per policy) from a results file."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    with open(path) as f:
+        results = [r for r in json.load(f)["results"] if "skipped" not in r]
+    os.makedirs(output_dir, exist_ok=True)
+    policies = sorted({r["policy"] for r in results})
+
+    files = []
+    for key, label in PLOTTED_METRICS:
+        fig, ax = plt.subplots()
+        for policy in policies:
+            points = sorted((r["num_nodes"], r[key], r.get(key + "_ci", 0.0)) for r in results
+                            if r["policy"] == policy)
+            x, y, ci = (np.array(v) for v in zip(*points))
+            ax.plot(x, y, marker="o", label=policy)
+            ax.fill_between(x, y - ci, y + ci, alpha=0.2)
+        ax.set_xlabel("Number of nodes")
+        ax.set_ylabel(label)
+        ax.grid(True)
+        ax.legend()
+        file = os.path.join(output_dir, "scalability_{}.pdf".format(key))
+        fig.savefig(file, dpi=250, bbox_inches="tight")
+        plt.close(fig)
+        files.append(file)
+    return files
@@ -0,0 +1,271 @@
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Sequence
+import numpy as np
+import numpy.typing as npt
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_DELAY_MS = 2.0
+# Number of recent requests kept for the latency percentiles
+STATS_WINDOW = 10000
+
+# predict_fn(obs: (batch_size, *obs_shape), masks: (batch_size, num_actions)) -> actions: (batch_size,)
+PredictFn = Callable[[npt.NDArray, npt.NDArray], npt.NDArray]
+
+
+class _PendingRequest:
+    def __init__(self, obs: npt.NDArray, masks: npt.NDArray):
+        self.obs = obs
+        self.masks = masks
+        self.arrival = time.perf_counter()
+        self.done = threading.Event()
+        self.actions = None
+        self.error = None
+
+
+class LatencyStats:
+    """Latency percentiles (over the last STATS_WINDOW requests) and throughput since start."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.batch_sizes = deque(maxlen=STATS_WINDOW)
+        self.n_requests = 0
+        self.n_decisions = 0
+        self.start = time.perf_counter()
+
+    def add_batch(self, latencies: list, n_decisions: int) -> None:
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+            self.n_requests += len(latencies)
+            self.n_decisions += n_decisions
+
+    def summary(self) -> dict:
+        with self.lock:
+            latencies = np.array(self.latencies) * 1e3
+            elapsed = time.perf_counter() - self.start
+            summary = {
+                "requests": self.n_requests,
+                "decisions": self.n_decisions,
+                "throughput_rps": self.n_requests / elapsed,
+                "throughput_decisions_per_s": self.n_decisions / elapsed,
+                "mean_batch_size": float(np.mean(self.batch_sizes)) if len(self.batch_sizes) > 0 else 0.0,
+            }
+        for p in (50, 99):
+            summary["p{}_ms".format(p)] = float(np.percentile(latencies, p)) if len(latencies) > 0 else 0.0
+        return summary
+
+
+class MicroBatcher:
+    """
+    Groups concurrent requests into one forward pass: the batch is closed as soon as it reaches
+    max_batch_size decisions, or max_delay_ms after its first request arrived.
+    """
+
+    def __init__(self, predict_fn: PredictFn, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_delay_ms: float = DEFAULT_MAX_DELAY_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1e3
+        self.requests = queue.Queue()
+        self.stats = LatencyStats()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, obs: npt.NDArray, masks: npt.NDArray, timeout: Optional[float] = None) -> npt.NDArray:
+        """Blocks until the actions for a (n, *obs_shape) batch of observations are ready."""
+        request = _PendingRequest(obs, masks)
+        self.requests.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Placement decision not ready after {} s".format(timeout))
+        if request.error is not None:
+            raise request.error
+        return request.actions
+
+    def _collect(self) -> list:
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch, size = [first], len(first.obs)
+        deadline = first.arrival + self.max_delay
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.running = False
+                break
+            batch.append(request)
+            size += len(request.obs)
+        return batch
+
+    def _loop(self) -> None:
+        while self.running:
+            batch = self._collect()
+            if len(batch) == 0:
+                break
+            try:
+                actions = self.predict_fn(np.concatenate([r.obs for r in batch]),
+                                          np.concatenate([r.masks for r in batch]))
+                offset = 0
+                for r in batch:
+                    r.actions = actions[offset:offset + len(r.obs)]
+                    offset += len(r.obs)
+            except Exception as e:
+                logging.exception("[Service] Prediction failed")
+                for r in batch:
+                    r.error = e
+            now = time.perf_counter()
+            for r in batch:
+                r.done.set()
+            self.stats.add_batch([now - r.arrival for r in batch], sum(len(r.obs) for r in batch))
+
+    def close(self) -> None:
+        self.requests.put(None)
+        self.thread.join(timeout=5)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """POST /predict {"obs": [...], "masks": [...]} -> {"actions": [...]}; GET /stats -> latency/throughput."""
+
+    batcher: MicroBatcher = None
+    # Expected shape of one observation and number of actions (not checked if None)
+    obs_shape: Optional[tuple] = None
+    num_actions: Optional[int] = None
+
+    def _reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._reply(200, self.batcher.stats.summary())
+        else:
+            self._reply(404, {"error": "unknown path"})
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self._reply(404, {"error": "unknown path"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            obs = np.asarray(body["obs"], dtype=np.float32)
+            masks = np.asarray(body["masks"], dtype=bool)
+            # A single observation is accepted as well as a batch
+            single = obs.ndim == 2
+            if single:
+                obs, masks = obs[None], masks[None]
+            self._check_shapes(obs, masks)
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        try:
+            actions = self.batcher.submit(obs, masks)
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        actions = np.asarray(actions).astype(int).tolist()
+        self._reply(200, {"actions": actions[0] if single else actions})
+
+    def _check_shapes(self, obs: npt.NDArray, masks: npt.NDArray) -> None:
+        """Malformed requests are rejected here: in the micro-batch, they would fail the requests batched with them."""
+        if obs.ndim != 3 or (self.obs_shape is not None and obs.shape[1:] != self.obs_shape):
+            raise ValueError("Invalid obs shape {}, expected (n,) + {}".format(obs.shape, self.obs_shape))
+        if masks.ndim != 2 or masks.shape[0] != obs.shape[0] or \
+                (self.num_actions is not None and masks.shape[1] != self.num_actions):
+            raise ValueError("Invalid masks shape {}, expected ({}, {})".format(masks.shape, len(obs),
+                                                                              self.num_actions))
+
+    def log_message(self, format, *args) -> None:
+        # Per-request access logs would dominate the decision latency
+        pass
+
+
+class PlacementService:
+    """Long-running HTTP placement service on top of a MicroBatcher."""
+
+    def __init__(self, predict_fn: PredictFn, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_delay_ms: float = DEFAULT_MAX_DELAY_MS,
+                 obs_shape: Optional[Sequence[int]] = None, num_actions: Optional[int] = None):
+        """obs_shape (of one observation) and num_actions: if given, requests of other shapes get a 400."""
+        self.batcher = MicroBatcher(predict_fn, max_batch_size=max_batch_size, max_delay_ms=max_delay_ms)
+        handler = type("PlacementHandler", (_Handler,), {
+            "batcher": self.batcher,
+            "obs_shape": tuple(obs_shape) if obs_shape is not None else None,
+            "num_actions": num_actions,
+        })
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def serve_forever(self) -> None:
+        logging.info("[Service] Listening on {}".format(self.address))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def start(self) -> None:
+        """Serves in a background thread (e.g., for load tests in the same process)."""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.close()
+
+
+def load_test(url: str, obs: npt.NDArray, masks: npt.NDArray, n_requests: int = 1000,
+              concurrency: int = 16) -> dict:
+    """
+    Sends n_requests single-observation requests (cycling over obs/masks) from concurrency client threads.
+    Returns the client-side latency percentiles and throughput, plus the server-side stats.
+    """
+    payloads = [json.dumps({"obs": o.tolist(), "masks": m.tolist()}).encode() for o, m in zip(obs, masks)]
+
+    def send(i: int) -> float:
+        start = time.perf_counter()
+        request = urllib.request.Request(url + "/predict", data=payloads[i % len(payloads)],
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(send, range(n_requests)))) * 1e3
+    elapsed = time.perf_counter() - start
+
+    with urllib.request.urlopen(url + "/stats") as response:
+        server = json.loads(response.read())
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "throughput_rps": n_requests / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "server": server,
+    }
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Default memory budget of the per-process telemetry cache
+DEFAULT_TELEMETRY_CACHE_BYTES = 512 * 2 ** 20
+
+
+class TelemetryCache:
+    """
+    LRU cache of the node telemetry files (DataFrames keyed by path) bounded by a memory budget in bytes.
+    Cached DataFrames are shared by every env of the process, so they must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_TELEMETRY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # path -> (DataFrame, size in bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> pd.DataFrame:
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Loaded outside the lock: a concurrent miss on the same file only costs a duplicate read
+        df = pd.read_csv(path)
+        size = int(df.memory_usage(deep=True).sum())
+        with self.lock:
+            # Files larger than the whole budget are not cached
+            if size <= self.max_bytes and path not in self.entries:
+                self.entries[path] = (df, size)
+                self.bytes += size
+                self.evict(self.max_bytes)
+        return df
+
+    # Drops the least recently used files until the cache fits in max_bytes (lock held by the caller)
+    def evict(self, max_bytes: int) -> None:
+        while self.bytes > max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_bytes: int) -> None:
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict(max_bytes)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            }
+
+
+# Shared by all the envs of a process (each SubprocVecEnv worker has its own)
+_telemetry_cache = TelemetryCache()
+
+
+def get_telemetry_cache() -> TelemetryCache:
+    return _telemetry_cache
+
+
+def set_telemetry_cache_budget(max_bytes: int) -> None:
+    """Sets the memory budget of the process-wide cache, evicting files if it shrinks."""
+    _telemetry_cache.resize(max_bytes)
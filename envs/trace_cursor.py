@@ -0,0 +1,87 @@
+from typing import Callable, Optional, Sequence
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+# Rows read from a telemetry file at a time
+DEFAULT_TRACE_CHUNK_SIZE = 1024
+
+
+def scan_trace(file: str, columns: Sequence[str], chunk_size: int = DEFAULT_TRACE_CHUNK_SIZE) -> tuple[int, set]:
+    """Number of rows of a telemetry file and the distinct tuples of its columns, read chunk by chunk."""
+    rows, values = 0, set()
+    for chunk in pd.read_csv(file, usecols=list(columns), chunksize=chunk_size):
+        rows += len(chunk)
+        values.update(chunk.itertuples(index=False, name=None))
+    return rows, values
+
+
+def read_trace_value(file: str, column: str, row: int):
+    """Value of column at a given row of a telemetry file, without loading the rows before it."""
+    return pd.read_csv(file, usecols=[column], skiprows=range(1, row + 1), nrows=1).at[0, column]
+
+
+class TraceCursor:
+    """
+    Streams the values of some columns of a node's telemetry, chunk_size rows at a time, from its first row with
+    ts >= start_ts on. When a file ends, the cursor continues with next_file(). Only the current chunk is kept
+    in memory, so episodes are not limited by the length of the files.
+    """
+
+    def __init__(self, file: str, columns: Sequence[str], next_file: Callable[[], str],
+                 start_ts: Optional[float] = None, chunk_size: int = DEFAULT_TRACE_CHUNK_SIZE):
+        self.columns = list(columns)
+        self.next_file = next_file
+        self.chunk_size = chunk_size
+        self.reader = None
+        self.files_read = 0
+        # Rows streamed since the start (across files), and position of that row in the current chunk
+        self.row = 0
+        self.position = 0
+        self.open(file, start_ts)
+
+    def open(self, file: str, start_ts: Optional[float] = None) -> None:
+        self.close()
+        self.file = file
+        self.start_ts = start_ts
+        self.files_read += 1
+        self.reader = pd.read_csv(file, usecols=["ts"] + self.columns, chunksize=self.chunk_size)
+        self.chunk = np.empty((0, len(self.columns)))
+        if not self.load_chunk():
+            if start_ts is None:
+                raise ValueError("Telemetry file {} has no rows".format(file))
+            # No rows after start_ts: start with the next file
+            self.open(self.next_file())
+
+    def load_chunk(self) -> bool:
+        for df in self.reader:
+            if self.start_ts is not None:
+                df = df[df["ts"] >= self.start_ts]
+                if len(df) == 0:
+                    continue
+                self.start_ts = None
+            self.chunk = df[self.columns].to_numpy(dtype=np.float64)
+            return True
+        return False
+
+    @property
+    def value(self) -> npt.NDArray:
+        """Values of the columns at the current row."""
+        return self.chunk[self.position]
+
+    def advance_to(self, row: int) -> None:
+        """Moves forward to a row (counted from the start); the cursor cannot go back."""
+        if row < self.row:
+            raise ValueError("TraceCursor cannot go back from row {} to row {}".format(self.row, row))
+        self.position += row - self.row
+        self.row = row
+        while self.position >= len(self.chunk):
+            self.position -= len(self.chunk)
+            if not self.load_chunk():
+                # End of the file: continue with the next one
+                self.open(self.next_file())
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -1,8 +1,15 @@
 import csv
+import os
+import subprocess
 from dataclasses import dataclass
 import numpy as np
 import numpy.typing as npt
 
+# Decision latency csv (kept apart from the results csv, whose columns are read by the plotting scripts)
+DECISION_LATENCY_PERCENTILES = (50, 95, 99)
+DECISION_LATENCY_FIELDS = ['episode', 'decisions'] + \
+                          ['decision_latency_p{}_ms'.format(q) for q in DECISION_LATENCY_PERCENTILES]
+
 
 # DeploymentRequest Info
 @dataclass
@@ -30,6 +37,16 @@ class DeploymentRequest:
     expected_processing_latency: int = None  # expected processing latency
 
 
+# Telemetry traces of one episode, per endpoint (see NNESchedulingEnv.prepare_trace_window)
+@dataclass
+class TraceWindow:
+    node_csv_data: list  # file of each endpoint
+    df_node: list  # whole telemetry of each endpoint
+    df_node_selected_rows: list  # telemetry from the start timestamp of the episode on
+    action_valid: list  # whether the provider and interface of each endpoint exist in its file
+    selected_ts: float  # start timestamp of the episode
+
+
 # Reverses a dict
 def sort_dict_by_value(d, reverse=False):
     return dict(sorted(d.items(), key=lambda x: x[1], reverse=reverse))
@@ -182,6 +199,19 @@ def save_obs_to_csv(file_name, timestamp, num_pods, desired_replicas, cpu_usage,
 '''
 
 
+def save_decision_latency_to_csv(file_name, episode, decision_latency):
+    """Appends the decision latency percentiles (ms) of a LatencyHistogram, with a header if the file is new."""
+    new_file = not os.path.exists(file_name) or os.path.getsize(file_name) == 0
+    with open(file_name, 'a+', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=DECISION_LATENCY_FIELDS)
+        if new_file:
+            writer.writeheader()
+        row = {'episode': episode, 'decisions': decision_latency.count}
+        for q, field in zip(DECISION_LATENCY_PERCENTILES, DECISION_LATENCY_FIELDS[2:]):
+            row[field] = float("{:.3f}".format(decision_latency.percentile(q) * 1e3))
+        writer.writerow(row)
+
+
 def save_to_csv(file_name, episode, reward, ep_block_prob, ep_accepted_requests, avg_deployment_cost, avg_total_latency,
                 avg_access_latency, avg_proc_latency,
                 avg_rtt, avg_dl, avg_ul, avg_jitter, gini, telia_requests, telenor_requests, ice_requests,
@@ -230,3 +260,11 @@ def calculate_gini_coefficient(loads):
     gini_coefficient = gini_numerator / (2 * n ** 2 * mean_load)
 
     return gini_coefficient
+
+
+def get_git_commit():
+    """Commit of the working tree (to tag benchmark results), or None outside of a git checkout."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,162 @@
+import multiprocessing as mp
+from typing import Callable, List, Optional
+import gym
+import numpy as np
+import numpy.typing as npt
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv, _flatten_obs
+
+ACTION_MASKS_METHOD = "action_masks"
+DECISION_LATENCY_METHOD = "record_decision_latency"
+
+
+def get_action_mask_size(action_space: gym.spaces.Space) -> int:
+    """
+    Length of an env's action masks: one flag per action for Discrete spaces, one flag per value of each
+    dimension for MultiDiscrete spaces (the sb3_contrib layout), unless the space defines its own mask_size
+    (e.g., the NodeEndpointSpace of HierarchicalNodeAction).
+    """
+    if hasattr(action_space, "mask_size"):
+        return action_space.mask_size
+    if isinstance(action_space, gym.spaces.MultiDiscrete):
+        return int(np.sum(action_space.nvec))
+    return action_space.n
+
+
+def _masked_worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper) -> None:
+    """Same protocol as SB3's SubprocVecEnv worker, but step/reset also send back the action masks."""
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "timed_step":
+                # The decision latency of the action comes with it
+                action, latency = data
+                getattr(env, DECISION_LATENCY_METHOD)(latency)
+                cmd, data = "step", action
+            if cmd == "step":
+                observation, reward, done, info = env.step(data)
+                if done:
+                    # save final observation where user can get it, then reset
+                    info["terminal_observation"] = observation
+                    observation = env.reset()
+                remote.send((observation, reward, done, info, env.action_masks()))
+            elif cmd == "reset":
+                observation = env.reset()
+                remote.send((observation, env.action_masks()))
+            elif cmd == "seed":
+                remote.send(env.seed(data))
+            elif cmd == "render":
+                remote.send(env.render(data))
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "env_method":
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(getattr(env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except EOFError:
+            break
+
+
+class MaskedSubprocVecEnv(SubprocVecEnv):
+    """
+    SubprocVecEnv whose workers return the action masks in the same message as the observation.
+    The masks are cached in the main process, so env_method("action_masks") (used by the DeepSets
+    algorithms and by sb3_contrib's get_action_masks) no longer costs a second pipe round-trip per step.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            # Fork is not a thread safe method (see issue #217)
+            # but is more user friendly (does not require to wrap the code in
+            # a `if __name__ == "__main__":`)
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(self.work_remotes, self.remotes, env_fns):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn))
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_masked_worker, args=args, daemon=True)  # pytype:disable=attribute-error
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        VecEnv.__init__(self, len(env_fns), observation_space, action_space)
+        self._masks = [np.ones(get_action_mask_size(action_space), dtype=bool) for _ in range(n_envs)]
+        self._decision_latency = None
+
+    def record_decision_latency(self, seconds: float) -> None:
+        """Sends the decision latency to the envs with the next actions, without an extra round-trip."""
+        self._decision_latency = seconds
+
+    def step_async(self, actions: npt.NDArray) -> None:
+        if self._decision_latency is None:
+            super().step_async(actions)
+            return
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("timed_step", (action, self._decision_latency)))
+        self.waiting = True
+        self._decision_latency = None
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        obs, rews, dones, infos, masks = zip(*results)
+        self._masks = list(masks)
+        return _flatten_obs(obs, self.observation_space), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        results = [remote.recv() for remote in self.remotes]
+        obs, masks = zip(*results)
+        self._masks = list(masks)
+        return _flatten_obs(obs, self.observation_space)
+
+    def action_masks(self) -> npt.NDArray:
+        """Returns the masks received with the last observations, shape (num_envs, num_actions)."""
+        return np.stack(self._masks)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List:
+        if method_name == ACTION_MASKS_METHOD and not method_args and not method_kwargs:
+            return [self._masks[i] for i in self._get_indices(indices)]
+        return super().env_method(method_name, *method_args, indices=indices, **method_kwargs)
+
+
+def record_vec_decision_latency(env: VecEnv, seconds: float) -> None:
+    """Records the decision latency of the next actions in every env of a VecEnv."""
+    try:
+        env.record_decision_latency(seconds)
+    except AttributeError:
+        env.env_method(DECISION_LATENCY_METHOD, seconds)
+
+
+def get_vec_action_masks(env: VecEnv) -> npt.NDArray:
+    """Returns the stacked action masks of a VecEnv, using the cached ones if the env delivers them."""
+    try:
+        return env.action_masks()
+    except AttributeError:
+        return np.stack(env.env_method(ACTION_MASKS_METHOD))
@@ -0,0 +1,226 @@
+from types import SimpleNamespace
+import gym
+import numpy as np
+import numpy.typing as npt
+from gym import spaces
+from envs.nne_scheduling_env import NNESchedulingEnv, NUM_PROVIDERS, NUM_INTERFACES, NUM_METRICS_NODES, \
+    NUM_METRICS_REQUEST, DEFAULT_NODE_TYPES, MIN_OBS, MAX_OBS
+from envs.batch_admission import BatchAdmissionEnv
+
+# Provider/interface endpoints per physical node
+ENDPOINTS_PER_NODE = NUM_PROVIDERS * NUM_INTERFACES
+
+
+def get_num_elements(num_nodes: int) -> int:
+    """Number of set elements (endpoints + the reject element) of an NNESchedulingEnv."""
+    return num_nodes * ENDPOINTS_PER_NODE + 1
+
+
+def get_env_spaces(num_nodes: int) -> SimpleNamespace:
+    """
+    Observation and action spaces of an NNESchedulingEnv, without building one (which loads its telemetry).
+    Stands in for the env where only its spaces are read, e.g. to build an agent before loading its weights.
+    """
+    num_elements = get_num_elements(num_nodes)
+    observation_space = spaces.Box(low=MIN_OBS, high=MAX_OBS,
+                                   shape=(num_elements, NUM_METRICS_NODES + NUM_METRICS_REQUEST), dtype=np.float32)
+    return SimpleNamespace(observation_space=observation_space, action_space=spaces.Discrete(num_elements))
+
+
+class PaddedSetObservation(gym.Wrapper):
+    """
+    Pads the (total_number + 1, 15) observation of an env to (max_elements, 16) so that envs with different
+    num_nodes share the same spaces (and hence the same vec env and rollout buffer). The extra last column
+    is the validity flag of each element (1 for real rows, 0 for padding), used by the DeepSet agents to
+    ignore padding in their pooling. Padding actions are always masked out, so actions keep their ids; if one is
+    taken anyway (e.g., by an unmasked rollout), it is mapped to reject.
+    """
+
+    def __init__(self, env: gym.Env, max_elements: int):
+        super().__init__(env)
+        self.n_elements, self.n_features = env.observation_space.shape
+        if self.n_elements > max_elements:
+            raise ValueError("The env has {} elements, more than max_elements={}".format(self.n_elements,
+                                                                                       max_elements))
+        self.max_elements = max_elements
+        self.observation_space = spaces.Box(low=min(float(np.min(env.observation_space.low)), 0.0),
+                                            high=max(float(np.max(env.observation_space.high)), 1.0),
+                                            shape=(max_elements, self.n_features + 1),
+                                            dtype=env.observation_space.dtype)
+        self.action_space = spaces.Discrete(max_elements)
+        self._obs = np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+        self._obs[:self.n_elements, self.n_features] = 1
+
+    def observation(self, obs: npt.NDArray) -> npt.NDArray:
+        self._obs[:self.n_elements, :self.n_features] = obs
+        return self._obs.copy()
+
+    def reset(self, **kwargs):
+        return self.observation(self.env.reset(**kwargs))
+
+    def step(self, action):
+        # The reject element is the last real row
+        if action >= self.n_elements:
+            action = self.n_elements - 1
+        obs, reward, done, info = self.env.step(action)
+        return self.observation(obs), reward, done, info
+
+    def action_masks(self) -> npt.NDArray:
+        masks = np.zeros(self.max_elements, dtype=bool)
+        masks[:self.n_elements] = self.env.action_masks()
+        return masks
+
+
+def pareto_dominated(rtt: npt.NDArray, dl: npt.NDArray, cost: npt.NDArray) -> npt.NDArray:
+    """
+    Whether each endpoint is Pareto-dominated on (rtt min, dl max, cost min), in O(L n log n) for L cost levels.
+    Endpoint p is dominated by q if q is at least as good on every objective and strictly better on one.
+    """
+    dominated = np.zeros(len(rtt), dtype=bool)
+    for c in np.unique(cost):
+        level = np.flatnonzero(cost == c)
+        r, d = rtt[level], dl[level]
+
+        # Cheaper endpoints only need to be at least as good on rtt and dl
+        cheaper = np.flatnonzero(cost < c)
+        if len(cheaper) > 0:
+            order = np.argsort(rtt[cheaper], kind="stable")
+            sorted_rtt = rtt[cheaper][order]
+            best_dl = np.maximum.accumulate(dl[cheaper][order])
+            idx = np.searchsorted(sorted_rtt, r, side="right")
+            dominated[level] |= (idx > 0) & (best_dl[np.maximum(idx - 1, 0)] >= d)
+
+        # Same cost: strictly better rtt (and at least as good dl), or at least as good rtt and strictly better dl
+        order = np.argsort(r, kind="stable")
+        sorted_rtt = r[order]
+        best_dl = np.maximum.accumulate(d[order])
+        idx = np.searchsorted(sorted_rtt, r, side="left")
+        dominated[level] |= (idx > 0) & (best_dl[np.maximum(idx - 1, 0)] >= d)
+        idx = np.searchsorted(sorted_rtt, r, side="right")
+        dominated[level] |= (idx > 0) & (best_dl[np.maximum(idx - 1, 0)] > d)
+    return dominated
+
+
+class TopKCandidateObservation(gym.Wrapper):
+    """
+    Observes only k candidate endpoints (plus the reject element), so that the policy input, the action space and
+    the IPC volume do not grow with the cluster size. Candidates are ranked by a cheap pre-filter: feasible
+    endpoints first (action mask), then the Pareto front on (rtt, dl, cost), then the lowest rtt. If fewer than k
+    endpoints are feasible, the remaining slots hold infeasible (masked) endpoints. Action i < k is mapped back to
+    the global endpoint id of the i-th candidate, action k to reject.
+    """
+
+    def __init__(self, env: gym.Env, k: int):
+        super().__init__(env)
+        self.total_number = env.unwrapped.total_number
+        if k > self.total_number:
+            raise ValueError("k={} is larger than the number of endpoints ({})".format(k, self.total_number))
+        self.k = k
+        n_features = env.observation_space.shape[1]
+        self.observation_space = spaces.Box(low=env.observation_space.low.min(), high=env.observation_space.high.max(),
+                                            shape=(k + 1, n_features), dtype=env.observation_space.dtype)
+        self.action_space = spaces.Discrete(k + 1)
+        self.candidates = np.arange(k)
+        self._feasible = np.zeros(self.total_number, dtype=bool)
+        self._cost = np.zeros(self.total_number)
+
+    def _update_static(self) -> None:
+        # Costs only depend on the node types, which only change at reset
+        base = self.env.unwrapped
+        self._cost = np.array([DEFAULT_NODE_TYPES[t]['cost'] for t in base.node_type], dtype=np.float64)
+
+    def _select(self, obs: npt.NDArray) -> npt.NDArray:
+        base = self.env.unwrapped
+        self._feasible = self.env.action_masks()[:self.total_number]
+        dominated = np.ones(self.total_number, dtype=bool)
+        feasible = np.flatnonzero(self._feasible)
+        if len(feasible) > 0:
+            dominated[feasible] = pareto_dominated(base.rtt[feasible], base.dl[feasible], self._cost[feasible])
+        # np.lexsort sorts by the last key first
+        ranking = np.lexsort((base.rtt, dominated, ~self._feasible))
+        self.candidates = ranking[:self.k]
+        return np.concatenate([obs[self.candidates], obs[self.total_number:]], axis=0)
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self._update_static()
+        return self._select(obs)
+
+    def step(self, action):
+        action = int(action)
+        global_action = int(self.candidates[action]) if action < self.k else self.total_number
+        obs, reward, done, info = self.env.step(global_action)
+        return self._select(obs), reward, done, info
+
+    def action_masks(self) -> npt.NDArray:
+        return np.append(self._feasible[self.candidates], True)
+
+
+class NodeEndpointSpace(spaces.MultiDiscrete):
+    """
+    MultiDiscrete([num_nodes + 1, ENDPOINTS_PER_NODE]) whose action masks are the node masks followed by the
+    endpoint masks of every node (the endpoint choice depends on the node), instead of one flag per dimension value.
+    """
+
+    def __init__(self, num_nodes: int):
+        super().__init__([num_nodes + 1, ENDPOINTS_PER_NODE])
+        self.num_nodes = num_nodes
+
+    @property
+    def mask_size(self) -> int:
+        return self.num_nodes + 1 + self.num_nodes * ENDPOINTS_PER_NODE
+
+
+class HierarchicalNodeAction(gym.Wrapper):
+    """
+    Two-level action: first a physical node (or reject, action num_nodes), then one of its ENDPOINTS_PER_NODE
+    provider/interface endpoints, as a NodeEndpointSpace. The observation has one
+    row per node, its endpoints' metrics flattened, plus the reject row; the request columns are kept on every row:
+    (num_nodes + 1, ENDPOINTS_PER_NODE * NUM_METRICS_NODES + NUM_METRICS_REQUEST).
+    action_masks() returns the node masks (num_nodes + 1) followed by the per-node endpoint masks
+    (num_nodes * ENDPOINTS_PER_NODE); a node is valid if any of its endpoints is.
+    """
+
+    def __init__(self, env: gym.Env):
+        super().__init__(env)
+        self.total_number = env.unwrapped.total_number
+        self.num_nodes = self.total_number // ENDPOINTS_PER_NODE
+        n_features = ENDPOINTS_PER_NODE * NUM_METRICS_NODES + env.observation_space.shape[1] - NUM_METRICS_NODES
+        self.observation_space = spaces.Box(low=env.observation_space.low.min(), high=env.observation_space.high.max(),
+                                            shape=(self.num_nodes + 1, n_features),
+                                            dtype=env.observation_space.dtype)
+        self.action_space = NodeEndpointSpace(self.num_nodes)
+        self._obs = np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+
+    def observation(self, obs: npt.NDArray) -> npt.NDArray:
+        node_columns = ENDPOINTS_PER_NODE * NUM_METRICS_NODES
+        self._obs[:self.num_nodes, :node_columns] = obs[:self.total_number, :NUM_METRICS_NODES].reshape(
+            self.num_nodes, node_columns)
+        # Reject row: the env's sentinel value in every node column
+        self._obs[self.num_nodes, :node_columns] = obs[self.total_number, 0]
+        self._obs[:, node_columns:] = obs[self.total_number, NUM_METRICS_NODES:]
+        return self._obs.copy()
+
+    def reset(self, **kwargs):
+        return self.observation(self.env.reset(**kwargs))
+
+    def step(self, action):
+        node, endpoint = int(action[0]), int(action[1])
+        global_action = node * ENDPOINTS_PER_NODE + endpoint if node < self.num_nodes else self.total_number
+        obs, reward, done, info = self.env.step(global_action)
+        return self.observation(obs), reward, done, info
+
+    def action_masks(self) -> npt.NDArray:
+        endpoint_masks = self.env.action_masks()[:self.total_number]
+        node_masks = np.append(endpoint_masks.reshape(self.num_nodes, ENDPOINTS_PER_NODE).any(axis=1), True)
+        return np.concatenate([node_masks, endpoint_masks])
+
+
+def make_env(top_k: int = 0, hierarchical: bool = False, requests_per_step: int = 1, **kwargs) -> gym.Env:
+    """NNESchedulingEnv (kwargs) in one of the observation/action modes above, or a BatchAdmissionEnv."""
+    if requests_per_step > 1:
+        return BatchAdmissionEnv(requests_per_step=requests_per_step, **kwargs)
+    env = NNESchedulingEnv(**kwargs)
+    if top_k > 0:
+        env = TopKCandidateObservation(env, top_k)
+    return HierarchicalNodeAction(env) if hierarchical else env
@@ -0,0 +1,56 @@
+import logging
+import argparse
+import sys
+
+import torch
+from sb3_contrib import MaskablePPO
+
+from envs.deep_sets_agent_original import DeepSetAgent
+from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+from envs.export import export_policy, check_parity
+from envs.wrappers import get_env_spaces
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+parser = argparse.ArgumentParser(description='Export a trained policy to ONNX and NumPy')
+parser.add_argument('--alg', default='mask_ppo', help='The algorithm: ["mask_ppo", "ppo_deepsets", "dqn_deepsets"]')
+parser.add_argument('--num_nodes', default=4, help='num_nodes: 4, 6, 8, etc')
+parser.add_argument('--load_path', required=True,
+                    help='MaskablePPO zip, or state_dict saved by PPO_DeepSets.save / DQN_DeepSets.save')
+parser.add_argument('--output', required=True, help='Output path prefix, ex: results/export/policy')
+parser.add_argument('--no_onnx', default=False, action="store_true", help='Only export the NumPy policy')
+parser.add_argument('--check', default=False, action="store_true", help='Check parity against the torch model')
+
+args = parser.parse_args()
+
+
+def load_model(alg, env, load_path):
+    if alg == 'mask_ppo':
+        return MaskablePPO.load(load_path, device='cpu')
+    elif alg == 'ppo_deepsets':
+        agent = DeepSetAgent(env)
+    elif alg == 'dqn_deepsets':
+        agent = DQNDeepSetAgent(env)
+    else:
+        raise ValueError('Invalid algorithm: {}'.format(alg))
+    agent.load_state_dict(torch.load(load_path, map_location='cpu'))
+    return agent
+
+
+if __name__ == "__main__":
+    # Only the spaces of the env are needed: no env (and telemetry) is built
+    env = get_env_spaces(int(args.num_nodes))
+    observation_shape = env.observation_space.shape
+    num_actions = env.action_space.n
+
+    model = load_model(args.alg, env, args.load_path)
+    export_policy(model, observation_shape, num_actions, args.output, onnx=not args.no_onnx)
+
+    if args.check:
+        report = check_parity(model, args.output, observation_shape, num_actions)
+        for name, result in report.items():
+            print(f"{name}: max_abs_diff={result['max_abs_diff']:.2e}, "
+                  f"action_agreement={result['action_agreement']:.4f}, ok={result['ok']}")
+        if not all(result["ok"] for result in report.values()):
+            sys.exit(1)
@@ -0,0 +1,47 @@
+import logging
+import argparse
+import json
+
+import torch
+
+from envs.nne_scheduling_env import NNESchedulingEnv
+from envs.deep_sets_agent_original import DeepSetAgent
+from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+from envs.quantization import evaluate_quantization, quantize_dynamic
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+parser = argparse.ArgumentParser(description='Dynamic int8 quantization of a trained DeepSets policy')
+parser.add_argument('--alg', default='ppo_deepsets', help='The algorithm: ["ppo_deepsets", "dqn_deepsets"]')
+parser.add_argument('--num_nodes', default=4, help='num_nodes: 4, 6, 8, etc')
+parser.add_argument('--reward', default='multi', help='reward: ["naive", "risk", "cost", "latency"]')
+parser.add_argument('--load_path', required=True, help='state_dict saved by PPO_DeepSets.save / DQN_DeepSets.save')
+parser.add_argument('--episodes', default=10, help='Number of test episodes per policy')
+parser.add_argument('--engine', default=None, help='Quantized engine: ["fbgemm", "qnnpack"]')
+parser.add_argument('--output', default=None, help='If set, saves the quantized module (torch.save) to this path')
+parser.add_argument('--report', default=None, help='If set, writes the evaluation report (JSON) to this path')
+
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    # The env is only needed for the observation space
+    env = NNESchedulingEnv(num_nodes=int(args.num_nodes))
+    if args.alg == 'ppo_deepsets':
+        agent = DeepSetAgent(env)
+    elif args.alg == 'dqn_deepsets':
+        agent = DQNDeepSetAgent(env)
+    else:
+        raise ValueError('Invalid algorithm: {}'.format(args.alg))
+    agent.load_state_dict(torch.load(args.load_path, map_location='cpu'))
+
+    report = evaluate_quantization(agent, int(args.num_nodes), n_episodes=int(args.episodes), engine=args.engine,
+                                   reward_function=args.reward)
+    print(json.dumps(report, indent=2))
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.output is not None:
+        torch.save(quantize_dynamic(agent, args.engine), args.output)
@@ -1,5 +1,7 @@
 import logging
 import argparse
+import time
+from functools import partial
 
 import matplotlib
 import numpy as np
@@ -8,11 +10,17 @@ from matplotlib import pyplot as plt
 from stable_baselines3 import PPO, A2C
 from stable_baselines3.common.callbacks import CheckpointCallback
 from sb3_contrib import RecurrentPPO, MaskablePPO, TRPO, TQC
-from stable_baselines3.common.vec_env import SubprocVecEnv, VecMonitor
+from stable_baselines3.common.vec_env import VecMonitor
 
-from envs.nne_scheduling_env import NNESchedulingEnv
+from envs.nne_scheduling_env import NNESchedulingEnv, SEED
+from envs.batch_admission import BatchAdmissionEnv
 from envs.ppo_deepset import PPO_DeepSets
 from envs.dqn_deepset import DQN_DeepSets
+from envs.evaluation import evaluate_factors, DEFAULT_FACTORS
+from envs.vec_env import MaskedSubprocVecEnv, record_vec_decision_latency
+from envs.histogram import LatencyHistogram
+from envs.distributed import launch
+from envs.wrappers import PaddedSetObservation, TopKCandidateObservation, HierarchicalNodeAction, get_num_elements
 from sb3_contrib.common.maskable.utils import get_action_masks
 
 matplotlib.use('TkAgg')
@@ -38,6 +46,18 @@ parser.add_argument('--test_path',
                     help='Testing path, ex: logs/model/test.zip')
 parser.add_argument('--steps', default=200000, help='Save model after X steps')
 parser.add_argument('--total_steps', default=200000, help='The total number of steps.')
+parser.add_argument('--async_actors', default=0,
+                    help='Number of actor processes for asynchronous training of ppo_deepsets/dqn_deepsets (0 = sync)')
+parser.add_argument('--world_size', default=1,
+                    help='Number of data-parallel processes (torch.distributed, gloo) for ppo_deepsets/dqn_deepsets')
+parser.add_argument('--top_k', default=0,
+                    help='If > 0, observe only the top-k candidate endpoints (feasible, Pareto on rtt/dl/cost)')
+parser.add_argument('--mixed_num_nodes', default=None,
+                    help='Train ppo_deepsets/dqn_deepsets on padded envs of several sizes, ex: 4,8,16 (one env each)')
+parser.add_argument('--hierarchical', default=False, action="store_true",
+                    help='ppo_deepsets only: pick a node (or reject), then one of its provider/interface endpoints')
+parser.add_argument('--requests_per_step', default=1,
+                    help='If > 1, each step places a burst of this many requests (SB3 algorithms, e.g., mask_ppo)')
 
 # TODO: add other arguments if needed
 # parser.add_argument('--k8s', default=False, action="store_true", help='K8s mode')
@@ -48,7 +68,7 @@ args = parser.parse_args()
 TESTING_FACTORS = True
 
 
-def get_model(alg, env, tensorboard_log):
+def get_model(alg, env, tensorboard_log, padded_sets=False, hierarchical=False):
     model = 0
     if alg == 'ppo':
         model = PPO("MlpPolicy", env, verbose=1, tensorboard_log=tensorboard_log, n_steps=500)
@@ -59,21 +79,22 @@ def get_model(alg, env, tensorboard_log):
     elif alg == 'mask_ppo':
         model = MaskablePPO("MlpPolicy", env, gamma=0.95, verbose=1, tensorboard_log=tensorboard_log)  # , n_steps=steps
     elif alg == 'ppo_deepsets':
-        model = PPO_DeepSets(env, num_steps=100, n_minibatches=8, ent_coef=0.001, tensorboard_log=None, seed=2)
+        model = PPO_DeepSets(env, num_steps=100, n_minibatches=8, ent_coef=0.001, tensorboard_log=None, seed=2,
+                             padded_sets=padded_sets, hierarchical=hierarchical)
     elif alg == 'trpo':
         model = TRPO("MlpPolicy", env, verbose=1, tensorboard_log=None)
     elif alg == 'tqc':
         policy_kwargs = dict(n_critics=2, n_quantiles=25)
         model = TQC("MlpPolicy", env, top_quantiles_to_drop_per_net=2, verbose=1, policy_kwargs=policy_kwargs)
     elif alg == 'dqn_deepsets':
-        model = DQN_DeepSets(env, num_steps=100, n_minibatches=8, tensorboard_log=None)
+        model = DQN_DeepSets(env, num_steps=100, n_minibatches=8, tensorboard_log=None, padded_sets=padded_sets)
     else:
         logging.info('Invalid algorithm!')
 
     return model
 
 
-def get_load_model(env, alg, tensorboard_log, load_path):
+def get_load_model(env, alg, tensorboard_log, load_path, padded_sets=False, hierarchical=False):
     if alg == 'ppo':
         return PPO.load(load_path, reset_num_timesteps=False, verbose=1, tensorboard_log=tensorboard_log, n_steps=500)
     elif alg == 'recurrent_ppo':
@@ -84,11 +105,13 @@ def get_load_model(env, alg, tensorboard_log, load_path):
     elif alg == 'mask_ppo':
         return MaskablePPO.load(load_path, reset_num_timesteps=False, verbose=1, tensorboard_log=tensorboard_log)
     elif alg == 'ppo_deepsets':
-        agent = PPO_DeepSets(env, tensorboard_log=None)
-        return agent.load(f"" + load_path)
+        agent = PPO_DeepSets(env, tensorboard_log=None, padded_sets=padded_sets, hierarchical=hierarchical)
+        agent.load(f"" + load_path)
+        return agent
     elif alg == 'dqn_deepsets':
-        agent = DQN_DeepSets(env, tensorboard_log=None)
-        return agent.load(f"" + load_path)
+        agent = DQN_DeepSets(env, tensorboard_log=None, padded_sets=padded_sets)
+        agent.load(f"" + load_path)
+        return agent
     elif alg == 'trpo':
         agent = TRPO.load(load_path, reset_num_timesteps=False, verbose=1, tensorboard_log=tensorboard_log)
         return agent.load(f"" + load_path)
@@ -99,8 +122,8 @@ def get_load_model(env, alg, tensorboard_log, load_path):
         logging.info('Invalid algorithm!')
 
 
-def get_env(env_name, num_nodes, reward_function):
-    envs = 0
+def make_nne_env(num_nodes, reward_function, max_elements=None, top_k=0, hierarchical=False, requests_per_step=1,
+                 seed=SEED):
     latency_weight = 0.0
     cost_weight = 0.0
     gini_weight = 0.0
@@ -108,36 +131,61 @@ def get_env(env_name, num_nodes, reward_function):
     factor = 1
     path = "data/train/v1/nodes/"
 
+    env_kwargs = dict(num_nodes=num_nodes, arrival_rate_r=100,
+                      call_duration_r=1, episode_length=100,
+                      reward_function=reward_function,
+                      latency_weight=latency_weight,
+                      cost_weight=cost_weight,
+                      gini_weight=gini_weight,
+                      factor=factor,
+                      path_csv_files=path,
+                      bandwidth_weight=bandwidth_weight,
+                      seed=seed)
+    if requests_per_step > 1:
+        env = BatchAdmissionEnv(requests_per_step=requests_per_step, **env_kwargs)
+    else:
+        env = NNESchedulingEnv(**env_kwargs)
+    if top_k > 0:
+        env = TopKCandidateObservation(env, top_k)
+    if max_elements is not None:
+        env = PaddedSetObservation(env, max_elements)
+    if hierarchical:
+        env = HierarchicalNodeAction(env)
+    return env
+
+
+# Number of envs built by get_env_fns
+def get_num_envs(n_envs=1, mixed_num_nodes=None):
+    return n_envs if mixed_num_nodes is None else max(n_envs, len(mixed_num_nodes))
+
+
+# Env i is seeded with seed + i, so that the envs do not replay the same requests
+def get_env_fns(num_nodes, reward_function, n_envs=1, mixed_num_nodes=None, top_k=0, hierarchical=False,
+                requests_per_step=1, seed=SEED):
+    if mixed_num_nodes is None:
+        return [partial(make_nne_env, num_nodes, reward_function, top_k=top_k, hierarchical=hierarchical,
+                        requests_per_step=requests_per_step, seed=seed + i) for i in range(n_envs)]
+
+    # Envs of different sizes, padded to the largest one (top-k observations already share the same shape)
+    max_elements = None if top_k > 0 else get_num_elements(max(mixed_num_nodes))
+    return [partial(make_nne_env, mixed_num_nodes[i % len(mixed_num_nodes)], reward_function, max_elements, top_k,
+                    seed=seed + i)
+            for i in range(get_num_envs(n_envs, mixed_num_nodes))]
+
+
+def get_env(env_name, num_nodes, reward_function, mixed_num_nodes=None, top_k=0, hierarchical=False,
+            requests_per_step=1, seed=SEED):
+    envs = 0
 
     if env_name == "nne":
-        env = NNESchedulingEnv(num_nodes=num_nodes, arrival_rate_r=100, call_duration_r=1,
-                               episode_length=100,
-                               reward_function=reward_function,
-                               latency_weight=latency_weight,
-                               cost_weight=cost_weight,
-                               gini_weight=gini_weight,
-                               factor=factor,
-                               path_csv_files=path,
-                               bandwidth_weight=bandwidth_weight)
-        # For faster training!
-        # otherwise just comment the following lines
-
-        env.reset()
-        _, _, _, info = env.step(0)
-        info_keywords = tuple(info.keys())
-
-        env = SubprocVecEnv([lambda: NNESchedulingEnv(num_nodes=num_nodes, arrival_rate_r=100,
-                                                      call_duration_r=1, episode_length=100,
-                                                      reward_function=reward_function,
-                                                      latency_weight=latency_weight,
-                                                      cost_weight=cost_weight,
-                                                      gini_weight=gini_weight,
-                                                      factor=factor,
-                                                      path_csv_files=path,
-                                                      bandwidth_weight=bandwidth_weight)
-                             for i in range(1)])
-        envs = VecMonitor(env, filename="vec_nne_gym_results", info_keywords=info_keywords)
+        # The info schema is static, so there is no need to build and step a throwaway env
+        info_keywords = NNESchedulingEnv.info_keywords
 
+        # Action masks are returned together with the observations (no extra env_method round-trip)
+        env = MaskedSubprocVecEnv(get_env_fns(num_nodes, reward_function, n_envs=1, mixed_num_nodes=mixed_num_nodes,
+                                              top_k=top_k, hierarchical=hierarchical,
+                                              requests_per_step=requests_per_step, seed=seed))
+        envs = VecMonitor(env, filename="vec_nne_gym_results", info_keywords=info_keywords)
 
     else:
         logging.info('Invalid environment!')
@@ -145,9 +193,24 @@ def get_env(env_name, num_nodes, reward_function):
     return envs
 
 
+def train_distributed(rank, world_size, alg, env_name, num_nodes, reward, total_steps, tensorboard_log, name,
+                      mixed_num_nodes=None, top_k=0, hierarchical=False):
+    # Each rank owns its own envs, seeded apart from the other ranks' envs; gradients are all-reduced inside the
+    # algorithms
+    seed = SEED + rank * get_num_envs(mixed_num_nodes=mixed_num_nodes)
+    env = get_env(env_name, num_nodes, reward, mixed_num_nodes, top_k, hierarchical, seed=seed)
+    model = get_model(alg, env, tensorboard_log, padded_sets=mixed_num_nodes is not None and top_k == 0,
+                      hierarchical=hierarchical)
+    model.learn(total_timesteps=total_steps // world_size)
+    # Only rank 0 writes the checkpoint
+    model.save(name)
+    env.close()
+
+
 def test_model(model, env, n_episodes, n_steps, smoothing_window, fig_name):
     episode_rewards = []
     reward_sum = 0
+    decision_latency = LatencyHistogram()
     obs = env.reset()
 
     print("------------Testing -----------------")
@@ -156,7 +219,12 @@ def test_model(model, env, n_episodes, n_steps, smoothing_window, fig_name):
             action_masks = get_action_masks(env)
             # print(f"Step: {step}, Action Masks: {action_masks}")
 
+            start = time.perf_counter()
             action, _ = model.predict(obs, action_masks=action_masks)
+            latency = time.perf_counter() - start
+            decision_latency.record(latency)
+            # Reported per episode in the env's results csv
+            record_vec_decision_latency(env, latency)
             obs, reward, done, info = env.step(action)
             reward_sum += float(reward)
 
@@ -170,6 +238,8 @@ def test_model(model, env, n_episodes, n_steps, smoothing_window, fig_name):
                 break
 
     env.close()
+    print("Decision latency | p50: {:.3f} ms | p95: {:.3f} ms | p99: {:.3f} ms".format(
+        *[decision_latency.percentile(q) * 1e3 for q in (50, 95, 99)]))
 
     # Free memory
     del model, env
@@ -200,15 +270,34 @@ def main():
 
     steps = int(args.steps)
     total_steps = int(args.total_steps)
-
-    env = get_env(env_name, num_nodes, reward)
-    print("env: {}".format(env))
+    async_actors = int(args.async_actors)
+    world_size = int(args.world_size)
+    mixed_num_nodes = None if args.mixed_num_nodes is None else [int(n) for n in args.mixed_num_nodes.split(",")]
+    top_k = int(args.top_k)
+    # Top-k observations have the same shape for every cluster size, so they need no padding
+    padded_sets = mixed_num_nodes is not None and top_k == 0
+    hierarchical = args.hierarchical
+    if hierarchical and (alg != 'ppo_deepsets' or mixed_num_nodes is not None or top_k > 0):
+        raise ValueError('--hierarchical is only supported by ppo_deepsets, without --mixed_num_nodes and --top_k')
+    requests_per_step = int(args.requests_per_step)
+    if requests_per_step > 1 and (alg in ('ppo_deepsets', 'dqn_deepsets') or mixed_num_nodes is not None
+                                  or top_k > 0 or hierarchical):
+        raise ValueError('--requests_per_step is only supported by the SB3 algorithms on the plain env')
 
     tensorboard_log = "results/" + env_name + "/" + reward + "/"
 
     name = alg + "_env_" + env_name + "_num_nodes_" + str(num_nodes) \
            + "_reward_" + reward + "_totalSteps_" + str(total_steps)
 
+    distributed = training and not loading and alg in ('ppo_deepsets', 'dqn_deepsets') and world_size > 1
+    if distributed:
+        # Each rank builds its own envs and model (see train_distributed): nothing is built here until they are done
+        launch(train_distributed, world_size, alg, env_name, num_nodes, reward, total_steps,
+               tensorboard_log, name, mixed_num_nodes, top_k, hierarchical)
+
+    env = get_env(env_name, num_nodes, reward, mixed_num_nodes, top_k, hierarchical, requests_per_step)
+    print("env: {}".format(env))
+
     # callback: does not work with multiple envs
     checkpoint_callback = CheckpointCallback(save_freq=steps, save_path="logs/" + name, name_prefix=name)
 
@@ -220,9 +309,18 @@ def main():
             model.learn(total_timesteps=total_steps, tb_log_name=name + "_run", callback=checkpoint_callback)
         else:
             if alg == "ppo_deepsets" or alg == 'dqn_deepsets':
-                model = get_model(alg, env, tensorboard_log)
+                model = get_model(alg, env, tensorboard_log, padded_sets=padded_sets, hierarchical=hierarchical)
                 print("model: {}".format(model))
-                model.learn(total_timesteps=total_steps)
+                if distributed:
+                    # Pick up the weights saved by rank 0
+                    model.load(name)
+                elif async_actors > 0:
+                    model.learn_async(total_timesteps=total_steps,
+                                      env_fns=get_env_fns(num_nodes, reward, n_envs=async_actors,
+                                                          mixed_num_nodes=mixed_num_nodes, top_k=top_k,
+                                                          hierarchical=hierarchical))
+                else:
+                    model.learn(total_timesteps=total_steps)
             else:
                 model = get_model(alg, env, tensorboard_log)
                 model.learn(total_timesteps=total_steps, tb_log_name=name + "_run", callback=checkpoint_callback)
@@ -232,35 +330,16 @@ def main():
     # Testing selected
     if testing:
         if TESTING_FACTORS:
+            # Load the model once and evaluate all factors concurrently
             path = "data/train/v1/nodes/"
-            factors = [1, 2, 4, 6, 8, 10, 12]
-            i = 0
-            for f in factors:
-                env = NNESchedulingEnv(num_nodes=num_nodes,
-                                       arrival_rate_r=100, call_duration_r=1,
-                                       episode_length=100,
-                                       reward_function='multi',
-                                       factor=f,
-                                       path_csv_files=path,
-                                       file_results_name=str(i) + '_nne_gym_num_nodes_' + str(
-                                           num_nodes) + '_factor_' + str(f))
-                env.reset()
-                _, _, _, info = env.step(0)
-                info_keywords = tuple(info.keys())
-                env = NNESchedulingEnv(num_nodes=num_nodes,
-                                       arrival_rate_r=100, call_duration_r=1,
-                                       episode_length=100,
-                                       reward_function='multi',
-                                       factor=f,
-                                       path_csv_files=path,
-                                       file_results_name=str(i) + '_nne_gym_num_nodes_' + str(
-                                           num_nodes) + '_factor_' + str(f))
-
-                model = get_load_model(env, alg, tensorboard_log, test_path)
-                test_model(model, env, n_episodes=100, n_steps=100, smoothing_window=5, fig_name=name + "_test_reward.png")
-                i += 1
+            model = get_load_model(env, alg, tensorboard_log, test_path, padded_sets=padded_sets,
+                                   hierarchical=hierarchical)
+            evaluate_factors(model, num_nodes, factors=DEFAULT_FACTORS, n_episodes=100, episode_length=100,
+                             path_csv_files=path, top_k=top_k, hierarchical=hierarchical,
+                             requests_per_step=requests_per_step)
         else:
-            model = get_load_model(env, alg, tensorboard_log, test_path)
+            model = get_load_model(env, alg, tensorboard_log, test_path, padded_sets=padded_sets,
+                                   hierarchical=hierarchical)
             test_model(model, env, n_episodes=100, n_steps=100, smoothing_window=5, fig_name=name + "_test_reward.png")
 
 
@@ -1,4 +1,5 @@
 import logging
+import time
 
 import numpy as np
 from stable_baselines3.common.monitor import Monitor
@@ -39,16 +40,6 @@ if __name__ == "__main__":
         print("Initiating run for {} with: nodes: {} | ".format(policy, n))
         if TEST_FACTORS:
             for f in factors:
-                env = NNESchedulingEnv(num_nodes=n,
-                                        arrival_rate_r=100, call_duration_r=1,
-                                        episode_length=100,
-                                        reward_function='multi',
-                                        factor=f,
-                                        path_csv_files=path,
-                                        file_results_name=str(i) + "_" + policy + '_baselines_num_nodes_' + str(n) + '_factor_' + str(f))
-                env.reset()
-                _, _, _, info = env.step(0)
-                info_keywords = tuple(info.keys())
                 env = NNESchedulingEnv(num_nodes=n,
                                        arrival_rate_r=100, call_duration_r=1,
                                        episode_length=100,
@@ -57,7 +48,7 @@ if __name__ == "__main__":
                                        path_csv_files=path,
                                        file_results_name=str(i) + "_" + policy + '_baselines_num_nodes_' + str(n) + '_factor_' + str(f))
 
-                # env = Monitor(env, filename=MONITOR_PATH, info_keywords=info_keywords)
+                # env = Monitor(env, filename=MONITOR_PATH, info_keywords=env.info_keywords)
                 returns = []
                 for _ in tqdm(range(n_episodes)):
                     obs = env.reset()
@@ -65,6 +56,7 @@ if __name__ == "__main__":
                     return_ = 0.0
                     done = False
                     while not done:
+                        start = time.perf_counter()
                         if policy == LATENCY_GREEDY:
                             action = latency_greedy_policy(env, action_mask)
                         elif policy == COST_GREEDY:
@@ -73,6 +65,7 @@ if __name__ == "__main__":
                             action = bandwidth_greedy_policy(env, action_mask)
                         else:
                             print("unrecognized policy!")
+                        env.record_decision_latency(time.perf_counter() - start)
 
                         obs, reward, done, info = env.step(action)
                         action_mask = env.action_masks()
@@ -82,15 +75,6 @@ if __name__ == "__main__":
                 i += 1
 
         else:
-            env = NNESchedulingEnv(num_nodes=n,
-                                   arrival_rate_r=100, call_duration_r=1,
-                                   episode_length=100,
-                                   reward_function='multi',
-                                   path_csv_files=path,
-                                   file_results_name=str(i) + "_" + policy + '_baselines_num_nodes_' + str(n))
-            env.reset()
-            _, _, _, info = env.step(0)
-            info_keywords = tuple(info.keys())
             env = NNESchedulingEnv(num_nodes=n,
                                    arrival_rate_r=100, call_duration_r=1,
                                    episode_length=100,
@@ -98,7 +82,7 @@ if __name__ == "__main__":
                                    path_csv_files=path,
                                    file_results_name=str(i) + "_" + policy + '_baselines_num_nodes_' + str(n))
 
-            # env = Monitor(env, filename=MONITOR_PATH, info_keywords=info_keywords)
+            # env = Monitor(env, filename=MONITOR_PATH, info_keywords=env.info_keywords)
             returns = []
             for _ in tqdm(range(n_episodes)):
                 obs = env.reset()
@@ -106,6 +90,7 @@ if __name__ == "__main__":
                 return_ = 0.0
                 done = False
                 while not done:
+                    start = time.perf_counter()
                     if policy == LATENCY_GREEDY:
                         action = latency_greedy_policy(env, action_mask)
                     elif policy == COST_GREEDY:
@@ -114,6 +99,7 @@ if __name__ == "__main__":
                         action = bandwidth_greedy_policy(env, action_mask)
                     else:
                         print("unrecognized policy!")
+                    env.record_decision_latency(time.perf_counter() - start)
 
                     obs, reward, done, info = env.step(action)
                     action_mask = env.action_masks()
@@ -0,0 +1,89 @@
+import logging
+import argparse
+import json
+
+import numpy as np
+import torch
+from sb3_contrib import MaskablePPO
+
+from envs.nne_scheduling_env import NNESchedulingEnv
+from envs.deep_sets_agent_original import DeepSetAgent
+from envs.deep_sets_agent_dqn import DQNDeepSetAgent
+from envs.inference import make_inference_policy
+from envs.numpy_policy import NumpyPolicy
+from envs.wrappers import get_env_spaces
+from envs.service import PlacementService, load_test, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_MAX_BATCH_SIZE, \
+    DEFAULT_MAX_DELAY_MS
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+parser = argparse.ArgumentParser(description='Run the placement-decision service')
+parser.add_argument('--alg', default='mask_ppo',
+                    help='The algorithm: ["mask_ppo", "ppo_deepsets", "dqn_deepsets", "numpy"]')
+parser.add_argument('--num_nodes', default=4, help='num_nodes: 4, 6, 8, etc')
+parser.add_argument('--load_path', required=True,
+                    help='MaskablePPO zip, DeepSets state_dict or exported NumPy policy (.npz)')
+parser.add_argument('--host', default=DEFAULT_HOST, help='Host to listen on')
+parser.add_argument('--port', default=DEFAULT_PORT, help='Port to listen on')
+parser.add_argument('--max_batch_size', default=DEFAULT_MAX_BATCH_SIZE, help='Max decisions per forward pass')
+parser.add_argument('--max_delay_ms', default=DEFAULT_MAX_DELAY_MS, help='Max time a request waits for a batch')
+parser.add_argument('--load_test', default=0,
+                    help='If > 0, sends this many requests to the service, prints the stats and exits')
+parser.add_argument('--concurrency', default=16, help='Number of client threads for the load test')
+
+args = parser.parse_args()
+
+
+def get_predict_fn(alg, env, load_path):
+    if alg == 'mask_ppo':
+        model = MaskablePPO.load(load_path, device='cpu')
+        return lambda obs, masks: model.predict(obs, action_masks=masks, deterministic=True)[0]
+    elif alg == 'numpy':
+        return NumpyPolicy.load(load_path).predict
+    elif alg == 'ppo_deepsets':
+        agent = DeepSetAgent(env)
+    elif alg == 'dqn_deepsets':
+        agent = DQNDeepSetAgent(env)
+    else:
+        raise ValueError('Invalid algorithm: {}'.format(alg))
+    agent.load_state_dict(torch.load(load_path, map_location='cpu'))
+    policy = make_inference_policy(agent)
+
+    def predict(obs, masks):
+        with torch.inference_mode():
+            return policy(torch.from_numpy(obs), torch.from_numpy(masks)).numpy()
+
+    return predict
+
+
+def get_test_inputs(env, n=100):
+    """Observations and masks visited by a random valid policy."""
+    obs, masks = [], []
+    o = env.reset()
+    for _ in range(n):
+        m = env.action_masks()
+        obs.append(o)
+        masks.append(m)
+        o, _, done, _ = env.step(np.random.choice(np.flatnonzero(m)))
+        if done:
+            o = env.reset()
+    return np.array(obs, dtype=np.float32), np.array(masks)
+
+
+if __name__ == "__main__":
+    # Only the spaces of the env are needed to serve: an env is only built to generate the load test inputs
+    spaces = get_env_spaces(int(args.num_nodes))
+    service = PlacementService(get_predict_fn(args.alg, spaces, args.load_path), host=args.host, port=int(args.port),
+                               max_batch_size=int(args.max_batch_size), max_delay_ms=float(args.max_delay_ms),
+                               obs_shape=spaces.observation_space.shape, num_actions=spaces.action_space.n)
+
+    if int(args.load_test) > 0:
+        service.start()
+        obs, masks = get_test_inputs(NNESchedulingEnv(num_nodes=int(args.num_nodes)))
+        results = load_test(service.address, obs, masks, n_requests=int(args.load_test),
+                            concurrency=int(args.concurrency))
+        print(json.dumps(results, indent=2))
+        service.close()
+    else:
+        service.serve_forever()
@@ -1,4 +1,5 @@
 import logging
+import time
 
 import numpy as np
 from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor, VecNormalize
@@ -6,6 +7,7 @@ from tqdm import tqdm
 from envs.dqn_deepset import DQN_DeepSets
 from envs.ppo_deepset import PPO_DeepSets
 from envs.nne_scheduling_env import NNESchedulingEnv
+from envs.vec_env import record_vec_decision_latency
 from sb3_contrib import MaskablePPO
 
 SEED = 2
@@ -34,18 +36,6 @@ if __name__ == "__main__":
     episode_length = 100
     call_duration_r = 1
 
-    env = NNESchedulingEnv(num_nodes=num_nodes, arrival_rate_r=100, call_duration_r=1,
-                           episode_length=100,
-                           reward_function=reward_function,
-                           latency_weight=latency_weight,
-                           cost_weight=cost_weight,
-                           gini_weight=gini_weight,
-                           path_csv_files=path,
-                           bandwidth_weight=bandwidth_weight)
-    env.reset()
-    _, _, _, info = env.step(0)
-    info_keywords = tuple(info.keys())
-
     envs = DummyVecEnv([lambda: NNESchedulingEnv(num_nodes=num_nodes, arrival_rate_r=100, call_duration_r=1,
                                                  episode_length=100,
                                                  reward_function=reward_function,
@@ -55,7 +45,7 @@ if __name__ == "__main__":
                                                  path_csv_files=path,
                                                  bandwidth_weight=bandwidth_weight)])
     
-    envs = VecMonitor(envs, MONITOR_PATH, info_keywords=info_keywords)
+    envs = VecMonitor(envs, MONITOR_PATH, info_keywords=NNESchedulingEnv.info_keywords)
 
     # Algos supported
     agent = None
@@ -79,7 +69,9 @@ if __name__ == "__main__":
         action_mask = np.array(envs.env_method("action_masks"))
         done = False
         while not done:
+            start = time.perf_counter()
             action = agent.predict(obs, action_mask)
+            record_vec_decision_latency(envs, time.perf_counter() - start)
             obs, reward, dones, info = envs.step(action)
             action_mask = np.array(envs.env_method("action_masks"))
             done = dones[0]